@@ -0,0 +1,203 @@
+import numpy as np
+from typing import Dict, List
+from .taxi_wrapper import get_env_graph, PASSENGERS_STATUS
+
+# Cost of the pairs that can't be assigned (unreachable, not enough fuel...)
+INFEASIBLE = 1e9
+
+_scipy_linear_sum_assignment = None
+
+
+def hungarian(cost: np.array) -> (np.array, np.array):
+    """
+    Solves the (rectangular) minimum cost assignment problem with the Hungarian algorithm (shortest augmenting paths
+    with potentials), the inner loop being vectorized over the columns.
+    Returns the assigned row indexes and their column indexes, as scipy.optimize.linear_sum_assignment does.
+    """
+    cost = np.asarray(cost, dtype=float)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    num_rows, num_cols = cost.shape
+
+    # 1-based rows/columns, column 0 is the virtual column of the row being added
+    u, v = np.zeros(num_rows + 1), np.zeros(num_cols + 1)
+    row_of_col = np.zeros(num_cols + 1, dtype=int)
+    way = np.zeros(num_cols + 1, dtype=int)
+    for row in range(1, num_rows + 1):
+        row_of_col[0] = row
+        col = 0
+        min_reduced = np.full(num_cols + 1, np.inf)
+        used = np.zeros(num_cols + 1, dtype=bool)
+        while True:
+            used[col] = True
+            current_row = row_of_col[col]
+            free = ~used[1:]
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            improved = free & (reduced < min_reduced[1:])
+            min_reduced[1:][improved] = reduced[improved]
+            way[1:][improved] = col
+            candidates = np.where(free, min_reduced[1:], np.inf)
+            next_col = int(np.argmin(candidates)) + 1
+            delta = candidates[next_col - 1]
+            u[row_of_col[used]] += delta
+            v[used] -= delta
+            min_reduced[1:][free] -= delta
+            col = next_col
+            if row_of_col[col] == 0:
+                break
+        while col:
+            previous_col = way[col]
+            row_of_col[col] = row_of_col[previous_col]
+            col = previous_col
+
+    cols = np.flatnonzero(row_of_col[1:])
+    rows = row_of_col[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def solve_assignment(cost: np.array) -> (np.array, np.array):
+    """
+    Solves the minimum cost assignment problem, with scipy's solver when scipy is installed and with the built-in
+    Hungarian algorithm otherwise.
+    """
+    global _scipy_linear_sum_assignment
+    if _scipy_linear_sum_assignment is None:
+        try:
+            from scipy.optimize import linear_sum_assignment
+            _scipy_linear_sum_assignment = linear_sum_assignment
+        except ImportError:
+            _scipy_linear_sum_assignment = hungarian
+    return _scipy_linear_sum_assignment(cost)
+
+
+class Dispatcher:
+    """
+    Assigns waiting passengers to taxis by solving a minimum cost assignment over the map distances.
+
+    The cost of a (taxi, passenger) pair is the number of steps the taxi needs to reach the passenger. A pair is
+    feasible only if the taxi has room for the passenger and enough fuel to drive to the passenger and then to the
+    passenger's destination, either directly or through a fuel station of the taxi's fuel type (with a full tank from
+    there on). Taxis with more than one free seat take part in the assignment once per free seat.
+
+    Dispatching is incremental: passengers keep their taxi until they are picked up (or delivered), and each dispatch
+    only assigns the waiting passengers that don't have a taxi yet to the free seats that are left.
+    """
+    def __init__(self, taxi_env, refuel_cost: int = 1):
+        """
+        Args:
+            taxi_env: the TaxiEnv to dispatch in
+            refuel_cost: number of steps it takes to refuel, added to the paths through fuel stations
+        """
+        self.taxi_env = taxi_env
+        self.env_graph = get_env_graph(taxi_env.desc.astype(str))
+        self.refuel_cost = refuel_cost
+        self.assignments = {}  # passenger -> taxi, for passengers that weren't picked up yet
+
+        self.fuel_stations_nodes = {fuel_type: [self.env_graph.cors_to_node(*location) for location in
+                                                np.argwhere(stations_map).tolist()]
+                                    for fuel_type, stations_map in taxi_env.fuel_stations_maps.items()}
+
+    def nodes(self, locations: list) -> np.array:
+        """
+        Converts a list of [row, column] locations to graph nodes.
+        """
+        locations = np.asarray(locations, dtype=int).reshape(-1, 2)
+        return locations[:, 0] * self.env_graph.cols + locations[:, 1]
+
+    def cost_matrix(self, taxis: List[int], passengers: List[int]) -> np.array:
+        """
+        Builds the cost matrix of the given taxis (rows) and passengers (columns), INFEASIBLE for pairs that can't be
+        assigned because of unreachable locations or fuel.
+        """
+        taxis_locations, fuels, starts, destinations, _ = self.taxi_env.state
+        taxis_nodes = self.nodes([taxis_locations[taxi] for taxi in taxis])
+        starts_nodes = self.nodes([starts[passenger] for passenger in passengers])
+        destinations_nodes = self.nodes([destinations[passenger] for passenger in passengers])
+        taxis_fuels = np.asarray([fuels[taxi] for taxi in taxis], dtype=float)
+        taxis_max_fuel = np.asarray([self.taxi_env.max_fuel[taxi] for taxi in taxis], dtype=float)
+
+        to_start = self.env_graph.distance_matrix(taxis_nodes, starts_nodes).astype(float)
+        trip = np.asarray([self.env_graph.paths_to(destination)[0][start]
+                           for start, destination in zip(starts_nodes, destinations_nodes)], dtype=float)
+        to_start[to_start < 0] = np.inf
+        trip[trip < 0] = np.inf
+
+        # Driving directly to the passenger and to the destination
+        cost = np.where(to_start + trip[None, :] <= taxis_fuels[:, None], to_start, np.inf)
+
+        # Driving to a fuel station first, for taxis that can't make it directly
+        fuel_types = np.asarray([self.taxi_env.fuel_type_list[taxi] for taxi in taxis])
+        for fuel_type, stations_nodes in self.fuel_stations_nodes.items():
+            rows = np.flatnonzero(fuel_types == fuel_type)
+            if not stations_nodes or not rows.size:
+                continue
+            to_station = self.env_graph.distance_matrix(taxis_nodes[rows], stations_nodes).astype(float)
+            station_to_start = self.env_graph.distance_matrix(stations_nodes, starts_nodes).astype(float)
+            to_station[to_station < 0] = np.inf
+            station_to_start[station_to_start < 0] = np.inf
+            feasible = ((to_station <= taxis_fuels[rows, None])[:, :, None] &
+                        (station_to_start[None, :, :] + trip[None, None, :] <= taxis_max_fuel[rows, None, None]))
+            via_station = np.where(feasible, to_station[:, :, None] + self.refuel_cost + station_to_start[None], np.inf)
+            cost[rows] = np.minimum(cost[rows], via_station.min(axis=1))
+
+        cost[~np.isfinite(cost)] = INFEASIBLE
+        return cost
+
+    def free_seats(self) -> Dict[int, int]:
+        """
+        Returns taxi -> number of seats that are neither taken nor promised to an assigned passenger, for the taxis
+        that can still drive (not collided).
+        """
+        passengers_status = self.taxi_env.state[PASSENGERS_STATUS]
+        seats = {taxi: self.taxi_env.taxis_capacity[taxi] for taxi in range(self.taxi_env.num_taxis)
+                 if not self.taxi_env.collided[taxi]}
+        for status in passengers_status:
+            if status > 0 and status - 1 in seats:
+                seats[status - 1] -= 1
+        for taxi in self.assignments.values():
+            if taxi in seats:
+                seats[taxi] -= 1
+        return {taxi: count for taxi, count in seats.items() if count > 0}
+
+    def dispatch(self, reassign: bool = False) -> Dict[int, int]:
+        """
+        Assigns the waiting passengers without a taxi to the free seats.
+        Passengers that were picked up or delivered since the last dispatch release their assignment first.
+        Args:
+            reassign: drop all the pending assignments and solve them again with the current locations
+
+        Returns: passenger -> taxi for all the passengers that are assigned and waiting to be picked up
+
+        """
+        passengers_status = self.taxi_env.state[PASSENGERS_STATUS]
+        self.assignments = {passenger: taxi for passenger, taxi in self.assignments.items()
+                            if passengers_status[passenger] == 0 and not self.taxi_env.collided[taxi] and
+                            not reassign}
+
+        passengers = [passenger for passenger, status in enumerate(passengers_status)
+                      if status == 0 and passenger not in self.assignments]
+        seats = self.free_seats()
+        if not passengers or not seats:
+            return dict(self.assignments)
+
+        taxis = sorted(seats)
+        cost = self.cost_matrix(taxis, passengers)
+        # Every free seat of a taxi is a row of the assignment problem
+        rows = np.repeat(np.arange(len(taxis)), [seats[taxi] for taxi in taxis])
+        for row, col in zip(*solve_assignment(cost[rows])):
+            if cost[rows[row], col] < INFEASIBLE:
+                self.assignments[passengers[col]] = taxis[rows[row]]
+        return dict(self.assignments)
+
+    def taxis_passengers(self) -> Dict[int, List[int]]:
+        """
+        Returns taxi -> list of the passengers assigned to it (waiting to be picked up).
+        """
+        taxis_passengers = {}
+        for passenger, taxi in sorted(self.assignments.items()):
+            taxis_passengers.setdefault(taxi, []).append(passenger)
+        return taxis_passengers
@@ -0,0 +1,178 @@
+import heapq
+from typing import Dict, List
+from .taxi_wrapper import get_env_graph, TAXIS_LOCATIONS
+
+STANDBY = 8
+
+
+class FleetPlanner:
+    """
+    Plans the paths of all the taxis together with a space-time reservation table (windowed cooperative A*).
+
+    Taxis are planned one after the other (by priority), each one with an A* search over (node, time) states that avoids
+    the cells reserved by the taxis planned before it, over a window of 'window' steps. Beyond the window the true
+    shortest path distance is used as the heuristic, and the plans are recomputed every few steps (windowed replanning).
+
+    The reservation rules follow the serialized execution of TaxiEnv.step, where taxi i moves before taxi i + 1 and a
+    move into a cell that is occupied at that moment is blocked (or is a collision):
+        - two taxis can't be at the same cell at the same time.
+        - a taxi can't enter a cell at time t if a taxi with a higher index is still there at time t - 1.
+        - a taxi can't be at a cell at time t if a taxi with a lower index enters it at time t + 1.
+    Plans that follow these rules never turn moves into 'standby' steps or collisions.
+    """
+    def __init__(self, taxi_env, window: int = 16, wait_action: int = STANDBY):
+        """
+        Args:
+            taxi_env: the TaxiEnv the taxis drive in
+            window: number of steps planned ahead
+            wait_action: the action a taxi takes to stay in place (the environment should allow standby)
+        """
+        self.taxi_env = taxi_env
+        self.env_graph = get_env_graph(taxi_env.desc.astype(str))
+        self.window = window
+        self.wait_action = wait_action
+
+        self.reservations = {}  # (node, time) -> taxi
+        self.plans = {}  # taxi -> list of actions
+        self.paths = {}  # taxi -> list of nodes, the planned node of the taxi at each time of the window
+        self.goals = {}
+        self.steps_since_plan = 0
+
+    def is_free(self, taxi: int, node: int, time: int) -> bool:
+        """
+        Checks whether the taxi can be at the given node at the given time without conflicting with the reservations.
+        """
+        owner = self.reservations.get((node, time))
+        if owner is not None and owner != taxi:
+            return False
+        owner = self.reservations.get((node, time - 1))
+        if owner is not None and owner > taxi:
+            return False
+        owner = self.reservations.get((node, time + 1))
+        if owner is not None and owner < taxi:
+            return False
+        return True
+
+    def can_stay(self, taxi: int, node: int, time: int) -> bool:
+        """
+        Checks whether the taxi can stay at the given node from the given time until the end of the window.
+        """
+        return all(self.is_free(taxi, node, t) for t in range(time + 1, self.window + 1))
+
+    def reserve(self, taxi: int, path: list):
+        """
+        Reserves the nodes of a path (node at each time from 0) and its last node until the end of the window.
+        """
+        for time in range(self.window + 1):
+            self.reservations[(path[min(time, len(path) - 1)], time)] = taxi
+
+    def plan_taxi(self, taxi: int, node_origin: int, node_target: int) -> (list, list):
+        """
+        Space-time A* search of the taxi's path from the origin node to the target node over the window.
+        Returns the nodes of the path at each time and the actions to take, or (None, None) if there is no
+        conflict-free path.
+        """
+        distances = self.env_graph.paths_to(node_target)[0]
+        if distances[node_origin] < 0:
+            return None, None
+
+        start = (node_origin, 0)
+        parents = {start: (None, None)}
+        queue = [(int(distances[node_origin]), 0, 0, node_origin)]
+        while queue:
+            _, negative_cost, time, node = heapq.heappop(queue)
+            cost = -negative_cost
+            if (node == node_target and self.can_stay(taxi, node, time)) or time == self.window:
+                path, actions, state = [], [], (node, time)
+                while state is not None:
+                    path.append(state[0])
+                    state, action = parents[state]
+                    if action is not None:
+                        actions.append(action)
+                return path[::-1], actions[::-1]
+
+            moves = [(action, int(next_node)) for action, next_node in enumerate(self.env_graph.neighbors[node])
+                     if next_node >= 0]
+            for action, next_node in moves + [(self.wait_action, node)]:
+                state = (next_node, time + 1)
+                if state in parents or distances[next_node] < 0 or not self.is_free(taxi, next_node, time + 1):
+                    continue
+                parents[state] = ((node, time), action)
+                # Ties are broken in favor of the deeper states
+                heapq.heappush(queue, (cost + 1 + int(distances[next_node]), -(cost + 1), time + 1, next_node))
+        return None, None
+
+    def plan(self, goals: Dict[int, list], priorities: List[int] = None) -> Dict[int, list]:
+        """
+        Plans conflict-free paths for all the taxis with a goal, from their current location in the environment.
+        Taxis without a goal (and collided taxis) stay in place and are avoided by the others.
+        Args:
+            goals: taxi index -> destination [row, column]
+            priorities: order in which the taxis are planned, by default the taxis farthest from their goal first
+
+        Returns: taxi index -> list of actions for the next (at most) 'window' steps
+
+        """
+        positions = self.taxi_env.state[TAXIS_LOCATIONS]
+        nodes = [self.env_graph.cors_to_node(*position) for position in positions]
+        moving = {taxi: self.env_graph.cors_to_node(*goal) for taxi, goal in goals.items()
+                  if goal is not None and not self.taxi_env.collided[taxi]}
+
+        if priorities is None:
+            priorities = sorted(moving, key=lambda taxi: -self.env_graph.paths_to(moving[taxi])[0][nodes[taxi]])
+        priorities = [taxi for taxi in priorities if taxi in moving]
+
+        # A taxi without a conflict-free path waits in place, so it becomes an obstacle and the others are replanned
+        static = set(range(len(nodes))) - set(priorities)
+        while True:
+            self.reservations = {}
+            self.plans, self.paths = {}, {}
+            for taxi, node in enumerate(nodes):
+                if taxi in static:
+                    self.reserve(taxi, [node])
+                else:  # The rest of the window is reserved once the taxi is planned
+                    self.reservations[(node, 0)] = taxi
+
+            for taxi in priorities:
+                if taxi in static:
+                    continue
+                path, actions = self.plan_taxi(taxi, nodes[taxi], moving[taxi])
+                if path is None:
+                    static.add(taxi)
+                    break
+                # Trailing waits at the end of the path aren't needed
+                while actions and actions[-1] == self.wait_action and path[-1] == path[-2]:
+                    actions.pop()
+                    path.pop()
+                self.reserve(taxi, path)
+                self.plans[taxi], self.paths[taxi] = actions, path
+            else:
+                break
+
+        self.goals = {taxi: list(goal) for taxi, goal in goals.items() if goal is not None}
+        self.steps_since_plan = 0
+        return {taxi: list(actions) for taxi, actions in self.plans.items()}
+
+    def next_actions(self, goals: Dict[int, list], replan_interval: int = None) -> list:
+        """
+        Returns the joint action of all the taxis for the next environment step, replanning when the goals change,
+        when a taxi isn't where its plan expected it to be, or every 'replan_interval' steps (half a window by default).
+        Taxis without a goal or with a finished plan take the wait action.
+        """
+        replan_interval = replan_interval or max(1, self.window // 2)
+        positions = self.taxi_env.state[TAXIS_LOCATIONS]
+        time = self.steps_since_plan
+        goals = {taxi: list(goal) for taxi, goal in goals.items() if goal is not None}
+
+        deviated = any(self.env_graph.cors_to_node(*positions[taxi]) != path[min(time, len(path) - 1)]
+                       for taxi, path in self.paths.items())
+        if goals != self.goals or deviated or time >= replan_interval:
+            self.plan(goals)
+            time = 0
+
+        actions = [self.wait_action] * len(positions)
+        for taxi, plan in self.plans.items():
+            if time < len(plan):
+                actions[taxi] = plan[time]
+        self.steps_since_plan += 1
+        return actions
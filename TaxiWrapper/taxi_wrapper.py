@@ -1,30 +1,102 @@
-import networkx as nx
+import hashlib
+from collections import OrderedDict
+import numpy as np
 from typing import Tuple, List
 
 TAXIS_LOCATIONS, FUELS, PASSENGERS_START_LOCATION, PASSENGERS_DESTINATIONS, PASSENGERS_STATUS = 0, 1, 2, 3, 4
 
+# Movement actions, the columns of EnvGraph.neighbors are ordered by these action codes
+SOUTH, NORTH, EAST, WEST = 0, 1, 2, 3
+
+# Bounds of the shared graphs cache (number of maps) and of each graph's shortest paths cache (bytes)
+MAX_CACHED_GRAPHS = 16
+MAX_PATHS_CACHE_BYTES = 64 * 2 ** 20
+
+_graphs_cache = OrderedDict()
+
+
+def map_hash(desc) -> str:
+    """
+    Hashes a map description (list of strings or an array of characters) to identify the map in the graphs cache.
+    """
+    return hashlib.sha1('\n'.join(''.join(row) for row in desc).encode()).hexdigest()
+
+
+def get_env_graph(desc) -> 'EnvGraph':
+    """
+    Returns the EnvGraph of the given map, shared by all the callers using the same map.
+    The graphs are kept in a LRU cache of at most MAX_CACHED_GRAPHS maps.
+    """
+    key = map_hash(desc)
+    if key in _graphs_cache:
+        _graphs_cache.move_to_end(key)
+    else:
+        _graphs_cache[key] = EnvGraph(desc)
+        while len(_graphs_cache) > MAX_CACHED_GRAPHS:
+            _graphs_cache.popitem(last=False)
+    return _graphs_cache[key]
+
 
 class EnvGraph:
     """
-    This class converts the map of the taxi-world into a Networkx graph.
+    This class converts the map of the taxi-world into a graph, stored as an array of the neighbors of each node by
+    movement action (see adjacency for its CSR form, and graph for a networkx graph).
     Each square in the map is represented by a node in the graph. The nodes are indexed by rows, i.e. for a 4-row by
     5-column grid, node in location [0, 2] (row-0, column-2) has index 2 and node in location [1,1] has index 6.
+
+    Shortest paths are answered from BFS trees rooted at the targets: for every queried target the graph keeps the
+    distance of all the nodes to it and the next action to take from each node. These rows are kept in a LRU cache
+    bounded by max_cache_bytes, so on small maps all the rows (the full distance matrix and next-hop table) end up
+    cached, and on large maps only the recently used targets are.
     """
-    def __init__(self, desc: list):
+    def __init__(self, desc: list, max_cache_bytes: int = MAX_PATHS_CACHE_BYTES):
         """
         Args:
-            desc: Map description (list of strings)
+            desc: Map description (list of strings, or array of characters)
+            max_cache_bytes: memory bound of the cached BFS rows
         """
         self.rows = len(desc) - 2
         self.cols = len(desc[0]) // 2
-        self.graph = nx.empty_graph(self.rows * self.cols)
-        for i in self.graph.nodes:
-            row, col = self.node_to_cors(i)
-            if desc[row + 2][col * 2 + 1] != '-':  # Check south
-                self.graph.add_edge(i, self.cors_to_node(row + 1, col))
-                # In case we ever use horizontal barriers
-            if desc[row + 1][col * 2 + 2] == ':':  # Check east
-                self.graph.add_edge(i, self.cors_to_node(row, col + 1))
+        self.num_nodes = self.rows * self.cols
+        self._graph = None
+
+        # neighbors[node, action] is the node reached by a movement action, or -1 if the move is blocked
+        # The nodes that can move south (no '-' barrier below them) and east (a ':' between them and the next column)
+        chars = desc if isinstance(desc, np.ndarray) else np.array([list(line) for line in desc])
+        south = np.flatnonzero(chars[2:self.rows + 2, 1:2 * self.cols:2] != '-')
+        east = np.flatnonzero(chars[1:self.rows + 1, 2:2 * self.cols + 1:2] == ':')
+        self.neighbors = np.full((self.num_nodes, 4), -1, dtype=np.int64)
+        self.neighbors[south, SOUTH] = south + self.cols
+        self.neighbors[south + self.cols, NORTH] = south
+        self.neighbors[east, EAST] = east + 1
+        self.neighbors[east + 1, WEST] = east
+
+        # target -> (distances to target, next action towards target) of all nodes
+        self.paths_cache = OrderedDict()
+        row_bytes = self.num_nodes * (np.dtype(np.int32).itemsize + np.dtype(np.int8).itemsize)
+        self.max_cached_targets = max(1, max_cache_bytes // row_bytes)
+
+    def adjacency(self) -> Tuple[np.array, np.array]:
+        """
+        Returns the adjacency of the graph in CSR form: the neighbors of node i are indices[indptr[i]:indptr[i + 1]].
+        """
+        valid = self.neighbors >= 0
+        indptr = np.concatenate([[0], np.cumsum(valid.sum(axis=1))])
+        return indptr, self.neighbors[valid]
+
+    @property
+    def graph(self):
+        """
+        The map as a networkx graph, built on first access. networkx is only imported here - the paths queries don't
+        need it.
+        """
+        if self._graph is None:
+            import networkx as nx
+            self._graph = nx.empty_graph(self.num_nodes)
+            indptr, indices = self.adjacency()
+            self._graph.add_edges_from(zip(np.repeat(np.arange(self.num_nodes), np.diff(indptr)).tolist(),
+                                           indices.tolist()))
+        return self._graph
 
     def node_to_cors(self, node) -> List:
         """
@@ -38,6 +110,66 @@ class EnvGraph:
         """
         return row * self.cols + col
 
+    def bfs(self, node_target: int) -> Tuple[np.array, np.array]:
+        """
+        Runs a BFS from the target node over the whole graph.
+        Returns the distance of every node to the target (-1 if unreachable) and the action every node should take to
+        get one step closer to the target (-1 at the target and at unreachable nodes).
+        """
+        distances = np.full(self.num_nodes, -1, dtype=np.int32)
+        distances[node_target] = 0
+        frontier = np.array([node_target])
+        distance = 0
+        while frontier.size:
+            distance += 1
+            frontier = self.neighbors[frontier].ravel()
+            frontier = np.unique(frontier[frontier >= 0])
+            frontier = frontier[distances[frontier] < 0]
+            distances[frontier] = distance
+
+        neighbors_distances = np.where(self.neighbors >= 0, distances[self.neighbors], -1)
+        closer = (neighbors_distances == (distances - 1)[:, None]) & (distances > 0)[:, None]
+        next_actions = np.where(closer.any(axis=1), closer.argmax(axis=1), -1).astype(np.int8)
+        return distances, next_actions
+
+    def paths_to(self, node_target: int) -> Tuple[np.array, np.array]:
+        """
+        Returns the (cached) BFS row of the target node, see bfs.
+        """
+        if node_target in self.paths_cache:
+            self.paths_cache.move_to_end(node_target)
+        else:
+            self.paths_cache[node_target] = self.bfs(node_target)
+            while len(self.paths_cache) > self.max_cached_targets:
+                self.paths_cache.popitem(last=False)
+        return self.paths_cache[node_target]
+
+    def distance_matrix(self, nodes_origins: list = None, nodes_targets: list = None) -> np.array:
+        """
+        Returns the matrix of shortest path lengths between the given origin and target nodes (all nodes by default),
+        -1 for unreachable pairs.
+        """
+        nodes_origins = np.arange(self.num_nodes) if nodes_origins is None else np.asarray(nodes_origins, dtype=int)
+        nodes_targets = range(self.num_nodes) if nodes_targets is None else nodes_targets
+        matrix = np.empty((len(nodes_origins), len(nodes_targets)), dtype=np.int32)
+        for j, node_target in enumerate(nodes_targets):
+            matrix[:, j] = self.paths_to(node_target)[0][nodes_origins]
+        return matrix
+
+    def get_distance(self, origin: (int, int), target: (int, int)) -> int:
+        """
+        Returns the length of the shortest path from the origin point to the target point (-1 if unreachable).
+        """
+        return int(self.paths_to(self.cors_to_node(*target))[0][self.cors_to_node(*origin)])
+
+    def get_next_action(self, origin: (int, int), target: (int, int)) -> int:
+        """
+        Returns the first action of a shortest path from the origin point to the target point, or None if the origin is
+        the target or the target is unreachable.
+        """
+        action = self.paths_to(self.cors_to_node(*target))[1][self.cors_to_node(*origin)]
+        return int(action) if action >= 0 else None
+
     def get_path(self, origin: (int, int), target: (int, int)) -> Tuple[list, list]:
         """
         Computes the shortest path in the graph from the given origin point to the given target point.
@@ -48,20 +180,18 @@ class EnvGraph:
         if node_origin == node_target:
             return [], []
 
-        path = nx.shortest_path(self.graph, node_origin, node_target)
-        cord_path = [self.node_to_cors(node) for node in path]
-        actions = []
-        for node in range(len(path) - 1):
-            delta = path[node + 1] - path[node]
-            if delta == -1:  # West
-                actions.append(3)
-            elif delta == 1:  # East
-                actions.append(2)
-            elif delta == -self.cols:  # North
-                actions.append(1)
-            else:  # South
-                actions.append(0)
-        return cord_path[1:], actions
+        distances, next_actions = self.paths_to(node_target)
+        if distances[node_origin] < 0:
+            raise ValueError('No path between {} and {}'.format(origin, target))
+
+        cord_path, actions = [], []
+        node = node_origin
+        while node != node_target:
+            action = int(next_actions[node])
+            node = int(self.neighbors[node, action])
+            actions.append(action)
+            cord_path.append(self.node_to_cors(node))
+        return cord_path, actions
 
 
 class Taxi:
@@ -71,7 +201,7 @@ class Taxi:
         self.passenger_index = passenger_index
         self.path_cords = []
         self.path_actions = []
-        self.env_graph = EnvGraph(taxi_env.desc.astype(str))
+        self.env_graph = get_env_graph(taxi_env.desc.astype(str))
         self.previous_coordinate = self.taxi_env.state[TAXIS_LOCATIONS][self.taxi_index]
         self.previous_action = None
 
@@ -86,7 +216,7 @@ class Taxi:
 
         # If a destination point wasn't specified, go to the passenger's destination
         if not dest:
-            if self.passenger_index:
+            if self.passenger_index is not None:
                 dest = env_state[PASSENGERS_DESTINATIONS][self.passenger_index]
             else:  # if the taxi has no allocated passenger, stay in place, i.e don't do any action.
                 self.path_cords, self.path_actions = [], []
@@ -0,0 +1,321 @@
+"""
+Performance benchmarks of TaxiEnv, EnvGraph and the Taxi controller.
+
+Sweeps map size, number of taxis and passengers, collision sensitivity and fuel settings (plus a large fleet), and
+reports for every configuration the rate of TaxiEnv.step (with list and compact state, and with joint execution),
+TaxiEnv.reset (sampled, and from a scenario bank), TaxiEnv.partial_observations, TaxiEnv.get_observations,
+TaxiEnv.render ('ansi'), TaxiEnv construction (with its first reset), EnvGraph.get_path and Taxi controller ticks (path
+computation + next step), plus the peak memory of building and running the environment. The startup time of a fresh
+interpreter (importing the packages, building an environment and a Taxi) is reported under 'startup'.
+
+Usage (from the repository root):
+    python benchmarks/benchmark.py --output results.json
+    python benchmarks/benchmark.py --quick --compare baseline.json --threshold 0.2
+
+With --compare, every rate that dropped (or peak memory that grew) by more than the threshold relative to the baseline
+is reported as a regression, and the script exits with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from multitaxienv.taxi_environment import TaxiEnv  # noqa: E402
+from TaxiWrapper.taxi_wrapper import Taxi, get_env_graph  # noqa: E402
+
+# Metrics where lower values are better, all the others are rates (higher is better)
+LOWER_IS_BETTER = {'peak_memory_bytes', 'import_seconds', 'startup_seconds'}
+
+# Run in a fresh interpreter, prints the time of the imports and the time until a Taxi is built
+STARTUP_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from multitaxienv.taxi_environment import TaxiEnv
+from TaxiWrapper.taxi_wrapper import Taxi
+imported = time.perf_counter()
+env = TaxiEnv()
+env.reset()
+Taxi(env, 0).compute_shortest_path(dest=env.state[2][0])
+print(imported - start, time.perf_counter() - start)
+'''
+
+
+def grid_map(rows: int, cols: int) -> list:
+    """
+    Builds a rows x cols map with a wall every few columns, pickup spots spread over the map and one fuel station of
+    each type.
+    """
+    lines = ['+' + '-' * (2 * cols - 1) + '+']
+    for row in range(rows):
+        cells = ['X' if (row * cols + col) % 7 == 0 else ' ' for col in range(cols)]
+        if rows * cols > 2:
+            if row == rows // 2:
+                cells[cols // 2] = 'F'
+            if row == rows - 1:
+                cells[cols - 1] = 'G'
+        separators = ['|' if (col % 4 == 3 and row % 3 == 1) else ':' for col in range(cols - 1)]
+        lines.append('|' + ''.join(cell + separator for cell, separator in zip(cells, separators + [''])) + '|')
+    lines.append(lines[0])
+    return lines
+
+
+def configurations(quick: bool) -> list:
+    """
+    Returns the swept configurations.
+    """
+    map_sizes = [(5, 5), (20, 20)] if quick else [(5, 5), (20, 20), (50, 50)]
+    fleets = [(2, 2), (10, 10)] if quick else [(2, 2), (10, 10), (50, 50)]
+    configs = []
+    for rows, cols in map_sizes:
+        for num_taxis, num_passengers in fleets:
+            if num_taxis >= rows * cols:
+                continue
+            for collision_sensitive_domain in [False, True]:
+                for fuel in [np.inf, 50]:
+                    configs.append(dict(rows=rows, cols=cols, num_taxis=num_taxis, num_passengers=num_passengers,
+                                        collision_sensitive_domain=collision_sensitive_domain, fuel=fuel))
+
+    # A large fleet, where joint execution pays off
+    rows, cols, num_taxis = (50, 50, 500) if quick else (100, 100, 1000)
+    configs.append(dict(rows=rows, cols=cols, num_taxis=num_taxis, num_passengers=num_taxis // 2,
+                        collision_sensitive_domain=True, fuel=50))
+    return configs
+
+
+def config_name(config: dict) -> str:
+    return '{rows}x{cols}-t{num_taxis}-p{num_passengers}-c{collision}-f{fuel}'.format(
+        collision=int(config['collision_sensitive_domain']), **config)
+
+
+def make_env(config: dict, domain_map: list = None, compact_state: bool = False,
+             joint_execution: bool = False) -> TaxiEnv:
+    count = max(config['num_taxis'], config['num_passengers'])
+    if domain_map is None and (config['rows'], config['cols']) != (5, 5):
+        domain_map = grid_map(config['rows'], config['cols'])
+    return TaxiEnv(num_taxis=config['num_taxis'], num_passengers=config['num_passengers'],
+                   max_fuel=[config['fuel']] * count, domain_map=domain_map, taxis_capacity=[1] * count,
+                   collision_sensitive_domain=config['collision_sensitive_domain'], fuel_type_list=['F'] * count,
+                   compact_state=compact_state, joint_execution=joint_execution)
+
+
+def rate(function, duration: float) -> float:
+    """
+    Calls function (which returns the number of operations it did) repeatedly for about 'duration' seconds.
+
+    Returns: operations per second
+
+    """
+    operations, start = 0, time.perf_counter()
+    while True:
+        operations += function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            return operations / elapsed
+
+
+def run_steps(env: TaxiEnv, actions: np.array, episode_length: int = 100):
+    """
+    Steps the environment over the given joint actions, resetting it when the episode ends.
+    """
+    steps_in_episode = 0
+    for joint_action in actions:
+        done = env.step(joint_action)[2]
+        steps_in_episode += 1
+        if done or steps_in_episode == episode_length:
+            env.reset()
+            steps_in_episode = 0
+
+
+def benchmark(config: dict, duration: float, seed: int = 0) -> dict:
+    """
+    Measures all the metrics of a single configuration.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Peak memory, measured apart from the timings as tracing slows everything down
+    tracemalloc.start()
+    env = make_env(config)
+    env.seed(seed)
+    env.reset()
+    run_steps(env, rng.choice(env.available_actions_indexes, size=(100, env.num_taxis)).tolist())
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    env = make_env(config)
+    env.seed(seed)
+    env.reset()
+    actions = rng.choice(env.available_actions_indexes, size=(1000, env.num_taxis)).tolist()
+    batch = 50
+
+    def steps():
+        start = rng.integers(0, len(actions) - batch)
+        run_steps(env, actions[start:start + batch])
+        return batch
+
+    compact_env = make_env(config, compact_state=True)
+    compact_env.seed(seed)
+    compact_env.reset()
+
+    def compact_steps():
+        start = rng.integers(0, len(actions) - batch)
+        run_steps(compact_env, actions[start:start + batch])
+        return batch
+
+    joint_env = make_env(config, compact_state=True, joint_execution=True)
+    joint_env.seed(seed)
+    joint_env.reset()
+
+    def joint_steps():
+        start = rng.integers(0, len(actions) - batch)
+        run_steps(joint_env, actions[start:start + batch])
+        return batch
+
+    def resets():
+        for _ in range(batch):
+            env.reset()
+        return batch
+
+    bank_env = make_env(config)
+    bank_env.seed(seed)
+    bank_env.generate_scenarios(1024)
+
+    def bank_resets():
+        for _ in range(batch):
+            bank_env.reset()
+        return batch
+
+    def observations():
+        for _ in range(batch):
+            env.partial_observations(env.state)
+        return batch
+
+    def encoded_observations():
+        for _ in range(batch):
+            env.get_observations()
+        return batch
+
+    def renders():
+        env.render(mode='ansi')
+        return 1
+
+    domain_map = env.desc.astype(str)
+
+    def constructions():
+        make_env(config, domain_map).reset()
+        return 1
+
+    env_graph = get_env_graph(env.desc.astype(str))
+    cells = rng.integers(0, [env.num_rows, env.num_columns], size=(1000, 2, 2)).tolist()
+
+    # Path queries are measured with a warm cache, the first query of a target computes its BFS row
+    for origin, target in cells:
+        env_graph.get_path(origin, target)
+
+    def path_queries():
+        for origin, target in cells[:batch]:
+            env_graph.get_path(origin, target)
+        cells.append(cells.pop(0))
+        return batch
+
+    taxis = [Taxi(env, taxi_index) for taxi_index in range(env.num_taxis)]
+
+    def controller_ticks():
+        for taxi in taxis:
+            taxi.compute_shortest_path(dest=cells[0][1])
+            taxi.get_next_step()
+        cells.append(cells.pop(0))
+        return len(taxis)
+
+    env.reset()
+    results = {'steps_per_sec': rate(steps, duration), 'compact_steps_per_sec': rate(compact_steps, duration),
+               'joint_steps_per_sec': rate(joint_steps, duration),
+               'resets_per_sec': rate(resets, duration),
+               'bank_resets_per_sec': rate(bank_resets, duration),
+               'observations_per_sec': rate(observations, duration),
+               'encoded_observations_per_sec': rate(encoded_observations, duration),
+               'renders_per_sec': rate(renders, duration),
+               'constructions_per_sec': rate(constructions, duration),
+               'path_queries_per_sec': rate(path_queries, duration),
+               'controller_ticks_per_sec': rate(controller_ticks, duration), 'peak_memory_bytes': peak_memory}
+    return results
+
+
+def startup(repeats: int = 5) -> dict:
+    """
+    Measures the import time of the packages and the time until a Taxi is built in fresh interpreters (the best of
+    'repeats' runs, as the first runs also pay for cold file caches).
+    """
+    script = STARTUP_SCRIPT.format(root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    timings = [subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout
+               for _ in range(repeats)]
+    import_seconds, startup_seconds = np.array([timing.split() for timing in timings], dtype=float).min(axis=0)
+    return {'import_seconds': import_seconds, 'startup_seconds': startup_seconds}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Compares the results to a baseline run.
+
+    Returns: list of regressions (configuration, metric, baseline value, current value, relative change)
+
+    """
+    regressions = []
+    for name, metrics in results['benchmarks'].items():
+        for metric, value in metrics.items():
+            base = baseline['benchmarks'].get(name, {}).get(metric)
+            if not base:
+                continue
+            change = (value - base) / base
+            if (metric in LOWER_IS_BETTER and change > threshold) or \
+                    (metric not in LOWER_IS_BETTER and change < -threshold):
+                regressions.append((name, metric, base, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='run a smaller sweep')
+    parser.add_argument('--duration', type=float, default=0.2, help='seconds spent measuring each metric')
+    parser.add_argument('--filter', default='', help='only run configurations whose name contains this string')
+    parser.add_argument('--output', help='write the results (JSON) to this file instead of stdout')
+    parser.add_argument('--compare', help='baseline results (JSON) to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative change considered a regression')
+    args = parser.parse_args()
+
+    results = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+               'benchmarks': {}}
+    if args.filter in 'startup':
+        results['benchmarks']['startup'] = startup()
+    for config in configurations(args.quick):
+        name = config_name(config)
+        if args.filter in name:
+            results['benchmarks'][name] = benchmark(config, args.duration)
+            print(name, file=sys.stderr)
+
+    output = json.dumps(results, indent=2, default=float)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for name, metric, base, value, change in regressions:
+            print('REGRESSION {} {}: {:.6g} -> {:.6g} ({:+.1%})'.format(name, metric, base, value, change),
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
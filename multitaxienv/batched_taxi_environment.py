@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from .taxi_environment import TaxiEnv, PICKUP, DROPOFF, TURN_ENGINE_ON, TURN_ENGINE_OFF, STANDBY, REFUEL, \
+    EVENT_STEP, EVENT_NO_FUEL, EVENT_BAD_PICKUP, EVENT_BAD_DROPOFF, EVENT_BAD_REFUEL, EVENT_PICKUP, \
+    EVENT_STANDBY_ENGINE_OFF, EVENT_TURN_ENGINE_ON, EVENT_TURN_ENGINE_OFF, EVENT_STANDBY_ENGINE_ON, \
+    EVENT_INTERMEDIATE_DROPOFF, EVENT_FINAL_DROPOFF, EVENT_HIT_WALL, EVENT_COLLISION, sample_distinct_cells
+
+
+class BatchedTaxiEnv:
+    """
+    Steps N independent copies of the same TaxiEnv domain at once.
+
+    The episode state of all the environments is held as stacked arrays:
+        taxis_locations:            [N, num_taxis, 2]       (row, col) of each taxi
+        fuels:                      [N, num_taxis]          fuel of each taxi
+        passengers_start_locations: [N, num_passengers, 2]  current/last available location of each passenger
+        passengers_destinations:    [N, num_passengers, 2]  destination of each passenger
+        passengers_status:          [N, num_passengers]     -1 delivered, 0 waiting, x in taxi x
+        collided:                   [N, num_taxis]          whether the taxi collided
+        engine_status:              [N, num_taxis]          whether the taxi's engine is on
+
+    Taxis inside an environment are still executed in a serialized manner (taxi 0 first), exactly as in TaxiEnv.step,
+    but every taxi index is executed for all the N environments with array operations.
+
+    Observations are stacked in the TaxiEnv.get_observation layout, i.e. an array of shape [N, num_taxis, obs_dim].
+    Taxis that can't act in a step (collided, or out of fuel outside a valid fuel station) get a reward of 0, where
+    TaxiEnv.step leaves them out of the rewards list.
+    """
+
+    def __init__(self, num_envs: int, num_taxis: int = 2, num_passengers: int = 2, max_fuel: list = None,
+                 domain_map: list = None, taxis_capacity: list = None, collision_sensitive_domain: bool = False,
+                 fuel_type_list: list = None, option_to_stand_by: bool = True, taxis_rewards: list = None,
+                 auto_reset: bool = True):
+        """
+        Args:
+            num_envs: number of environments to step together
+            num_taxis: number of taxis in each environment
+            num_passengers: number of passengers in each environment
+            max_fuel: list of max and starting fuel, we use np.inf as default for fuel free taxi.
+            domain_map: map of the domain
+            taxis_capacity: max capacity of passengers in each taxi (list)
+            collision_sensitive_domain: is the domain show and react (true) to collisions or not (false)
+            fuel_type_list: list of fuel types of each taxi
+            option_to_stand_by: can taxis simply stand in place
+            taxis_rewards: list of rewards dictionaries of each taxi, overriding the rewards of config.py
+            auto_reset: reset finished environments automatically at the end of step
+        """
+        # The single environment holds the parsed map and the action dictionaries shared by all the copies
+        self.env = TaxiEnv(num_taxis=num_taxis, num_passengers=num_passengers, max_fuel=max_fuel,
+                           domain_map=domain_map, taxis_capacity=taxis_capacity,
+                           collision_sensitive_domain=collision_sensitive_domain, fuel_type_list=fuel_type_list,
+                           option_to_stand_by=option_to_stand_by, taxis_rewards=taxis_rewards)
+
+        self.num_envs = num_envs
+        self.num_taxis = num_taxis
+        self.num_passengers = num_passengers
+        self.auto_reset = auto_reset
+        self.collision_sensitive_domain = collision_sensitive_domain
+        self.option_to_standby = option_to_stand_by
+        self.num_rows = self.env.num_rows
+        self.num_columns = self.env.num_columns
+        self.action_space = self.env.action_space
+
+        self.max_fuel = np.asarray(self.env.max_fuel[:num_taxis], dtype=float)
+        self.taxis_capacity = np.asarray(self.env.taxis_capacity[:num_taxis])
+        self.passengers_locations = np.argwhere(self.env.cell_types == 'X')
+
+        # Per taxi boolean map of the fuel stations the taxi can refuel at
+        self.taxis_fuel_stations = np.stack(self.env.taxis_fuel_stations[:num_taxis])
+
+        # Movement transition table of the map, with a trailing "no movement" direction for non-movement actions
+        num_cells = self.num_rows * self.num_columns
+        self.next_cell = np.concatenate([self.env.next_cell, np.arange(num_cells)[:, None]], axis=1)
+        self.action_directions = np.full(len(self.env.index_action_dictionary), len(self.env.movement_directions))
+        for action, direction in self.env.movement_directions.items():
+            self.action_directions[action] = direction
+
+        self.rewards_table = np.asarray(self.env.rewards_table, dtype=float)
+
+        self.taxis_locations = np.zeros((num_envs, num_taxis, 2), dtype=int)
+        self.fuels = np.zeros((num_envs, num_taxis), dtype=float)
+        self.passengers_start_locations = np.zeros((num_envs, num_passengers, 2), dtype=int)
+        self.passengers_destinations = np.zeros((num_envs, num_passengers, 2), dtype=int)
+        self.passengers_status = np.zeros((num_envs, num_passengers), dtype=int)
+        self.collided = np.zeros((num_envs, num_taxis), dtype=bool)
+        self.engine_status = np.ones((num_envs, num_taxis), dtype=bool)
+        self.dones = np.zeros(num_envs, dtype=bool)
+
+        # Number of taxis on each cell of each environment, kept up to date by reset_envs and step
+        self.occupancy = np.zeros((num_envs, num_cells), dtype=np.min_scalar_type(num_taxis))
+
+        self.np_random = None
+        self.seed()
+
+    def seed(self, seed=None) -> list:
+        """
+        Setting a seed for the random sample state generation of all the environments.
+        Args:
+            seed: seed to use
+
+        Returns: list[seed]
+
+        """
+        from gym.utils import seeding  # gym is imported lazily, only the seeding needs it
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def reset(self) -> np.array:
+        """
+        Resets all the environments.
+
+        Returns: stacked observations of all the environments.
+
+        """
+        self.reset_envs(np.ones(self.num_envs, dtype=bool))
+        return self.get_observations()
+
+    def reset_envs(self, mask: np.array):
+        """
+        Resets the environments selected by the boolean mask in the same manner as TaxiEnv.reset:
+            - taxis are located at different random coordinates.
+            - refuel all taxis.
+            - passengers are located at random pickup locations, with a random different destination.
+            - all engines turn on and collisions are cleared.
+        Args:
+            mask: boolean array of shape [N]
+
+        """
+        envs = np.flatnonzero(mask)
+        num_envs = len(envs)
+        if num_envs == 0:
+            return
+
+        # Only the cells of the previous taxis are cleared, the occupancy grids are as large as the map
+        previous_cells = self.taxis_locations[envs, :, 0] * self.num_columns + self.taxis_locations[envs, :, 1]
+        self.occupancy[envs[:, None], previous_cells] = 0
+
+        # Random distinct cells for the taxis of each environment
+        cells = self.sample_taxis_cells(num_envs)
+        self.taxis_locations[envs, :, 0], self.taxis_locations[envs, :, 1] = np.divmod(cells, self.num_columns)
+
+        # Random pickup locations, and a random destination different from the start location
+        num_locations = len(self.passengers_locations)
+        starts = self.np_random.integers(num_locations, size=(num_envs, self.num_passengers))
+        destinations = (starts + 1 + self.np_random.integers(num_locations - 1, size=starts.shape)) % num_locations
+        self.passengers_start_locations[envs] = self.passengers_locations[starts]
+        self.passengers_destinations[envs] = self.passengers_locations[destinations]
+
+        self.fuels[envs] = self.max_fuel
+        self.passengers_status[envs] = 0
+        self.collided[envs] = False
+        self.engine_status[envs] = True
+        self.dones[envs] = False
+        self.occupancy[envs[:, None], cells] = 1
+
+    def sample_taxis_cells(self, num_envs: int) -> np.array:
+        """
+        Samples distinct random cells for the taxis of num_envs environments (see sample_distinct_cells).
+        Args:
+            num_envs: number of environments
+
+        Returns: array of shape [num_envs, num_taxis] of cell indexes (row * num_columns + col)
+
+        """
+        return sample_distinct_cells(self.np_random, num_envs, self.num_rows * self.num_columns, self.num_taxis)
+
+    def rebuild_occupancy(self):
+        """
+        Recomputes the occupancy grids from the taxis locations.
+        It should be called after modifying taxis_locations directly.
+        """
+        self.occupancy[...] = 0
+        cells = self.taxis_locations[:, :, 0] * self.num_columns + self.taxis_locations[:, :, 1]
+        envs = np.arange(self.num_envs)
+        # A taxi index is on a single cell of each environment, so the taxis are added without np.add.at
+        for taxi in range(self.num_taxis):
+            self.occupancy[envs, cells[:, taxi]] += 1
+
+    def step(self, actions: np.array) -> (np.array, np.array, np.array, dict):
+        """
+        Executing the actions of all the taxis in all the environments.
+        Args:
+            actions: array of shape [N, num_taxis], actions[n, i] is the action of taxi i in environment n.
+
+        Returns: stacked observations [N, num_taxis, obs_dim], rewards [N, num_taxis], dones [N] and an info dictionary
+        holding the last observations of the environments that were reset ('final_observations', NaN for the others).
+
+        """
+        actions = np.asarray(actions).reshape(self.num_envs, self.num_taxis)
+        rewards = np.zeros((self.num_envs, self.num_taxis))
+        envs = np.arange(self.num_envs)
+
+        for taxi in range(self.num_taxis):
+            action = actions[:, taxi].copy()
+            taxi_rewards = self.rewards_table[taxi]
+            reward = np.full(self.num_envs, taxi_rewards[EVENT_STEP])
+            row, col = self.taxis_locations[:, taxi, 0], self.taxis_locations[:, taxi, 1]
+            fuel = self.fuels[:, taxi]
+
+            # Collided taxis and taxis out of fuel (unless at a suitable fuel station) can't perform a step
+            at_fuel_station = self.taxis_fuel_stations[taxi, row, col]
+            active = ~self.collided[:, taxi] & ~((fuel == 0) & ~at_fuel_station)
+            engine_on = self.engine_status[:, taxi]
+
+            # Engine is off
+            engine_off = active & ~engine_on
+            reward[engine_off & (action == STANDBY)] = taxi_rewards[EVENT_STANDBY_ENGINE_OFF]
+            turned_on = engine_off & (action == TURN_ENGINE_ON)
+            reward[turned_on] = taxi_rewards[EVENT_TURN_ENGINE_ON]
+
+            # Movement
+            engine_on = active & engine_on
+            cell = row * self.num_columns + col
+            new_cell = np.where(engine_on, self.next_cell[cell, self.action_directions[action]], cell)
+            new_row, new_col = np.divmod(new_cell, self.num_columns)
+            moved = new_cell != cell
+
+            # Check for collisions
+            collided_now = np.zeros(self.num_envs, dtype=bool)
+            if self.collision_sensitive_domain:
+                collision = moved & (self.occupancy[envs, new_cell] > 0)
+                if self.option_to_standby:
+                    moved &= ~collision
+                    action[collision] = STANDBY
+                else:
+                    colliding = np.flatnonzero(collision)
+                    taxis_cells = (self.taxis_locations[colliding, :, 0] * self.num_columns +
+                                   self.taxis_locations[colliding, :, 1])
+                    self.collided[colliding] |= taxis_cells == new_cell[colliding, None]
+                    self.collided[collision, taxi] = True
+                    reward[collision] = taxi_rewards[EVENT_COLLISION]
+                    collided_now = collision
+            acting = engine_on & ~collided_now
+
+            # Pickup - passengers are taken by index order as long as there is room in the taxi
+            picking = acting & (action == PICKUP)
+            if picking.any():
+                load = (self.passengers_status == taxi + 1).sum(axis=1)
+                successful_pickup = np.zeros(self.num_envs, dtype=bool)
+                for passenger in range(self.num_passengers):
+                    picked = (picking & (self.passengers_status[:, passenger] == 0) &
+                              (self.passengers_start_locations[:, passenger, 0] == row) &
+                              (self.passengers_start_locations[:, passenger, 1] == col) &
+                              (load < self.taxis_capacity[taxi]))
+                    self.passengers_status[picked, passenger] = taxi + 1
+                    load += picked
+                    successful_pickup |= picked
+                reward[picking & successful_pickup] = taxi_rewards[EVENT_PICKUP]
+                reward[picking & ~successful_pickup] = taxi_rewards[EVENT_BAD_PICKUP]
+
+            # Dropoff - the reward is the one of the last passenger (by index) that left the taxi
+            dropping = acting & (action == DROPOFF)
+            if dropping.any():
+                successful_dropoff = np.zeros(self.num_envs, dtype=bool)
+                for passenger in range(self.num_passengers):
+                    on_taxi = dropping & (self.passengers_status[:, passenger] == taxi + 1)
+                    at_destination = ((self.passengers_destinations[:, passenger, 0] == row) &
+                                      (self.passengers_destinations[:, passenger, 1] == col))
+                    delivered, dropped = on_taxi & at_destination, on_taxi & ~at_destination
+                    self.passengers_status[delivered, passenger] = -1
+                    reward[delivered] = taxi_rewards[EVENT_FINAL_DROPOFF]
+                    self.passengers_status[dropped, passenger] = 0
+                    self.passengers_start_locations[dropped, passenger, 0] = row[dropped]
+                    self.passengers_start_locations[dropped, passenger, 1] = col[dropped]
+                    reward[dropped] = taxi_rewards[EVENT_INTERMEDIATE_DROPOFF]
+                    successful_dropoff |= on_taxi
+                reward[dropping & ~successful_dropoff] = taxi_rewards[EVENT_BAD_DROPOFF]
+
+            # Turning engine off / standby with engine on
+            turned_off = acting & (action == TURN_ENGINE_OFF)
+            reward[turned_off] = taxi_rewards[EVENT_TURN_ENGINE_OFF]
+            reward[acting & (action == STANDBY)] = taxi_rewards[EVENT_STANDBY_ENGINE_ON]
+            self.engine_status[turned_on, taxi] = True
+            self.engine_status[turned_off, taxi] = False
+
+            # Fuel consumption
+            no_fuel = moved & (fuel == 0)
+            reward[no_fuel] = taxi_rewards[EVENT_NO_FUEL]
+            driving = moved & ~no_fuel
+            self.occupancy[driving, cell[driving]] -= 1
+            self.occupancy[driving, new_cell[driving]] += 1
+            self.taxis_locations[driving, taxi, 0] = new_row[driving]
+            self.taxis_locations[driving, taxi, 1] = new_col[driving]
+            self.fuels[driving, taxi] = np.maximum(0, fuel[driving] - 1)
+
+            # A move action that left the taxi in place hit a wall
+            is_move = self.action_directions[action] < len(self.env.movement_directions)
+            reward[active & ~moved & is_move] = taxi_rewards[EVENT_HIT_WALL]
+
+            # Taxi refuel
+            refueling = active & (action == REFUEL)
+            if refueling.any():
+                row, col = self.taxis_locations[:, taxi, 0], self.taxis_locations[:, taxi, 1]
+                refueled = refueling & self.taxis_fuel_stations[taxi, row, col]
+                self.fuels[refueled, taxi] = self.max_fuel[taxi]
+                reward[refueling & ~refueled] = taxi_rewards[EVENT_BAD_REFUEL]
+
+            # The episode is done once all the passengers are delivered, all taxis collided or all taxis are out of fuel
+            done = ((self.passengers_status == -1).all(axis=1) | self.collided.all(axis=1) |
+                    (self.fuels == 0).all(axis=1))
+            self.dones |= active & done
+
+            rewards[envs[active], taxi] = reward[active]
+
+        observations = self.get_observations()
+        dones = self.dones.copy()
+        info = {}
+        if self.auto_reset and dones.any():
+            info['final_observations'] = np.where(dones[:, None, None], observations, np.nan)
+            self.reset_envs(dones)
+            observations = self.get_observations()
+
+        return observations, rewards, dones, info
+
+    def get_observations(self) -> np.array:
+        """
+        Stacks the observation of every taxi in every environment, in the TaxiEnv.get_observation layout:
+        [taxi_row, taxi_col, fuel, passengers start coordinates, passengers destinations, passengers status].
+
+        Returns: array of shape [N, num_taxis, 3 + 5 * num_passengers]
+
+        """
+        passengers_information = np.concatenate([self.passengers_start_locations.reshape(self.num_envs, -1),
+                                                 self.passengers_destinations.reshape(self.num_envs, -1),
+                                                 self.passengers_status], axis=1)
+        passengers_information = np.broadcast_to(passengers_information[:, None, :],
+                                                 (self.num_envs, self.num_taxis, passengers_information.shape[1]))
+        return np.concatenate([self.taxis_locations, self.fuels[:, :, None], passengers_information], axis=2)
+
+    def get_state(self, index: int) -> list:
+        """
+        Returns the state of environment 'index' in the TaxiEnv.state format.
+        Args:
+            index: index of the environment
+
+        Returns: [taxis_locations, fuels, passengers_start_locations, passengers_destinations, passengers_status]
+
+        """
+        return [self.taxis_locations[index].tolist(), self.fuels[index].tolist(),
+                self.passengers_start_locations[index].tolist(), self.passengers_destinations[index].tolist(),
+                self.passengers_status[index].tolist()]
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+
+
+class PoissonArrivals:
+    """
+    Arrival process of the passengers of a TaxiEnv in demand mode: a Poisson number of passengers arrives at every
+    step, and initial_passengers arrive at reset.
+    Any object with a sample(np_random) method returning the number of arrivals of a step and an initial_passengers
+    attribute can be used as the arrival process of a TaxiEnv.
+    """
+
+    def __init__(self, rate: float, initial_passengers: int = 0):
+        """
+        Args:
+            rate: mean number of passengers arriving at each step
+            initial_passengers: number of passengers arriving at reset
+        """
+        if rate < 0:
+            raise ValueError('The arrival rate must be non-negative, got {}'.format(rate))
+        self.rate = rate
+        self.initial_passengers = initial_passengers
+
+    def sample(self, np_random) -> int:
+        """
+        Args:
+            np_random: the random generator of the environment
+
+        Returns: the number of passengers arriving at a step
+
+        """
+        return int(np_random.poisson(self.rate))
+
+
+class PassengerPool:
+    """
+    Free-list of the passenger slots of a TaxiEnv in demand mode.
+    The env's passengers (the num_passengers entries of the state's passengers components) are a fixed pool of slots:
+    a slot is active while its passenger waits or rides a taxi, and free once the passenger is delivered (status -1).
+    Arriving passengers take the lowest free slot and delivered passengers release theirs, so the state never grows and
+    the slots taken only depend on the state (the free-list is a heap rebuilt from the passengers status).
+    """
+
+    def __init__(self, num_slots: int):
+        """
+        Args:
+            num_slots: number of passenger slots, the num_passengers of the environment
+        """
+        self.num_slots = num_slots
+        self.free_slots = list(range(num_slots))  # Min-heap of the free slots
+
+        # Totals of the episode: passengers that arrived, arrivals dropped as the pool was full, deliveries
+        self.num_arrivals = 0
+        self.num_dropped = 0
+        self.num_deliveries = 0
+
+    @property
+    def num_active(self) -> int:
+        return self.num_slots - len(self.free_slots)
+
+    def reset(self):
+        """
+        Frees all the slots and clears the totals.
+        """
+        self.free_slots[:] = range(self.num_slots)
+        self.num_arrivals = 0
+        self.num_dropped = 0
+        self.num_deliveries = 0
+
+    def rebuild(self, passengers_status: list):
+        """
+        Recomputes the free slots from the passengers status (a slot is free when its passenger is delivered).
+        """
+        self.free_slots[:] = [slot for slot, status in enumerate(passengers_status) if status == -1]
+
+    def allocate(self) -> int:
+        """
+        Takes the lowest free slot for an arriving passenger.
+
+        Returns: the slot, or -1 if the pool is full (the arrival is dropped)
+
+        """
+        if not self.free_slots:
+            self.num_dropped += 1
+            return -1
+        self.num_arrivals += 1
+        return heapq.heappop(self.free_slots)
+
+    def release(self, slot: int):
+        """
+        Frees the slot of a delivered passenger.
+        """
+        self.num_deliveries += 1
+        heapq.heappush(self.free_slots, slot)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+def map_to_array(domain_map) -> np.array:
+    """
+    Converts a map (list of strings, or an array of characters) to the 2D array of characters of TaxiEnv.desc.
+    Maps with rows of equal length are converted with a single buffer copy instead of character by character.
+    Args:
+        domain_map: map of the domain
+
+    Returns: numpy array of dtype 'S1' and shape [len(domain_map), len(domain_map[0])]
+
+    """
+    if isinstance(domain_map, np.ndarray):
+        return np.asarray(domain_map, dtype='c')
+    width = len(domain_map[0])
+    if all(len(line) == width for line in domain_map):
+        buffer = ''.join(domain_map).encode('ascii')
+        if len(buffer) == width * len(domain_map):  # Non-ascii characters take more than one byte
+            return np.frombuffer(buffer, dtype='c').reshape(len(domain_map), width).copy()
+    return np.asarray(domain_map, dtype='c')
+
+
+def generate_map(num_rows: int, num_columns: int, wall_density: float = 0.2, num_pickups: int = None,
+                 fuel_stations: dict = None, seed: int = None) -> list:
+    """
+    Generates a random map in the format of taxi_environment.MAP.
+    Walls ('|') are drawn independently between horizontally adjacent cells, but every column separator keeps at least
+    one opening (':'), so all the cells of the map are reachable from each other (taxis always move freely south and
+    north). Pickup spots ('X') and fuel stations are placed on distinct random cells.
+    Args:
+        num_rows: number of rows of the map
+        num_columns: number of columns of the map
+        wall_density: probability of a wall between two horizontally adjacent cells
+        num_pickups: number of passengers pickup/destination spots, about 5% of the cells (at least 2) by default
+        fuel_stations: fuel type -> number of fuel stations of this type, one 'F' and one 'G' station by default
+        seed: seed of the random generator
+
+    Returns: the map as a list of strings, borders included
+
+    """
+    if fuel_stations is None:
+        fuel_stations = {'F': 1, 'G': 1}
+    num_cells = num_rows * num_columns
+    if num_pickups is None:
+        num_pickups = max(2, num_cells // 20)
+    if num_pickups < 2:
+        raise ValueError('A map needs at least 2 pickup spots, got {}'.format(num_pickups))
+    num_special_cells = num_pickups + sum(fuel_stations.values())
+    if num_special_cells > num_cells:
+        raise ValueError('Can not place {} pickup spots and fuel stations on {} cells'.format(num_special_cells,
+                                                                                               num_cells))
+    rng = np.random.default_rng(seed)
+
+    grid = np.full((num_rows + 2, 2 * num_columns + 1), b' ', dtype='c')
+    grid[[0, -1], :] = b'-'
+    grid[[0, 0, -1, -1], [0, -1, 0, -1]] = b'+'
+    grid[1:-1, [0, -1]] = b'|'
+
+    # Walls between the cells, with a random opening on every column separator
+    walls = rng.random((num_rows, num_columns - 1)) < wall_density
+    walls[rng.integers(num_rows, size=num_columns - 1), np.arange(num_columns - 1)] = False
+    grid[1:-1, 2:-1:2] = np.where(walls, b'|', b':')
+
+    cells = np.full(num_cells, b' ', dtype='c')
+    markers = np.repeat(['X'] + list(fuel_stations), [num_pickups] + list(fuel_stations.values())).astype('c')
+    cells[rng.choice(num_cells, size=num_special_cells, replace=False)] = markers
+    grid[1:-1, 1::2] = cells.reshape(num_rows, num_columns)
+
+    return [line.tobytes().decode('ascii') for line in grid]
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+ENCODINGS = ['raw', 'normalized', 'one_hot']
+
+
+class ObservationEncoder:
+    """
+    Encodes TaxiEnv states into a single preallocated observation array of shape [num_taxis, obs_dim], row i being
+    the observation of taxi i: the taxi's location and fuel, followed by the passengers block shared by all the taxis
+    (passengers start locations, destinations and status). The passengers block is encoded once per call and copied
+    to the taxis' rows.
+
+    Encodings:
+        - 'raw': the TaxiEnv.get_observation layout [taxi_row, taxi_col, fuel, passengers start coordinates,
+          passengers destinations, passengers status].
+        - 'normalized': the raw layout scaled to [0, 1]: coordinates by the map size, fuel by the taxi's max fuel (1 for
+          taxis with infinite fuel) and status s by (s + 1) / (num_taxis + 1).
+        - 'one_hot': every coordinate as a one-hot row and a one-hot column, the fuel normalized, and every passenger
+          status one-hot over (delivered, waiting, in taxi 1, ..., in taxi num_taxis).
+
+    encode fills the same array on every call and returns it - copy it to keep it.
+    """
+
+    def __init__(self, env, encoding: str = 'raw', dtype=np.float32):
+        """
+        Args:
+            env: the TaxiEnv whose states are encoded
+            encoding: one of ENCODINGS
+            dtype: dtype of the observations
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError('Unknown encoding: {}, expected one of {}'.format(encoding, ENCODINGS))
+        self.env = env
+        self.encoding = encoding
+        num_taxis, num_passengers = env.num_taxis, env.num_passengers
+        num_rows, num_columns = env.num_rows, env.num_columns
+        self.max_fuel = np.asarray(env.max_fuel[:num_taxis], dtype=float)
+        self.finite_fuel = np.isfinite(self.max_fuel)
+
+        if encoding == 'one_hot':
+            location_size = num_rows + num_columns
+            self.taxi_size = location_size + 1
+            self.status_size = num_taxis + 2
+            passengers_size = num_passengers * (2 * location_size + self.status_size)
+            low, high = np.zeros(self.taxi_size + passengers_size), np.ones(self.taxi_size + passengers_size)
+
+            # Offset of the one-hot row of each coordinate of the passengers block, the one-hot column being num_rows
+            # after it, and offset of the one-hot status of each passenger
+            locations_offsets = self.taxi_size + location_size * np.arange(2 * num_passengers)
+            self.rows_offsets = locations_offsets
+            self.columns_offsets = locations_offsets + num_rows
+            self.status_offsets = self.taxi_size + 2 * num_passengers * location_size + \
+                self.status_size * np.arange(num_passengers)
+        else:
+            self.taxi_size = 3
+            low = np.concatenate([[0, 0, 0], np.zeros(4 * num_passengers), np.full(num_passengers, -1)])
+            high = np.concatenate([[num_rows - 1, num_columns - 1, self.max_fuel.max(initial=0)],
+                                   np.tile([num_rows - 1, num_columns - 1], 2 * num_passengers),
+                                   np.full(num_passengers, num_taxis)])
+            if encoding == 'normalized':
+                # Observations are scaled as (raw - low) / (high - low), except for the fuel
+                self.shift = low
+                self.scale = 1 / np.maximum(high - low, 1)
+                low, high = np.zeros(len(low)), np.ones(len(high))
+
+        from gym.spaces import Box  # gym is imported lazily, only the observation space needs it
+        self.observation_space = Box(low=np.tile(low, (num_taxis, 1)).astype(dtype),
+                                     high=np.tile(high, (num_taxis, 1)).astype(dtype),
+                                     shape=(num_taxis, len(low)), dtype=dtype)
+        self.observations = np.zeros((num_taxis, len(low)), dtype=dtype)
+        self.taxis = np.arange(num_taxis)
+
+    @property
+    def obs_dim(self) -> int:
+        return self.observations.shape[1]
+
+    def encode(self, state: list = None) -> np.array:
+        """
+        Encodes a state into the observations array.
+        Args:
+            state: state of the domain (list or ArrayState), the environment's current state if None
+
+        Returns: the observations array, of shape [num_taxis, obs_dim]
+
+        """
+        if state is None:
+            state = self.env.state
+        if hasattr(state, 'record'):  # Compact ArrayState
+            record = state.record
+            taxis_locations, fuels = record['taxis_locations'], record['fuels']
+            starts, destinations = record['passengers_start_locations'], record['passengers_destinations']
+            passengers_status = record['passengers_status']
+        else:
+            taxis_locations, fuels, starts, destinations, passengers_status = (np.asarray(component)
+                                                                              for component in state)
+        observations = self.observations
+        num_passengers = len(passengers_status)
+
+        if self.encoding == 'one_hot':
+            observations[...] = 0
+            passengers = observations[0, self.taxi_size:]
+            locations = np.concatenate([starts, destinations]).reshape(-1, 2)
+            observations[0, self.rows_offsets + locations[:, 0]] = 1
+            observations[0, self.columns_offsets + locations[:, 1]] = 1
+            observations[0, self.status_offsets + passengers_status + 1] = 1
+            observations[1:, self.taxi_size:] = passengers
+            observations[self.taxis, taxis_locations[:, 0]] = 1
+            observations[self.taxis, self.env.num_rows + taxis_locations[:, 1]] = 1
+        else:
+            passengers = observations[0, 3:]
+            passengers[:2 * num_passengers] = starts.reshape(-1)
+            passengers[2 * num_passengers:4 * num_passengers] = destinations.reshape(-1)
+            passengers[4 * num_passengers:] = passengers_status
+            observations[:, :2] = taxis_locations
+            if self.encoding == 'normalized':
+                passengers -= self.shift[3:]
+                passengers *= self.scale[3:]
+                observations[:, :2] *= self.scale[:2]
+            observations[1:, 3:] = passengers
+
+        if self.encoding == 'raw':
+            observations[:, self.taxi_size - 1] = fuels
+        else:
+            observations[:, self.taxi_size - 1] = np.where(self.finite_fuel, fuels / np.where(self.finite_fuel,
+                                                                                              self.max_fuel, 1), 1)
+        return observations
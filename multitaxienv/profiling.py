@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import json
+from time import perf_counter
+
+# Phases of the execution of a taxi's action in TaxiEnv.step
+PHASES = ['movement', 'collision', 'passengers', 'fuel', 'done']
+PHASE_MOVEMENT, PHASE_COLLISION, PHASE_PASSENGERS, PHASE_FUEL, PHASE_DONE = range(len(PHASES))
+
+# Events counted by TaxiEnv.step
+COUNTERS = ['actions', 'skipped', 'moves', 'wall_hits', 'no_fuel', 'collisions', 'forced_standbys', 'pickups',
+            'bad_pickups', 'dropoffs', 'bad_dropoffs', 'refuels', 'bad_refuels']
+(COUNT_ACTIONS, COUNT_SKIPPED, COUNT_MOVES, COUNT_WALL_HITS, COUNT_NO_FUEL, COUNT_COLLISIONS, COUNT_FORCED_STANDBYS,
+ COUNT_PICKUPS, COUNT_BAD_PICKUPS, COUNT_DROPOFFS, COUNT_BAD_DROPOFFS, COUNT_REFUELS, COUNT_BAD_REFUELS) = \
+    range(len(COUNTERS))
+
+
+class StepProfiler:
+    """
+    Accumulates the time TaxiEnv.step spends in each phase (see PHASES) and counts its events (see COUNTERS).
+    The accumulators are plain preallocated lists indexed by the PHASE_* and COUNT_* codes, updated in place by step
+    while the profiler is attached to the environment (TaxiEnv.profiler, or the TaxiEnv.profile context manager).
+    Steps of an environment without a profiler only pay a check of TaxiEnv.profiler.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.timings = [0.0] * len(PHASES)
+        self.counts = [0] * len(COUNTERS)
+
+    def reset(self):
+        """
+        Clears the accumulators.
+        """
+        self.calls = 0
+        self.total_time = 0.0
+        self.timings[:] = [0.0] * len(PHASES)
+        self.counts[:] = [0] * len(COUNTERS)
+
+    def lap(self, phase: int, start: float) -> float:
+        """
+        Adds the time elapsed since start to a phase.
+        Args:
+            phase: PHASE_* code of the phase
+            start: perf_counter() at the start of the phase
+
+        Returns: perf_counter() at the end of the phase, the start of the next one
+
+        """
+        now = perf_counter()
+        self.timings[phase] += now - start
+        return now
+
+    def snapshot(self) -> dict:
+        """
+        Returns: JSON-serializable copy of the accumulators: the number of step calls, their total time, the time of
+                 each phase and the count of each event.
+
+        """
+        return {'calls': self.calls, 'total_time': self.total_time,
+                'phases': dict(zip(PHASES, self.timings)), 'counters': dict(zip(COUNTERS, self.counts))}
+
+    def export(self, path: str):
+        """
+        Writes the snapshot of the accumulators to a JSON file.
+        Args:
+            path: path of the file
+
+        """
+        with open(path, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    def report(self) -> str:
+        """
+        Returns: a human readable table of the phases (total time, share of the step time and time per call) and of
+                 the counters.
+
+        """
+        calls = max(self.calls, 1)
+        lines = ['{} step calls, {:.6f} s ({:.2f} us per call)'.format(self.calls, self.total_time,
+                                                                       1e6 * self.total_time / calls)]
+        for phase, timing in zip(PHASES, self.timings):
+            share = 100 * timing / self.total_time if self.total_time else 0
+            lines.append('  {:<12}{:>12.6f} s{:>8.1f}%{:>10.2f} us'.format(phase, timing, share, 1e6 * timing / calls))
+        lines.extend('  {:<16}{:>12}'.format(counter, count) for counter, count in zip(COUNTERS, self.counts))
+        return '\n'.join(lines)
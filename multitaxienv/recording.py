@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import numpy as np
+from .state import STATE_FIELDS, state_dtype
+from .taxi_environment import DONE_OUT_OF_FUEL
+
+FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+
+
+def transition_dtype(num_taxis: int, num_passengers: int, max_fuel: list = None) -> np.dtype:
+    """
+    Builds the fixed dtype of a recorded transition: the state components after the transition (see
+    state.state_dtype), the collided and engine status of the taxis, the joint action, the reward of each taxi (NaN for
+    the taxis that didn't act, as they get no reward), the done flag, and the episode and step indexes (step 0 being
+    the state after reset).
+    Args:
+        num_taxis: number of taxis in the domain
+        num_passengers: number of passengers in the domain
+        max_fuel: list of max fuel of each taxi
+
+    Returns: numpy structured dtype with a field per column
+
+    """
+    fields = state_dtype(num_taxis, num_passengers, max_fuel).descr
+    return np.dtype(fields + [('collided', np.bool_, (num_taxis,)),
+                              ('engine_status', np.bool_, (num_taxis,)),
+                              ('actions', np.int16, (num_taxis,)),
+                              ('rewards', np.float32, (num_taxis,)),
+                              ('done', np.bool_),
+                              ('episode', np.int32),
+                              ('step', np.int32)])
+
+
+class TrajectoryRecorder:
+    """
+    Records the transitions of a TaxiEnv into chunked columnar files.
+
+    reset and step are called through the recorder, which calls the environment's and appends a row to a preallocated
+    chunk. To keep the per-step cost low, a row is staged as one flat float64 row (a single assignment) and the staged
+    rows are converted into the typed columns of the chunk when it is flushed; a compact state is copied into the chunk
+    directly, as the chunk's rows start with the layout of its record. Full chunks are written by a background thread,
+    one file per column of the chunk: a compressed .npz file per chunk when compress is True, and raw .npy files (that
+    are memory-mapped for reading) otherwise. The directory's meta.json lists the written chunks, and is updated after
+    each of them. Read the recordings with TrajectoryReader.
+    """
+
+    def __init__(self, env, directory: str, chunk_size: int = 4096, compress: bool = True):
+        """
+        Args:
+            env: the TaxiEnv to record
+            directory: directory of the recording, created if needed
+            chunk_size: number of transitions per chunk
+            compress: write compressed .npz chunks instead of memory-mappable .npy files
+        """
+        self.env = env
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+
+        max_fuel = env.max_fuel[:env.num_taxis]
+        self.buffer = np.zeros(chunk_size, dtype=transition_dtype(env.num_taxis, env.num_passengers, max_fuel))
+        self.columns = {name: self.buffer[name] for name in self.buffer.dtype.names}
+
+        # The state columns lead the rows with the layout of the state record, so a compact state is copied as is (with
+        # the dtype object of the env's record, numpy copies the bytes instead of converting field by field)
+        record_dtype = env.array_state.record.dtype if env.compact_state else state_dtype(env.num_taxis,
+                                                                                          env.num_passengers, max_fuel)
+        self.state_rows = np.ndarray(chunk_size, dtype=record_dtype, buffer=self.buffer, strides=self.buffer.strides)
+
+        # Columns of the staged rows (the state is staged only when it is a nested-list state): [name, start, stop]
+        staged_names = [] if env.compact_state else list(STATE_FIELDS)
+        staged_names += [name for name in self.buffer.dtype.names if name not in STATE_FIELDS]
+        self.staged_columns = []
+        width = 0
+        for name in staged_names:
+            size = int(np.prod(self.buffer.dtype[name].shape))
+            self.staged_columns.append((name, width, width + size))
+            width += size
+        self.staging = np.zeros((chunk_size, width))
+        self.reset_actions = [-1] * env.num_taxis
+        self.missing_rewards = [np.nan] * env.num_taxis
+        self.num_rows = 0
+        self.chunks = []  # Number of rows of each written chunk
+        self.episode = -1
+        self.step_index = 0
+
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+        self.closed = False
+
+    def reset(self, scenario: int = None) -> list:
+        """
+        Resets the environment and records its initial state.
+        Args:
+            scenario: index of the scenario of the environment's bank to start from, passed to its reset
+
+        Returns: The reset state.
+
+        """
+        state = self.env.reset(scenario=scenario)
+        self.episode += 1
+        self.step_index = 0
+        self.record(None, None, False)
+        return state
+
+    def step(self, actions: list):
+        """
+        Executes the actions in the environment and records the transition.
+        Args:
+            actions: list[int] - list of actions to take.
+
+        Returns: what the environment's step returns
+
+        """
+        result = self.env.step(actions)
+        self.step_index += 1
+        self.record(actions, result[1], result[2], result[3]['acting_taxis'])
+        return result
+
+    def record(self, actions: list, rewards: list, done: bool, acting_taxis: list = None):
+        """
+        Appends the current state of the environment with the given transition data to the chunk, writing the chunk
+        if it is full.
+        Args:
+            actions: the joint action of the transition, None for a reset (recorded as -1)
+            rewards: the rewards of the transition as returned by step, None for a reset
+            done: the done flag of the transition
+            acting_taxis: the taxis of the rewards (see TaxiEnv.step), the other taxis get a NaN reward
+
+        """
+        row, env = self.num_rows, self.env
+        if env.compact_state:
+            self.state_rows[row] = env.state.record
+            values = []
+        else:
+            taxis_locations, fuels, passengers_start_locations, passengers_destinations, passengers_status = env.state
+            values = [*chain.from_iterable(taxis_locations), *fuels, *chain.from_iterable(passengers_start_locations),
+                      *chain.from_iterable(passengers_destinations), *passengers_status]
+        if actions is None:
+            actions = self.reset_actions
+        taxis_rewards = self.missing_rewards.copy()
+        if rewards:
+            for taxi, reward in zip(acting_taxis, rewards):
+                taxis_rewards[taxi] = reward
+        self.staging[row] = [*values, *env.collided.tolist(), *env.engine_status_list, *actions, *taxis_rewards, done,
+                             self.episode, self.step_index]
+
+        self.num_rows += 1
+        if self.num_rows == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the rows of the current chunk (in the background) and starts a new chunk.
+        """
+        if self.num_rows == 0:
+            return
+        self.wait()
+        for name, start, stop in self.staged_columns:
+            column = self.columns[name][:self.num_rows]
+            column[...] = self.staging[:self.num_rows, start:stop].reshape(column.shape)
+        chunk = self.buffer[:self.num_rows].copy()
+        self.chunks.append(self.num_rows)
+        self.pending = self.executor.submit(self.write_chunk, len(self.chunks) - 1, chunk)
+        self.num_rows = 0
+
+    def wait(self):
+        """
+        Waits for the chunk being written, raising its error if it failed.
+        """
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+
+    def write_chunk(self, index: int, chunk: np.array):
+        """
+        Writes a chunk (one file per column) and updates meta.json.
+        """
+        columns = {name: np.ascontiguousarray(chunk[name]) for name in chunk.dtype.names}
+        if self.compress:
+            np.savez_compressed(os.path.join(self.directory, 'chunk_{:06d}.npz'.format(index)), **columns)
+        else:
+            chunk_directory = os.path.join(self.directory, 'chunk_{:06d}'.format(index))
+            os.makedirs(chunk_directory, exist_ok=True)
+            for name, column in columns.items():
+                np.save(os.path.join(chunk_directory, name + '.npy'), column)
+
+        meta = {'version': FORMAT_VERSION, 'num_taxis': self.env.num_taxis,
+                'num_passengers': self.env.num_passengers, 'compress': self.compress,
+                'columns': list(chunk.dtype.names), 'chunks': self.chunks[:index + 1]}
+        path = os.path.join(self.directory, META_FILE)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(meta, file)
+        os.replace(path + '.tmp', path)
+
+    def close(self):
+        """
+        Writes the last chunk and waits for all the writes to end.
+        """
+        if self.closed:
+            return
+        self.flush()
+        self.wait()
+        self.executor.shutdown()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TrajectoryReader:
+    """
+    Reads the transitions written by TrajectoryRecorder, and restores them into a TaxiEnv.
+    Chunks of raw .npy files are memory-mapped, compressed chunks are loaded (and decompressed) when they are read.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: directory of the recording
+        """
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as file:
+            self.meta = json.load(file)
+        if self.meta['version'] != FORMAT_VERSION:
+            raise ValueError('Unsupported recording version: {}'.format(self.meta['version']))
+        self.num_taxis = self.meta['num_taxis']
+        self.num_passengers = self.meta['num_passengers']
+        self.column_names = self.meta['columns']
+        self.offsets = np.cumsum([0] + self.meta['chunks'])
+        self.cached_chunk = (None, None)
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def chunk(self, index: int) -> dict:
+        """
+        Returns: dictionary column name -> array of the rows of the chunk.
+
+        """
+        if self.cached_chunk[0] == index:
+            return self.cached_chunk[1]
+        if self.meta['compress']:
+            with np.load(os.path.join(self.directory, 'chunk_{:06d}.npz'.format(index))) as file:
+                columns = {name: file[name] for name in self.column_names}
+        else:
+            chunk_directory = os.path.join(self.directory, 'chunk_{:06d}'.format(index))
+            columns = {name: np.load(os.path.join(chunk_directory, name + '.npy'), mmap_mode='r')
+                       for name in self.column_names}
+        self.cached_chunk = (index, columns)
+        return columns
+
+    def column(self, name: str) -> np.array:
+        """
+        Returns: the whole column (all the chunks), e.g. reader.column('rewards') of shape [len(reader), num_taxis].
+
+        """
+        return np.concatenate([self.chunk(index)[name] for index in range(len(self.offsets) - 1)])
+
+    def episodes_starts(self) -> np.array:
+        """
+        Returns: the indexes of the rows recorded by reset.
+
+        """
+        return np.flatnonzero(self.column('step') == 0)
+
+    def __getitem__(self, index: int) -> dict:
+        """
+        Returns: dictionary column name -> value of the row at the given index.
+
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Row {} out of range of a recording of {} rows'.format(index, len(self)))
+        chunk_index = int(np.searchsorted(self.offsets, index, side='right')) - 1
+        columns = self.chunk(chunk_index)
+        return {name: np.array(column[index - self.offsets[chunk_index]]) for name, column in columns.items()}
+
+    def restore(self, env, index: int):
+        """
+        Restores the environment to the state after the transition of the given row.
+        Args:
+            env: a TaxiEnv with the number of taxis and passengers of the recording
+            index: index of the row
+
+        """
+        if (env.num_taxis, env.num_passengers) != (self.num_taxis, self.num_passengers):
+            raise ValueError('The recording has {} taxis and {} passengers, the environment {} and {}'.format(
+                self.num_taxis, self.num_passengers, env.num_taxis, env.num_passengers))
+        row = self[index]
+        state = [row[name].tolist() for name in STATE_FIELDS]
+        if env.compact_state:
+            env.array_state.assign(state)
+            env.state = env.array_state
+        else:
+            env.state = state
+        env.collided = row['collided'].astype(float)
+        env.engine_status_list = row['engine_status'].astype(float).tolist()
+        env.last_action = None if row['step'] == 0 else row['actions'].tolist()
+        env.rebuild_indexes()
+        if row['done'] and env.done_cause is None:
+            # Running out of fuel is the only cause that doesn't show in the state once a taxi refuels
+            env.done_cause = DONE_OUT_OF_FUEL
+
+    def rewards(self, index: int) -> list:
+        """
+        Returns: the rewards list of the transition of the given row, as returned by TaxiEnv.step (the rewards of the
+                 taxis that acted, by taxi index). The reward of each taxi is in the row's 'rewards' column.
+
+        """
+        rewards = self[index]['rewards']
+        return rewards[~np.isnan(rewards)].tolist()
+
+    def acting_taxis(self, index: int) -> list:
+        """
+        Returns: the taxis that acted in the transition of the given row (the taxis of the rewards list).
+
+        """
+        return np.flatnonzero(~np.isnan(self[index]['rewards'])).tolist()
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+
+# Colors of the taxis in the rendered map and status lines
+TAXIS_COLORS = ['yellow', 'red', 'white', 'green', 'cyan', 'crimson', 'gray', 'magenta'] * 5
+
+# ANSI escape sequences
+CLEAR_SCREEN = '\x1b[H\x1b[2J'
+CLEAR_LINE = '\x1b[2K'
+
+
+def move_cursor(row: int, col: int) -> str:
+    """
+    Returns the escape sequence moving the cursor to the given 0-based line and column of the frame.
+    """
+    return '\x1b[{};{}H'.format(row + 1, col + 1)
+
+
+class IncrementalRenderer:
+    """
+    Renders a TaxiEnv as ANSI frames that only redraw what changed since the previous frame.
+
+    The first frame clears the terminal and draws the whole map and status lines (the same text as
+    TaxiEnv.render('ansi')). The static map is never drawn again: every later frame moves the cursor to the map cells
+    and status lines that changed and rewrites only them, then parks the cursor below the frame. Writing the frames one
+    after the other to a terminal (or concatenating logged frames) reproduces the full renders.
+
+    Frames can be throttled with frame_skip (draw one of every frame_skip + 1 calls) and max_fps (drop the calls that
+    come sooner than 1 / max_fps seconds after the last drawn frame). The changes of the dropped frames are drawn by
+    the next drawn frame.
+    """
+
+    def __init__(self, env, max_fps: float = None, frame_skip: int = 0):
+        """
+        Args:
+            env: the TaxiEnv to render
+            max_fps: maximal number of frames drawn per second, no limit if None
+            frame_skip: number of calls skipped after each drawn frame
+        """
+        self.env = env
+        self.max_fps = max_fps
+        self.frame_skip = frame_skip
+        self.calls = 0
+        self.last_frame_time = None
+
+        # What the terminal shows: None before the first (full) frame
+        self.cells = None
+        self.status = None
+
+    def reset(self):
+        """
+        Forgets the displayed frame, so the next frame is a full redraw (e.g. after the terminal was cleared).
+        """
+        self.cells = None
+        self.status = None
+
+    def should_render(self) -> bool:
+        """
+        Applies the frame skip and FPS throttles to a render call.
+
+        Returns: whether this call draws a frame
+
+        """
+        self.calls += 1
+        if (self.calls - 1) % (self.frame_skip + 1):
+            return False
+        if self.max_fps and self.last_frame_time is not None and \
+                time.perf_counter() - self.last_frame_time < 1 / self.max_fps:
+            return False
+        return True
+
+    def frame(self) -> str:
+        """
+        Builds the escape sequences turning the displayed frame into the frame of the current state (a full frame
+        if nothing is displayed yet).
+
+        Returns: the ANSI text of the frame
+
+        """
+        map_lines = self.env.get_map_lines()
+        cells = self.env.render_overlays()
+        status = self.env.render_status()
+        status_row = len(map_lines)
+
+        if self.cells is None:
+            out = [list(line) for line in map_lines]
+            for (row, col), cell in cells.items():
+                out[1 + row][2 * col + 1] = cell
+            text = CLEAR_SCREEN + ''.join(''.join(line) + '\n' for line in out + status)
+        else:
+            changes = []
+            for location in self.cells.keys() - cells.keys():  # Cells that went back to the static map
+                row, col = location
+                changes.append((location, map_lines[1 + row][2 * col + 1]))
+            changes.extend((location, cell) for location, cell in cells.items() if self.cells.get(location) != cell)
+            parts = [move_cursor(1 + row, 2 * col + 1) + cell for (row, col), cell in sorted(changes)]
+
+            for index in range(max(len(status), len(self.status))):
+                line = status[index] if index < len(status) else ''
+                if index >= len(self.status) or line != self.status[index]:
+                    parts.append(move_cursor(status_row + index, 0) + CLEAR_LINE + line)
+            text = ''.join(parts) + move_cursor(status_row + len(status), 0) if parts else ''
+
+        self.cells, self.status = cells, status
+        return text
+
+    def render(self, outfile=None) -> str:
+        """
+        Draws a frame unless the call is throttled.
+        Args:
+            outfile: file to write the frame to (e.g. sys.stdout), the frame is returned instead if None
+
+        Returns: the ANSI text of the frame if outfile is None, an empty string for throttled calls
+
+        """
+        if not self.should_render():
+            return None if outfile else ''
+        self.last_frame_time = time.perf_counter()
+        text = self.frame()
+        if outfile is None:
+            return text
+        outfile.write(text)
+        outfile.flush()
+
+
+# RGB colors of the rgb_array mode
+RGB_COLORS = {'yellow': (255, 215, 0), 'red': (220, 40, 40), 'white': (245, 245, 245), 'green': (40, 180, 70),
+              'cyan': (0, 200, 220), 'crimson': (150, 0, 40), 'gray': (128, 128, 128), 'magenta': (230, 0, 230),
+              'blue': (40, 90, 255)}
+ROAD_COLOR = (40, 40, 40)
+LANE_COLOR = (70, 70, 70)
+WALL_COLOR = (200, 200, 200)
+PICKUP_COLOR = (110, 90, 60)
+FUEL_STATIONS_COLORS = {'F': (200, 120, 0), 'G': (0, 130, 130)}
+OTHER_CELL_COLOR = (90, 60, 120)
+COLLIDED_TAXI_COLOR = (90, 90, 90)
+
+
+class RgbRenderer:
+    """
+    Renders a TaxiEnv as RGB images, composed from a precomputed atlas of tiles.
+
+    Every cell of the map is a tile_size x tile_size square, and the columns are separated by thin stripes (a wall for
+    '|', a lane marking for ':'). The background image of the map (roads, walls, pickup spots, fuel stations of each
+    type) is drawn once. A frame then restores the background of the cells that had overlays in the previous frame and
+    blits the overlays of the current state on top of it, in this order: waiting passengers (blue disk), taxis (a
+    square in the taxi's color, gray when collided), passengers on board (blue dot on the taxi) and destinations
+    (magenta frame).
+
+    The frame is drawn in a preallocated buffer which is returned by render and overwritten by the next frame - copy it
+    to keep it.
+    """
+
+    def __init__(self, env, tile_size: int = 16):
+        """
+        Args:
+            env: the TaxiEnv to render
+            tile_size: size in pixels of the square of a cell
+        """
+        self.env = env
+        self.tile_size = size = tile_size
+        self.separator_size = separator = max(1, tile_size // 4)
+        num_rows, num_columns = env.num_rows, env.num_columns
+
+        # Tile atlas: the background tiles of the cells, then the overlays with their masks
+        yy, xx = np.mgrid[:size, :size] + 0.5 - size / 2
+        radius = np.hypot(yy, xx)
+        square = np.maximum(np.abs(yy), np.abs(xx))
+        tiles, masks = [], []
+
+        def add_tile(color, mask=None) -> int:
+            tiles.append(np.broadcast_to(np.asarray(color, dtype=np.uint8), (size, size, 3)))
+            masks.append(np.ones((size, size), dtype=bool) if mask is None else mask)
+            return len(tiles) - 1
+
+        self.road_tile = add_tile(ROAD_COLOR)
+        self.pickup_tile = add_tile(PICKUP_COLOR)
+        self.other_cell_tile = add_tile(OTHER_CELL_COLOR)
+        self.fuel_stations_tiles = {fuel_type: add_tile(color) for fuel_type, color in FUEL_STATIONS_COLORS.items()}
+        self.passenger_tile = add_tile(RGB_COLORS['blue'], radius <= size * 0.25)
+        taxi_mask = square <= size * 0.32
+        self.taxis_tiles = np.asarray([add_tile(RGB_COLORS[color], taxi_mask) for color in TAXIS_COLORS])
+        self.collided_taxi_tile = add_tile(COLLIDED_TAXI_COLOR, taxi_mask)
+        self.on_board_tile = add_tile(RGB_COLORS['blue'], radius <= size * 0.15)
+        self.destination_tile = add_tile(RGB_COLORS['magenta'], np.abs(square - size * 0.42) <= max(0.5, size * 0.05))
+        self.atlas = np.stack(tiles)
+        self.masks = np.stack(masks)
+
+        # Background tile of every cell
+        self.cell_tiles = np.full((num_rows, num_columns), self.road_tile, dtype=np.intp)
+        self.cell_tiles[env.cell_types == 'X'] = self.pickup_tile
+        for fuel_type, fuel_tile in self.fuel_stations_tiles.items():
+            self.cell_tiles[env.cell_types == fuel_type] = fuel_tile
+        self.cell_tiles[~np.isin(env.cell_types, [' ', 'X'] + list(self.fuel_stations_tiles))] = self.other_cell_tile
+
+        # Frame buffer and its pixels as flat 3-byte elements, and the frame's pixels as the start of a row of a tile
+        # (overlapping elements of tile_size pixels), to copy whole rows of tiles at once. The cells are addressed by
+        # the index of their first pixel, and the pixels of a tile by their offset from there.
+        height = num_rows * size + 2 * separator
+        width = num_columns * (size + separator) + separator
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.pixels = self.frame.reshape(-1).view('V3')
+        self.tile_rows = self.rows_view(self.frame)
+        rows, cols = np.mgrid[:num_rows, :num_columns]
+        self.cells_origins = ((separator + rows * size) * width + separator + cols * (size + separator)).ravel()
+        ys, xs = np.mgrid[:size, :size]
+        self.tile_offsets = ys * width + xs
+        self.rows_offsets = np.arange(size) * width
+
+        # Background image: walls all around, the separators between the columns and the cells' tiles
+        self.background = np.empty_like(self.frame)
+        self.background[...] = WALL_COLOR
+        separators = env.desc[1:-1, 2:-1:2].view(np.uint8) == ord(':')
+        for col in range(num_columns - 1):
+            x = separator + col * (size + separator) + size
+            colors = np.where(separators[:, col, None], np.asarray(LANE_COLOR), np.asarray(WALL_COLOR))
+            self.background[separator:-separator, x:x + separator] = np.repeat(colors, size, axis=0)[:, None]
+        row_stride, col_stride, channel_stride = self.background.strides
+        cells = np.lib.stride_tricks.as_strided(
+            self.background[separator:, separator:], shape=(num_rows, num_columns, size, size, 3),
+            strides=(size * row_stride, (size + separator) * col_stride, row_stride, col_stride, channel_stride))
+        cells[...] = self.atlas[self.cell_tiles]
+        self.background_rows = self.rows_view(self.background)
+        self.frame[...] = self.background
+
+        # Overlays as the offsets and the values of the pixels they cover
+        self.passenger_overlay = self.overlay(self.passenger_tile)
+        self.on_board_overlay = self.overlay(self.on_board_tile)
+        self.destination_overlay = self.overlay(self.destination_tile)
+        self.taxis_offsets = self.overlay(self.collided_taxi_tile)[0]
+        # The colors of the taxis, and the color of the collided taxis last
+        self.taxis_colors = np.stack([self.overlay(tile)[1] for tile in self.taxis_tiles] +
+                                     [self.overlay(self.collided_taxi_tile)[1]])
+
+        # Cells (flat indexes) covered by overlays in the current frame
+        self.dirty_cells = np.zeros(0, dtype=np.intp)
+
+    def rows_view(self, image: np.array) -> np.array:
+        """
+        Returns: a view of the image where element i is the row of tile_size pixels starting at pixel i.
+
+        """
+        num_pixels = image.shape[0] * image.shape[1]
+        return np.ndarray((num_pixels - self.tile_size + 1,), dtype='V{}'.format(3 * self.tile_size), buffer=image,
+                          strides=(3,))
+
+    def overlay(self, tile: int) -> (np.array, np.array):
+        """
+        Returns: the offsets (from the cell's first pixel) of the pixels covered by the tile's mask, and their values.
+
+        """
+        mask = self.masks[tile]
+        return self.tile_offsets[mask], np.ascontiguousarray(self.atlas[tile][mask]).view('V3').ravel()
+
+    def reset(self):
+        """
+        Redraws the whole background at the next frame (e.g. after the frame buffer was modified).
+        """
+        self.frame[...] = self.background
+        self.dirty_cells = np.zeros(0, dtype=np.intp)
+
+    def blit(self, cells: np.array, offsets: np.array, values: np.array):
+        """
+        Draws an overlay over cells of the frame.
+        Args:
+            cells: flat indexes (row * num_columns + col) of the cells, shape [K]
+            offsets: offsets of the overlay's pixels from the cells' first pixel, shape [M]
+            values: values of the overlay's pixels, shape [M] (or [K, M] for an overlay per cell)
+
+        """
+        self.pixels[self.cells_origins[cells][:, None] + offsets] = values
+
+    def render(self) -> np.array:
+        """
+        Draws the frame of the current state of the environment.
+
+        Returns: the frame buffer, an array of shape [height, width, 3] and dtype uint8
+
+        """
+        taxis, _, passengers_start_locations, destinations, passengers_status = self.env.state
+        num_columns = self.cell_tiles.shape[1]
+        taxis = np.asarray(taxis, dtype=np.intp).reshape(-1, 2) @ [num_columns, 1]
+        starts = np.asarray(passengers_start_locations, dtype=np.intp).reshape(-1, 2) @ [num_columns, 1]
+        destinations = np.asarray(destinations, dtype=np.intp).reshape(-1, 2) @ [num_columns, 1]
+        passengers_status = np.asarray(passengers_status, dtype=np.intp)
+        collided = np.asarray(self.env.collided, dtype=bool)
+
+        # Restoring the background of the previous overlays, row by row of their tiles
+        dirty_rows = self.cells_origins[self.dirty_cells][:, None] + self.rows_offsets
+        self.tile_rows[dirty_rows] = self.background_rows[dirty_rows]
+
+        on_board = passengers_status > 0
+        self.blit(starts[~on_board], *self.passenger_overlay)
+        # The taxis cycle through the colors, the last one being the color of the collided taxis
+        num_colors = len(self.taxis_colors) - 1
+        self.blit(taxis, self.taxis_offsets,
+                  self.taxis_colors[np.where(collided, num_colors, np.arange(len(taxis)) % num_colors)])
+        self.blit(taxis[passengers_status[on_board] - 1], *self.on_board_overlay)
+        self.blit(destinations, *self.destination_overlay)
+
+        self.dirty_cells = np.unique(np.concatenate([taxis, starts, destinations]))
+        return self.frame
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+STATE_FIELDS = ['taxis_locations', 'fuels', 'passengers_start_locations', 'passengers_destinations',
+                'passengers_status']
+
+
+def state_dtype(num_taxis: int, num_passengers: int, max_fuel: list = None) -> np.dtype:
+    """
+    Builds the fixed-dtype record holding a whole TaxiEnv state:
+        - int16 coordinates for taxis, passengers start locations and destinations.
+        - int32 fuel when all the taxis have a finite integer max fuel, float32 otherwise (np.inf fuel).
+        - int8 passengers status (int16 when there are too many taxis to fit in int8).
+    Args:
+        num_taxis: number of taxis in the domain
+        num_passengers: number of passengers in the domain
+        max_fuel: list of max fuel of each taxi
+
+    Returns: numpy structured dtype with a field per state component
+
+    """
+    if max_fuel is not None and all(np.isfinite(fuel) and float(fuel).is_integer() for fuel in max_fuel):
+        fuel_dtype = np.int32
+    else:
+        fuel_dtype = np.float32
+    status_dtype = np.int8 if num_taxis < np.iinfo(np.int8).max else np.int16
+
+    return np.dtype([('taxis_locations', np.int16, (num_taxis, 2)),
+                     ('fuels', fuel_dtype, (num_taxis,)),
+                     ('passengers_start_locations', np.int16, (num_passengers, 2)),
+                     ('passengers_destinations', np.int16, (num_passengers, 2)),
+                     ('passengers_status', status_dtype, (num_passengers,))])
+
+
+class StateField:
+    """
+    List-compatible view over one component of an ArrayState.
+    Reading an element returns plain python values (a [row, col] list for coordinates, a number otherwise), and
+    assigning an element writes directly into the underlying array, so code written against the nested-list state
+    keeps working.
+    """
+
+    def __init__(self, array: np.array):
+        """
+        Args:
+            array: the numpy array (a view of the state record) backing this field
+        """
+        self.array = array
+        self.scalar = array.ndim == 1  # Elements are numbers rather than coordinates
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def __getitem__(self, index):
+        if self.scalar and type(index) is int:
+            return self.array.item(index)
+        return self.array[index].tolist()
+
+    def __setitem__(self, index, value):
+        self.array[index] = value
+
+    def __iter__(self):
+        return iter(self.array.tolist())
+
+    def __eq__(self, other) -> bool:
+        return self.tolist() == list(other)
+
+    def __add__(self, other) -> list:
+        return self.tolist() + list(other)
+
+    def __radd__(self, other) -> list:
+        return list(other) + self.tolist()
+
+    def __array__(self, dtype=None, copy=None) -> np.array:
+        return np.asarray(self.array, dtype=dtype)
+
+    def __repr__(self) -> str:
+        return repr(self.tolist())
+
+    def tolist(self) -> list:
+        return self.array.tolist()
+
+
+class ArrayState:
+    """
+    Compact TaxiEnv state kept in a single preallocated numpy record (see state_dtype).
+    It behaves like the list [taxis_locations, fuels, passengers_start_locations, passengers_destinations,
+    passengers_status]: it can be indexed, unpacked and compared to lists, each component being a StateField.
+    """
+
+    def __init__(self, num_taxis: int, num_passengers: int, max_fuel: list = None, record: np.array = None):
+        """
+        Args:
+            num_taxis: number of taxis in the domain
+            num_passengers: number of passengers in the domain
+            max_fuel: list of max fuel of each taxi, used to choose the fuel dtype
+            record: an existing 0-d record (of state_dtype) to wrap instead of allocating a new one
+        """
+        if record is None:
+            record = np.zeros((), dtype=state_dtype(num_taxis, num_passengers, max_fuel))
+        self.record = record
+        self.fields = [StateField(record[name]) for name in STATE_FIELDS]
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def __getitem__(self, index):
+        return self.fields[index]
+
+    def __setitem__(self, index, value):
+        self.fields[index].array[...] = value
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __eq__(self, other) -> bool:
+        return self.tolist() == [list(component) for component in other]
+
+    def __repr__(self) -> str:
+        return repr(self.tolist())
+
+    def __copy__(self):
+        return ArrayState(0, 0, record=self.record.copy())
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    def assign(self, state: list):
+        """
+        Writes a nested-list (or another ArrayState) state into the preallocated record.
+        Args:
+            state: [taxis_locations, fuels, passengers_start_locations, passengers_destinations, passengers_status]
+
+        """
+        for field, component in zip(self.fields, state):
+            field.array[...] = component
+
+    def tolist(self) -> list:
+        """
+        Returns: the state as nested python lists, in the original TaxiEnv.state format.
+
+        """
+        return [field.tolist() for field in self.fields]
+
+    def passengers_information(self) -> np.array:
+        """
+        Returns: the flat passengers block of the observations (start coordinates, destinations, status).
+
+        """
+        return np.concatenate([self.record['passengers_start_locations'].ravel(),
+                               self.record['passengers_destinations'].ravel(),
+                               self.record['passengers_status']]).astype(float)
+
+    def observation(self, agent_index: int, passengers_information: np.array = None) -> np.array:
+        """
+        Builds the observation of a single taxi in the TaxiEnv.get_observation layout.
+        Args:
+            agent_index: index of the taxi
+            passengers_information: precomputed passengers block, to share it between the taxis
+
+        Returns: array of shape [1, obs_dim]
+
+        """
+        if passengers_information is None:
+            passengers_information = self.passengers_information()
+        observation = np.empty(3 + len(passengers_information))
+        observation[:2] = self.record['taxis_locations'][agent_index]
+        observation[2] = self.record['fuels'][agent_index]
+        observation[3:] = passengers_information
+        return observation.reshape(1, -1)
+
+
+class StateEncoder:
+    """
+    Bijective mixed-radix encoding of the full TaxiEnv state into a single integer, in the spirit of gym's Taxi
+    state. The digits, from the most significant, are:
+        - the cell of each taxi (num_rows * num_columns values).
+        - the fuel consumed by each taxi (max_fuel + 1 values, a single value for taxis with infinite fuel).
+        - the cell of each passenger start location (num_rows * num_columns values, as passengers can be dropped
+          anywhere).
+        - the pickup spot of each passenger destination (one value per pickup spot of the map).
+        - the status of each passenger (num_taxis + 2 values: waiting, in taxi 1, ..., in taxi num_taxis, delivered).
+        - whether the engine of each taxi is off (2 values if engines can be turned off, i.e. with option_to_stand_by).
+        - the collided flag of each taxi (2 values in collision sensitive domains without option_to_stand_by).
+    A digit of 0 is the value of a reset (full fuel, waiting passengers, engines on and no collisions).
+    Only configurations with less than 2 ** 63 states can be encoded. The batch methods encode and decode arrays of
+    states at once.
+    """
+
+    def __init__(self, env):
+        """
+        Args:
+            env: the TaxiEnv whose states are encoded
+        """
+        num_taxis, num_passengers = env.num_taxis, env.num_passengers
+        self.num_taxis, self.num_passengers = num_taxis, num_passengers
+        self.num_columns = env.num_columns
+        num_cells = env.num_rows * env.num_columns
+
+        self.max_fuel = np.asarray(env.max_fuel[:num_taxis], dtype=float)
+        self.finite_fuel = np.isfinite(self.max_fuel)
+        self.finite_max_fuel = np.where(self.finite_fuel, self.max_fuel, 0)
+        if not all(float(fuel).is_integer() for fuel in self.max_fuel[self.finite_fuel]):
+            raise ValueError('Only integer or infinite max fuel can be encoded, got {}'.format(env.max_fuel))
+
+        # Index of the pickup spot of each cell (-1 for other cells)
+        self.pickup_locations = np.array(env.passengers_locations).reshape(-1, 2)
+        self.pickup_index = np.full(num_cells, -1)
+        self.pickup_index[self.pickup_locations[:, 0] * self.num_columns + self.pickup_locations[:, 1]] = \
+            np.arange(len(self.pickup_locations))
+
+        engine_values = 2 if env.option_to_standby else 1
+        collided_values = 2 if env.collision_sensitive_domain and not env.option_to_standby else 1
+        radices = ([num_cells] * num_taxis + np.where(self.finite_fuel, self.max_fuel + 1, 1).astype(int).tolist() +
+                   [num_cells] * num_passengers + [len(self.pickup_locations)] * num_passengers +
+                   [num_taxis + 2] * num_passengers + [engine_values] * num_taxis + [collided_values] * num_taxis)
+        self.num_states = int(np.prod(radices, dtype=object))
+        if self.num_states >= 2 ** 63:
+            raise ValueError('The domain has {} states, too many to be encoded in 64 bits'.format(self.num_states))
+        self.radices = np.array(radices, dtype=np.int64)
+        # Weight of each digit: the product of the radices of the less significant digits
+        self.weights = np.append(np.cumprod(self.radices[:0:-1])[::-1], 1).astype(np.int64)
+
+    def encode_batch(self, taxis_locations: np.array, fuels: np.array, passengers_start_locations: np.array,
+                     passengers_destinations: np.array, passengers_status: np.array, engine_status: np.array,
+                     collided: np.array) -> np.array:
+        """
+        Encodes N states, given as stacked arrays (in the BatchedTaxiEnv layout).
+        Args:
+            taxis_locations: [N, num_taxis, 2]
+            fuels: [N, num_taxis]
+            passengers_start_locations: [N, num_passengers, 2]
+            passengers_destinations: [N, num_passengers, 2]
+            passengers_status: [N, num_passengers]
+            engine_status: [N, num_taxis]
+            collided: [N, num_taxis]
+
+        Returns: int64 array of shape [N]
+
+        """
+        taxis_locations, passengers_start_locations, passengers_destinations = (
+            np.asarray(locations, dtype=np.int64) for locations in
+            [taxis_locations, passengers_start_locations, passengers_destinations])
+        destinations = self.pickup_index[passengers_destinations[:, :, 0] * self.num_columns +
+                                         passengers_destinations[:, :, 1]]
+        digits = np.concatenate([taxis_locations[:, :, 0] * self.num_columns + taxis_locations[:, :, 1],
+                                 np.where(self.finite_fuel, self.finite_max_fuel - fuels, 0),
+                                 passengers_start_locations[:, :, 0] * self.num_columns +
+                                 passengers_start_locations[:, :, 1],
+                                 destinations,
+                                 np.asarray(passengers_status) % (self.num_taxis + 2),
+                                 ~np.asarray(engine_status, dtype=bool),
+                                 np.asarray(collided, dtype=bool)], axis=1).astype(np.int64)
+        if ((digits < 0) | (digits >= self.radices)).any():
+            raise ValueError('The states are out of the encoded domain')
+        return digits @ self.weights
+
+    def decode_batch(self, states: np.array) -> tuple:
+        """
+        Decodes N states encoded by encode_batch.
+        Args:
+            states: integer array of shape [N]
+
+        Returns: (taxis_locations, fuels, passengers_start_locations, passengers_destinations, passengers_status,
+                 engine_status, collided) arrays, in the shapes of encode_batch's arguments
+
+        """
+        digits = np.asarray(states, dtype=np.int64)[:, None] // self.weights % self.radices
+        num_taxis, num_passengers = self.num_taxis, self.num_passengers
+        taxis_cells, fuels, starts_cells, destinations, passengers_status, engine_status, collided = np.split(
+            digits, np.cumsum([num_taxis, num_taxis, num_passengers, num_passengers, num_passengers, num_taxis]),
+            axis=1)
+        taxis_locations = np.stack(np.divmod(taxis_cells, self.num_columns), axis=2)
+        passengers_start_locations = np.stack(np.divmod(starts_cells, self.num_columns), axis=2)
+        fuels = self.max_fuel - fuels
+        if self.finite_fuel.all():
+            fuels = fuels.astype(np.int64)
+        passengers_status[passengers_status == num_taxis + 1] = -1
+        return (taxis_locations, fuels, passengers_start_locations, self.pickup_locations[destinations],
+                passengers_status, engine_status == 0, collided.astype(bool))
+
+    def encode(self, state: list, engine_status: list, collided: list) -> int:
+        """
+        Encodes a single state.
+        Args:
+            state: state of the domain (list or ArrayState)
+            engine_status: engine status of each taxi
+            collided: collided flag of each taxi
+
+        Returns: the integer of the state
+
+        """
+        components = [np.asarray(component)[None] for component in state]
+        return int(self.encode_batch(*components, np.asarray(engine_status)[None], np.asarray(collided)[None])[0])
+
+    def decode(self, s: int) -> (list, list, list):
+        """
+        Decodes a single state.
+        Args:
+            s: the integer of the state
+
+        Returns: the state (in the TaxiEnv.state list format), the engine status and the collided flag of each taxi
+
+        """
+        if not 0 <= s < self.num_states:
+            raise ValueError('State {} out of range of the {} states of the domain'.format(s, self.num_states))
+        components = [component[0].tolist() for component in self.decode_batch(np.array([s]))]
+        return components[:5], components[5], components[6]
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing as mp
+import numpy as np
+from .batched_taxi_environment import BatchedTaxiEnv
+
+
+def shared_array(context, shape: tuple, dtype) -> (object, np.array):
+    """
+    Allocates a shared-memory buffer and a numpy array of the given shape and dtype backed by it.
+
+    Returns: the raw shared buffer (to pass to the workers) and the numpy view
+
+    """
+    dtype = np.dtype(dtype)
+    raw = context.RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+    return raw, np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def worker(pipe, parent_pipe, buffers: dict, shapes: dict, start: int, stop: int, env_kwargs: dict):
+    """
+    Worker process loop, owning the environments [start, stop) as a BatchedTaxiEnv.
+    Actions are read from and results are written to the shared buffers, the pipe only carries the commands.
+    """
+    parent_pipe.close()
+    arrays = {name: np.frombuffer(raw, dtype=shapes[name][1]).reshape(shapes[name][0])[start:stop]
+              for name, raw in buffers.items()}
+    env = BatchedTaxiEnv(stop - start, **env_kwargs)
+    try:
+        while True:
+            command, data = pipe.recv()
+            if command == 'step':
+                observations, rewards, dones, info = env.step(arrays['actions'])
+                arrays['observations'][...] = observations
+                arrays['rewards'][...] = rewards
+                arrays['dones'][...] = dones
+                if 'final_observations' in info:
+                    arrays['final_observations'][...] = info['final_observations']
+                pipe.send('final_observations' in info)
+            elif command == 'reset':
+                arrays['observations'][...] = env.reset()
+                pipe.send(None)
+            elif command == 'seed':
+                pipe.send(env.seed(data))
+            elif command == 'close':
+                break
+            else:
+                raise ValueError('Unknown command: {}'.format(command))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        pipe.close()
+
+
+class SubprocTaxiVecEnv:
+    """
+    Runs N taxi environments in worker processes, each worker stepping its shard of the environments as a
+    BatchedTaxiEnv.
+
+    Actions [N, num_taxis], observations [N, num_taxis, obs_dim] (the TaxiEnv.get_observation layout), rewards
+    [N, num_taxis] and dones [N] are exchanged through preallocated shared-memory buffers, so only short commands go
+    through the pipes. The arrays returned by reset/step are views of these buffers, and are overwritten by the next
+    call - copy them to keep them.
+    """
+
+    def __init__(self, num_envs: int, num_workers: int = None, start_method: str = None, **env_kwargs):
+        """
+        Args:
+            num_envs: total number of environments
+            num_workers: number of worker processes (the number of cores by default, at most num_envs)
+            start_method: multiprocessing start method ('fork', 'spawn', 'forkserver'), the platform's default if None
+            env_kwargs: arguments of BatchedTaxiEnv/TaxiEnv (num_taxis, num_passengers, domain_map...)
+        """
+        num_workers = min(num_envs, num_workers or mp.cpu_count())
+        context = mp.get_context(start_method)
+
+        # A single environment tells the spaces and the observation size
+        env = BatchedTaxiEnv(1, **env_kwargs)
+        self.num_envs = num_envs
+        self.num_taxis = env.num_taxis
+        self.action_space = env.action_space
+        obs_dim = env.get_observations().shape[-1]
+
+        shapes = {'actions': ((num_envs, self.num_taxis), np.int64),
+                  'observations': ((num_envs, self.num_taxis, obs_dim), np.float64),
+                  'final_observations': ((num_envs, self.num_taxis, obs_dim), np.float64),
+                  'rewards': ((num_envs, self.num_taxis), np.float64),
+                  'dones': ((num_envs,), np.bool_)}
+        buffers = {}
+        for name, (shape, dtype) in shapes.items():
+            buffers[name], array = shared_array(context, shape, dtype)
+            setattr(self, name, array)
+
+        self.pipes, self.processes = [], []
+        bounds = np.linspace(0, num_envs, num_workers + 1).astype(int)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            pipe, worker_pipe = context.Pipe()
+            process = context.Process(target=worker, args=(worker_pipe, pipe, buffers, shapes, start, stop,
+                                                           env_kwargs), daemon=True)
+            process.start()
+            worker_pipe.close()
+            self.pipes.append(pipe)
+            self.processes.append(process)
+
+        self.waiting = False
+        self.closed = False
+
+    def seed(self, seed=None) -> list:
+        """
+        Seeds the workers with independent random streams derived from the given seed.
+        Args:
+            seed: seed to use
+
+        Returns: list of the seeds of the workers
+
+        """
+        seeds = np.random.SeedSequence(seed).spawn(len(self.pipes))
+        for pipe, seed_sequence in zip(self.pipes, seeds):
+            pipe.send(('seed', int(seed_sequence.generate_state(1)[0])))
+        return [pipe.recv()[0] for pipe in self.pipes]
+
+    def reset(self) -> np.array:
+        """
+        Resets all the environments.
+
+        Returns: observations [N, num_taxis, obs_dim]
+
+        """
+        for pipe in self.pipes:
+            pipe.send(('reset', None))
+        for pipe in self.pipes:
+            pipe.recv()
+        return self.observations
+
+    def step_async(self, actions: np.array):
+        """
+        Sends the actions [N, num_taxis] to the workers without waiting for the results.
+        """
+        self.actions[...] = np.asarray(actions).reshape(self.actions.shape)
+        for pipe in self.pipes:
+            pipe.send(('step', None))
+        self.waiting = True
+
+    def step_wait(self) -> (np.array, np.array, np.array, dict):
+        """
+        Waits for the results of the last step_async call.
+
+        Returns: observations, rewards, dones and an info dictionary - see BatchedTaxiEnv.step.
+
+        """
+        any_final = [pipe.recv() for pipe in self.pipes]
+        self.waiting = False
+        info = {}
+        if any(any_final):
+            info['final_observations'] = np.where(self.dones[:, None, None], self.final_observations, np.nan)
+        return self.observations, self.rewards, self.dones, info
+
+    def step(self, actions: np.array) -> (np.array, np.array, np.array, dict):
+        """
+        Steps all the environments synchronously, see step_async and step_wait.
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        """
+        Stops the workers.
+        """
+        if self.closed:
+            return
+        if self.waiting:
+            for pipe in self.pipes:
+                pipe.recv()
+        for pipe in self.pipes:
+            try:
+                pipe.send(('close', None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process, pipe in zip(self.processes, self.pipes):
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            pipe.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+from collections import namedtuple
+import numpy as np
+from .batched_taxi_environment import BatchedTaxiEnv
+
+# Deterministic transition model over the integer encoded states (see TaxiEnv.encode) and the joint actions:
+#   next_states: [num_states, num_joint_actions] int64 - the state after the joint action
+#   rewards:     [num_states, num_joint_actions, num_taxis] float32 - reward of each taxi (0 for taxis that can't act)
+#   dones:       [num_states, num_joint_actions] bool - whether the episode is done after the transition
+#   actions:     [num_joint_actions, num_taxis] - the action of each taxi in each joint action
+TransitionModel = namedtuple('TransitionModel', ['next_states', 'rewards', 'dones', 'actions'])
+
+
+def joint_actions(env) -> np.array:
+    """
+    Enumerates the joint actions of the available actions of the domain, the action of the first taxi being the most
+    significant.
+    Args:
+        env: a TaxiEnv
+
+    Returns: array of shape [num_available_actions ** num_taxis, num_taxis] of action codes
+
+    """
+    return np.array(list(itertools.product(env.available_actions_indexes, repeat=env.num_taxis)),
+                    dtype=np.int64).reshape(-1, env.num_taxis)
+
+
+def transition_model_size(env) -> (int, int, int):
+    """
+    Computes the size of the transition model of a domain without building it.
+    Args:
+        env: a TaxiEnv
+
+    Returns: the number of states, the number of joint actions and the number of bytes of the model
+
+    """
+    if env.arrival_process is not None:
+        raise ValueError('The transition model of a domain with passenger arrivals is not deterministic')
+    num_states = env.num_states
+    num_joint_actions = len(env.available_actions_indexes) ** env.num_taxis
+    bytes_per_transition = 8 + 4 * env.num_taxis + 1
+    return num_states, num_joint_actions, num_states * num_joint_actions * bytes_per_transition
+
+
+def build_transition_model(env, max_bytes: int = 2 ** 30, batch_size: int = 2 ** 16) -> TransitionModel:
+    """
+    Builds the transition model of every (state, joint action) pair of a domain, by decoding the states into a
+    BatchedTaxiEnv and stepping batch_size transitions at once.
+    The model enumerates all the encoded states, including states a reset can't reach. Transitions follow
+    BatchedTaxiEnv.step: rewards of taxis that can't act are 0, and done marks the transitions that end the episode or
+    start from a terminal state.
+    Args:
+        env: a TaxiEnv
+        max_bytes: the model is refused (ValueError) if it would take more bytes
+        batch_size: number of transitions stepped at once
+
+    Returns: TransitionModel of the domain
+
+    """
+    num_states, num_joint_actions, num_bytes = transition_model_size(env)
+    if num_bytes > max_bytes:
+        raise ValueError('The transition model of {} states and {} joint actions takes {} bytes, more than max_bytes '
+                         '({})'.format(num_states, num_joint_actions, num_bytes, max_bytes))
+
+    encoder = env.get_state_encoder()
+    actions = joint_actions(env)
+    next_states = np.empty((num_states, num_joint_actions), dtype=np.int64)
+    rewards = np.empty((num_states, num_joint_actions, env.num_taxis), dtype=np.float32)
+    dones = np.empty((num_states, num_joint_actions), dtype=bool)
+
+    # Every batch steps all the joint actions of states_per_batch states
+    states_per_batch = max(1, min(num_states, batch_size // num_joint_actions))
+    batched_env = BatchedTaxiEnv(states_per_batch * num_joint_actions, num_taxis=env.num_taxis,
+                                 num_passengers=env.num_passengers, max_fuel=env.max_fuel, domain_map=env.desc,
+                                 taxis_capacity=env.taxis_capacity,
+                                 collision_sensitive_domain=env.collision_sensitive_domain,
+                                 fuel_type_list=env.fuel_type_list, option_to_stand_by=env.option_to_standby,
+                                 auto_reset=False)
+    batched_env.rewards_table = np.asarray(env.rewards_table, dtype=float)
+    batch_actions = np.tile(actions, (states_per_batch, 1))
+
+    for start in range(0, num_states, states_per_batch):
+        states = np.arange(start, start + states_per_batch) % num_states  # The last batch wraps around
+        components = [np.repeat(component, num_joint_actions, axis=0) for component in encoder.decode_batch(states)]
+        (batched_env.taxis_locations[...], batched_env.fuels[...], batched_env.passengers_start_locations[...],
+         batched_env.passengers_destinations[...], batched_env.passengers_status[...], batched_env.engine_status[...],
+         batched_env.collided[...]) = components
+        # The episode of a terminal state is already done (as in TaxiEnv, once the state is set)
+        batched_env.dones[...] = ((batched_env.passengers_status == -1).all(axis=1) | batched_env.collided.all(axis=1) |
+                                  (batched_env.fuels == 0).all(axis=1))
+        batched_env.rebuild_occupancy()
+
+        _, batch_rewards, batch_dones, _ = batched_env.step(batch_actions)
+
+        end = min(start + states_per_batch, num_states)
+        size = (end - start) * num_joint_actions
+        next_states[start:end] = encoder.encode_batch(
+            batched_env.taxis_locations[:size], batched_env.fuels[:size],
+            batched_env.passengers_start_locations[:size], batched_env.passengers_destinations[:size],
+            batched_env.passengers_status[:size], batched_env.engine_status[:size],
+            batched_env.collided[:size]).reshape(-1, num_joint_actions)
+        rewards[start:end] = batch_rewards[:size].reshape(-1, num_joint_actions, env.num_taxis)
+        dones[start:end] = batch_dones[:size].reshape(-1, num_joint_actions)
+
+    return TransitionModel(next_states, rewards, dones, actions)
@@ -3,15 +3,51 @@
 # TODO - Write unit tests for all functions
 
 import sys
+import pickle
+from time import perf_counter
 
 import gym
-from contextlib import closing
+from collections import namedtuple
+from contextlib import closing, contextmanager
 from io import StringIO
 from gym import utils
 from gym.utils import seeding
 import numpy as np
-import random
+from bisect import insort
 from .config import taxi_env_rewards, base_available_actions, all_action_names
+from .state import ArrayState, StateEncoder, state_dtype
+from .map_generator import map_to_array
+from .rendering import TAXIS_COLORS, IncrementalRenderer, RgbRenderer
+from .observation import ObservationEncoder
+from .demand import PassengerPool
+from .profiling import StepProfiler, PHASE_MOVEMENT, PHASE_COLLISION, PHASE_PASSENGERS, PHASE_FUEL, PHASE_DONE, \
+    COUNT_ACTIONS, COUNT_SKIPPED, COUNT_MOVES, COUNT_WALL_HITS, COUNT_NO_FUEL, COUNT_COLLISIONS, \
+    COUNT_FORCED_STANDBYS, COUNT_PICKUPS, COUNT_BAD_PICKUPS, COUNT_DROPOFFS, COUNT_BAD_DROPOFFS, COUNT_REFUELS, \
+    COUNT_BAD_REFUELS
+
+# Integer codes of the actions (their index in config.all_action_names)
+SOUTH, NORTH, EAST, WEST, PICKUP, DROPOFF, TURN_ENGINE_ON, TURN_ENGINE_OFF, STANDBY, REFUEL = (
+    all_action_names.index(action) for action in ['south', 'north', 'east', 'west', 'pickup', 'dropoff',
+                                                  'turn_engine_on', 'turn_engine_off', 'standby', 'refuel'])
+
+# Indexes of the reward events in the compiled rewards table (see TaxiEnv.compile_rewards_table)
+REWARD_EVENTS = list(taxi_env_rewards.keys())
+(EVENT_STEP, EVENT_NO_FUEL, EVENT_BAD_PICKUP, EVENT_BAD_DROPOFF, EVENT_BAD_REFUEL, EVENT_PICKUP,
+ EVENT_STANDBY_ENGINE_OFF, EVENT_TURN_ENGINE_ON, EVENT_TURN_ENGINE_OFF, EVENT_STANDBY_ENGINE_ON,
+ EVENT_INTERMEDIATE_DROPOFF, EVENT_FINAL_DROPOFF, EVENT_HIT_WALL, EVENT_COLLISION) = (
+    REWARD_EVENTS.index(event) for event in ['step', 'no_fuel', 'bad_pickup', 'bad_dropoff', 'bad_refuel', 'pickup',
+                                             'standby_engine_off', 'turn_engine_on', 'turn_engine_off',
+                                             'standby_engine_on', 'intermediate_dropoff', 'final_dropoff',
+                                             'hit_wall', 'collision'])
+
+# Mutable episode state of a TaxiEnv, see TaxiEnv.snapshot. All the fields are immutable, so snapshots can be hashed
+# and compared (e.g. as keys of a transposition table).
+EnvSnapshot = namedtuple('EnvSnapshot', ['state', 'collided', 'engine_status', 'last_action', 'done_cause',
+                                         'rng_state', 'pool_counters'])
+
+# Causes of the end of an episode, reported by TaxiEnv.step
+DONE_DELIVERED, DONE_COLLIDED, DONE_OUT_OF_FUEL = 'delivered', 'collided', 'out_of_fuel'
+
 
 MAP = [
     "+---------+",
@@ -24,6 +60,37 @@ MAP = [
 ]
 
 
+def sample_distinct_cells(np_random, num_samples: int, num_cells: int, num_taxis: int) -> np.array:
+    """
+    Samples distinct random cells for the taxis of num_samples start configurations.
+    On large maps (few taxis relative to the number of cells) the cells are drawn independently and the samples with a
+    repeated cell are drawn again, which doesn't touch the whole map. Otherwise the cells are the first taxis of a
+    random permutation of the map.
+    Args:
+        np_random: the random generator to draw from
+        num_samples: number of start configurations
+        num_cells: number of cells of the map
+        num_taxis: number of taxis
+
+    Returns: array of shape [num_samples, num_taxis] of cell indexes (row * num_columns + col)
+
+    """
+    if num_taxis ** 2 <= num_cells:  # A draw has no repeated cell with probability > 0.6
+        cells = np_random.integers(num_cells, size=(num_samples, num_taxis))
+        while True:
+            sorted_cells = np.sort(cells, axis=1)
+            repeated = (sorted_cells[:, 1:] == sorted_cells[:, :-1]).any(axis=1)
+            if not repeated.any():
+                return cells
+            cells[repeated] = np_random.integers(num_cells, size=(repeated.sum(), num_taxis))
+
+    keys = np_random.random((num_samples, num_cells))
+    if num_cells <= 1024:  # Sorting small maps is cheaper than partitioning them first
+        return np.argsort(keys, axis=1)[:, :num_taxis]
+    cells = np.argpartition(keys, num_taxis - 1, axis=1)[:, :num_taxis]
+    return np.take_along_axis(cells, np.argsort(np.take_along_axis(keys, cells, axis=1), axis=1), axis=1)
+
+
 class TaxiEnv(gym.Env):
     """
     The Taxi Problem
@@ -94,22 +161,41 @@ class TaxiEnv(gym.Env):
     Main class to be characterized with hyper-parameters.
     """
 
-    metadata = {'render.modes': ['human', 'ansi']}
+    metadata = {'render.modes': ['human', 'ansi', 'human_diff', 'ansi_diff', 'rgb_array']}
 
     def __init__(self, num_taxis: int = 2, num_passengers: int = 2, max_fuel: list = None,
                  domain_map: list = None, taxis_capacity: list = None, collision_sensitive_domain: bool = False,
-                 fuel_type_list: list = None, option_to_stand_by: bool = True):
+                 fuel_type_list: list = None, option_to_stand_by: bool = True, compact_state: bool = False,
+                 taxis_rewards: list = None, observation_encoding: str = 'raw', joint_execution: bool = False,
+                 arrival_process=None, render_max_fps: float = None, render_frame_skip: int = 0,
+                 render_tile_size: int = 16):
         """
-        TODO -  later version make number of passengers dynamic, even in runtime
         Args:
             num_taxis: number of taxis in the domain
-            num_passengers: number of passengers occupying the domain
+            num_passengers: number of passengers occupying the domain (the size of the passengers pool in demand mode)
             max_fuel: list of max and starting fuel, we use np.inf as default for fuel free taxi.
             domain_map: map of the domain
             taxis_capacity: max capacity of passengers in each taxi (list)
             collision_sensitive_domain: is the domain show and react (true) to collisions or not (false)
             fuel_type_list: list of fuel types of each taxi
             option_to_stand_by: can taxis simply stand in place
+            compact_state: keep the state in a preallocated fixed-dtype numpy record (ArrayState) instead of nested
+                           lists. The record is exposed through a list-compatible view. Stepping is about 5-15%
+                           slower than with list state (the changes are written to the record as well), in exchange
+                           for a fixed-size state that is cheap to snapshot, record and encode.
+            taxis_rewards: list of rewards dictionaries of each taxi, overriding the rewards of config.py
+            observation_encoding: encoding of get_observations and observation_space, one of observation.ENCODINGS
+            joint_execution: execute the actions of all the taxis at once (see joint_step) instead of one taxi after
+                             the other
+            arrival_process: demand mode - passengers arrive during the episode, drawn by this process (e.g.
+                             demand.PoissonArrivals) from np_random, into a pool of num_passengers slots (see
+                             demand.PassengerPool). The observations keep their size, free slots being observed as
+                             delivered passengers, and delivering all the passengers doesn't end the episode.
+            render_max_fps: maximal number of frames drawn per second by the 'human_diff' and 'ansi_diff' render
+                            modes, no limit if None (see rendering.IncrementalRenderer)
+            render_frame_skip: number of render calls skipped after each frame drawn by the 'human_diff' and
+                               'ansi_diff' render modes
+            render_tile_size: size in pixels of a cell in the images of the 'rgb_array' render mode
         """
 
         # Initializing default value
@@ -119,9 +205,9 @@ class TaxiEnv(gym.Env):
             self.max_fuel = max_fuel
 
         if domain_map is None:
-            self.desc = np.asarray(MAP, dtype='c')
+            self.desc = map_to_array(MAP)
         else:
-            self.desc = np.asarray(domain_map, dtype='c')
+            self.desc = map_to_array(domain_map)
 
         if taxis_capacity is None:
             self.taxis_capacity = [1] * num_passengers
@@ -137,25 +223,24 @@ class TaxiEnv(gym.Env):
         self.num_rows = num_rows = len(self.desc) - 2
         self.num_columns = num_columns = len(self.desc[0][1:-1:2])
 
+        # Cell-type grid of the map, one character per cell (passengers pickup spots 'X', fuel stations 'F'/'G').
+        # The map is parsed on the character codes, comparing bytes is much faster than comparing strings.
+        cell_codes = self.desc[1:-1, 1:-1:2].view(np.uint8)
+        self.cell_types = cell_codes.astype(np.uint32).view('U1')
+
+        # Boolean map of the fuel stations of each fuel type, and the map of the stations each taxi can refuel at.
+        self.fuel_stations_maps = {fuel_type: cell_codes == ord(fuel_type) for fuel_type in ['F', 'G']}
+        no_fuel_stations = np.zeros(self.cell_types.shape, dtype=bool)
+        self.taxis_fuel_stations = [self.fuel_stations_maps.get(fuel_type, no_fuel_stations)
+                                    for fuel_type in self.fuel_type_list]
+
         # Set locations of passengers and fuel stations according to the map.
-        self.passengers_locations = []
-        self.fuel_station1 = None
-        self.fuel_station2 = None
-        self.fuel_stations = []
-
-        for i, row in enumerate(self.desc[1:-1]):
-            for j, char in enumerate(row[1:-1:2]):
-                loc = [i, j]
-                if char == b'X':
-                    self.passengers_locations.append(loc)
-                elif char == b'F':
-                    self.fuel_station1 = loc
-                    self.fuel_stations.append(loc)
-                elif char == b'G':
-                    self.fuel_station2 = loc
-                    self.fuel_stations.append(loc)
-
-        self.coordinates = [[i, j] for i in range(num_rows) for j in range(num_columns)]
+        self.passengers_locations = np.argwhere(cell_codes == ord('X')).tolist()
+        self.fuel_stations = np.argwhere(self.fuel_stations_maps['F'] | self.fuel_stations_maps['G']).tolist()
+        fuel_stations1, fuel_stations2 = (np.argwhere(self.fuel_stations_maps[fuel_type]).tolist()
+                                          for fuel_type in ['F', 'G'])
+        self.fuel_station1 = fuel_stations1[-1] if fuel_stations1 else None
+        self.fuel_station2 = fuel_stations2[-1] if fuel_stations2 else None
 
         self.num_taxis = num_taxis
 
@@ -174,14 +259,96 @@ class TaxiEnv(gym.Env):
         self.available_actions_indexes, self.index_action_dictionary, self.action_index_dictionary \
             = self.set_available_actions_dictionary()
         self.num_actions = len(self.available_actions_indexes)
+
+        # Movement transition table, compiled once from the map
+        self.movement_directions = {action: direction for direction, action in enumerate([SOUTH, NORTH, EAST, WEST])}
+        self.next_cell, self.hit_wall = self.compile_movement_table()
+
+        # Rewards of each taxi indexed by the EVENT_* codes
+        self.rewards_table = self.compile_rewards_table(taxis_rewards)
         self.action_space = gym.spaces.MultiDiscrete([self.num_actions for _ in range(self.num_taxis)])
         self.last_action = None
 
         self.seed()
         self.state = None
-        self.dones = []
 
-        self.np_random = None
+        # Termination counters (delivered passengers, collided taxis and taxis out of fuel) kept up to date by step, and
+        # the cause of the end of the episode (None while it goes on), see rebuild_done_counters. In demand mode
+        # num_delivered counts the free passenger slots, the deliveries of the episode are passenger_pool.num_deliveries
+        self.num_delivered = 0
+        self.num_collided = 0
+        self.num_out_of_fuel = 0
+        self.done_cause = None
+
+        # Occupancy grid of the taxis (number of taxis on each cell) and the taxis on each occupied cell,
+        # kept up to date by reset and step (joint_step leaves the taxis of the cells to be rebuilt, see cell_taxis).
+        self.occupancy = np.zeros((num_rows, num_columns), dtype=np.int32)
+        self.taxis_of_cells = {}
+
+        # Passengers index: the waiting passengers on each cell and the passengers on board of each taxi (the taxi's
+        # load), both sorted by passenger index and kept up to date by reset and step.
+        self.waiting_passengers = {}
+        self.taxis_passengers = [[] for _ in range(num_taxis)]
+
+        # Demand mode: the arrival process of the passengers and the free-list of the passenger slots
+        self.arrival_process = arrival_process
+        self.passenger_pool = PassengerPool(num_passengers) if arrival_process is not None else None
+
+        # Preallocated state buffer, reused by every reset
+        self.compact_state = compact_state
+        self.array_state = ArrayState(num_taxis, num_passengers, self.max_fuel[:num_taxis]) if compact_state else None
+
+        # Decoded map lines and the renderers of the incremental and rgb_array modes, created by the first render
+        self.map_lines = None
+        self.incremental_renderer = None
+        self.rgb_renderer = None
+        self.render_max_fps = render_max_fps
+        self.render_frame_skip = render_frame_skip
+        self.render_tile_size = render_tile_size
+
+        # Integer encoding of the states (see encode), created on first use
+        self.state_encoder = None
+
+        # Profiler of step (see profiling.StepProfiler), None when step isn't profiled
+        self.profiler = None
+
+        # Execution mode of step, the array tables of joint_step, compiled by its first call, and the taxis cells and
+        # fuels of a nested-list state as arrays, kept by joint_step between its calls (None when the state changed
+        # otherwise, see rebuild_occupancy)
+        self.joint_execution = joint_execution
+        self.joint_tables = None
+        self.joint_arrays = None
+
+        # Bank of pre-sampled start configurations (see generate_scenarios) and the next one reset starts from, the
+        # scenarios being state records
+        self.scenario_dtype = state_dtype(num_taxis, num_passengers, self.max_fuel[:num_taxis])
+        self.pickup_spots = np.array(self.passengers_locations).reshape(-1, 2)
+        self.scenarios = None
+        self.next_scenario = 0
+
+        self.observation_encoder = ObservationEncoder(self, observation_encoding)
+        self.observation_space = self.observation_encoder.observation_space
+
+    @property
+    def cell_taxis(self) -> dict:
+        """
+        Returns: dictionary (row, col) -> set of the taxis on the cell, for the occupied cells. It is rebuilt from the
+                 taxis locations in one pass after joint steps, which move the taxis as arrays.
+
+        """
+        if self.taxis_of_cells is None:
+            self.taxis_of_cells = {}
+            for taxi, (row, col) in enumerate(self.state[0]):
+                self.taxis_of_cells.setdefault((row, col), set()).add(taxi)
+        return self.taxis_of_cells
+
+    @property
+    def coordinates(self) -> list:
+        """
+        Returns: list of the [row, col] coordinates of all the cells of the map, built on demand.
+
+        """
+        return [[i, j] for i in range(self.num_rows) for j in range(self.num_columns)]
 
     def seed(self, seed=None) -> list:
         """
@@ -195,7 +362,7 @@ class TaxiEnv(gym.Env):
         self.np_random, seed = seeding.np_random(seed)
         return [seed]
 
-    def reset(self) -> list:
+    def reset(self, scenario: int = None) -> list:
         """
         Reset the environment's state:
             - taxis coordinates.
@@ -204,29 +371,398 @@ class TaxiEnv(gym.Env):
             - random locate passengers.
             - preserve other definitions of the environment (collision, capacity...)
             - all engines turn on.
+        The start configuration is drawn from np_random (see seed), or taken from the scenario bank once one is
+        generated (see generate_scenarios).
         Args:
+            scenario: index of the scenario of the bank to start from, by default the next one of the bank
 
         Returns: The reset state.
 
         """
-        taxis_locations = random.sample(self.coordinates, self.num_taxis)
-        fuels = [self.max_fuel[i] for i in range(self.num_taxis)]
-
-        passengers_start_location = [start for start in
-                                     random.choices(self.passengers_locations, k=self.num_passengers)]
-        passengers_destinations = [random.choice([x for x in self.passengers_locations if x != start])
-                                   for start in passengers_start_location]
+        if scenario is not None:
+            if self.scenarios is None:
+                raise ValueError('No scenario bank to reset from, see generate_scenarios')
+            record = self.scenarios[scenario]
+        elif self.scenarios is not None:
+            # A used up bank is replaced by a new one of the same size
+            if self.next_scenario == len(self.scenarios):
+                self.generate_scenarios(len(self.scenarios))
+            record = self.scenarios[self.next_scenario]
+            self.next_scenario += 1
+        else:
+            record = self.sample_scenarios(1)[0]
 
-        # Status of each passenger: delivered (-1), in_taxi (positive number), waiting (0)
-        passengers_status = [0 for _ in range(self.num_passengers)]
-        self.state = [taxis_locations, fuels, passengers_start_location, passengers_destinations, passengers_status]
+        if self.compact_state:
+            self.array_state.record[...] = record
+            self.state = self.array_state
+        else:
+            self.state = [record['taxis_locations'].tolist(), [self.max_fuel[i] for i in range(self.num_taxis)],
+                          record['passengers_start_locations'].tolist(), record['passengers_destinations'].tolist(),
+                          record['passengers_status'].tolist()]
 
         self.last_action = None
-        # Turning all engines on
-        self.engine_status_list = list(np.ones(self.num_taxis))
+        # Turning all engines on and clearing the collisions of the previous episode
+        self.engine_status_list = [1.0] * self.num_taxis
+        self.collided[...] = 0
+        self.rebuild_indexes()
+        if self.arrival_process is not None:
+            self.passenger_pool.reset()
+            self.spawn_passengers(self.arrival_process.initial_passengers)
 
         return self.state
 
+    def sample_scenarios(self, num_scenarios: int) -> np.array:
+        """
+        Samples start configurations with array operations over all of them, from np_random:
+            - taxis at distinct random cells, with full tanks.
+            - passengers at random pickup spots, waiting, with a random different spot as their destination (all the
+              passenger slots are free in demand mode).
+        Args:
+            num_scenarios: number of start configurations
+
+        Returns: array of shape [num_scenarios] of state records (see state.state_dtype)
+
+        """
+        scenarios = np.zeros(num_scenarios, dtype=self.scenario_dtype)
+        cells = sample_distinct_cells(self.np_random, num_scenarios, self.num_rows * self.num_columns, self.num_taxis)
+        taxis_locations = scenarios['taxis_locations']
+        taxis_locations[..., 0], taxis_locations[..., 1] = np.divmod(cells, self.num_columns)
+        scenarios['fuels'] = self.max_fuel[:self.num_taxis]
+
+        locations = self.pickup_spots
+        if self.arrival_process is None:
+            num_locations = len(locations)
+            starts = self.np_random.integers(num_locations, size=(num_scenarios, self.num_passengers))
+            destinations = (starts + 1 + self.np_random.integers(num_locations - 1, size=starts.shape)) % num_locations
+            scenarios['passengers_start_locations'] = locations[starts]
+            scenarios['passengers_destinations'] = locations[destinations]
+        else:  # Demand mode - all the passenger slots start free, see spawn_passengers
+            scenarios['passengers_start_locations'] = scenarios['passengers_destinations'] = locations[0]
+            scenarios['passengers_status'] = -1
+        return scenarios
+
+    def generate_scenarios(self, num_scenarios: int):
+        """
+        Fills the scenario bank with new start configurations (see sample_scenarios). The following resets start from
+        the scenarios of the bank in order, and a new bank is generated when it is used up.
+        Args:
+            num_scenarios: size of the bank
+
+        """
+        self.scenarios = self.sample_scenarios(num_scenarios)
+        self.next_scenario = 0
+
+    def spawn_passengers(self, num_arrivals: int = None) -> list:
+        """
+        Demand mode: passengers arrive at random pickup spots, with a random different spot as their destination, and
+        wait in free slots of the passengers pool. Arrivals are dropped when the pool is full.
+        Args:
+            num_arrivals: number of arriving passengers, sampled from the arrival process if None
+
+        Returns: the slots of the passengers that arrived
+
+        """
+        if num_arrivals is None:
+            num_arrivals = self.arrival_process.sample(self.np_random)
+        if num_arrivals == 0:
+            return []
+        num_locations = len(self.passengers_locations)
+        starts = self.np_random.integers(num_locations, size=num_arrivals)
+        destinations = (starts + 1 + self.np_random.integers(num_locations - 1, size=num_arrivals)) % num_locations
+
+        _, _, passengers_start_locations, passengers_destinations, passengers_status = self.state
+        slots = []
+        for start, destination in zip(starts.tolist(), destinations.tolist()):
+            slot = self.passenger_pool.allocate()
+            if slot < 0:
+                continue
+            row, col = self.passengers_locations[start]
+            passengers_start_locations[slot] = [row, col]
+            passengers_destinations[slot] = list(self.passengers_locations[destination])
+            passengers_status[slot] = 0
+            insort(self.waiting_passengers.setdefault((row, col), []), slot)
+            self.num_delivered -= 1
+            slots.append(slot)
+        return slots
+
+    def snapshot(self) -> EnvSnapshot:
+        """
+        Captures the mutable episode state of the environment, a cheap alternative to copy.deepcopy(env) for lookahead
+        search. The map, the compiled tables and the configuration are not captured, they are shared by the snapshots.
+
+        Returns: EnvSnapshot holding the state (the record bytes of a compact state, nested tuples otherwise), the
+                 collided and engine status of the taxis, the last action, the done cause, the pickled state of
+                 np_random (None if not seeded) and the totals of the passenger pool in demand mode (arrivals,
+                 dropped arrivals and deliveries, None otherwise)
+
+        """
+        if self.state is None:
+            raise ValueError('The environment must be reset before taking a snapshot')
+        if self.compact_state:
+            state = self.array_state.record.tobytes()
+        else:
+            state = tuple(tuple(tuple(value) if isinstance(value, list) else value for value in component)
+                          for component in self.state)
+        rng_state = None if self.np_random is None else pickle.dumps(self.np_random.bit_generator.state)
+        pool = self.passenger_pool
+        pool_counters = None if pool is None else (pool.num_arrivals, pool.num_dropped, pool.num_deliveries)
+        return EnvSnapshot(state, self.collided.tobytes(), tuple(self.engine_status_list),
+                           None if self.last_action is None else tuple(self.last_action), self.done_cause, rng_state,
+                           pool_counters)
+
+    def restore(self, snapshot: EnvSnapshot):
+        """
+        Restores the environment to a snapshot taken by snapshot(), writing into the existing state buffers (the
+        compact state record, or the lists of the state components) and rebuilding the indexes.
+        Args:
+            snapshot: snapshot of this environment (or of one with the same configuration)
+
+        """
+        if self.compact_state:
+            record = self.array_state.record
+            if len(snapshot.state) != record.nbytes:
+                raise ValueError('The snapshot does not match the state of the environment')
+            record.reshape(1).view(np.uint8)[:] = np.frombuffer(snapshot.state, dtype=np.uint8)
+            self.state = self.array_state
+        elif self.state is None:
+            self.state = [[list(value) if isinstance(value, tuple) else value for value in component]
+                          for component in snapshot.state]
+        else:
+            for component, values in zip(self.state, snapshot.state):
+                component[:] = [list(value) if isinstance(value, tuple) else value for value in values]
+
+        self.collided[...] = np.frombuffer(snapshot.collided, dtype=self.collided.dtype)
+        self.engine_status_list[:] = snapshot.engine_status
+        self.last_action = None if snapshot.last_action is None else list(snapshot.last_action)
+        if snapshot.rng_state is not None:
+            if self.np_random is None:
+                self.seed()
+            self.np_random.bit_generator.state = pickle.loads(snapshot.rng_state)
+        self.rebuild_indexes()
+        self.done_cause = snapshot.done_cause
+        if self.passenger_pool is not None and snapshot.pool_counters is not None:
+            pool = self.passenger_pool
+            pool.num_arrivals, pool.num_dropped, pool.num_deliveries = snapshot.pool_counters
+
+    @property
+    def num_states(self) -> int:
+        """
+        Returns: number of integer-encoded states of the domain (see encode).
+
+        """
+        return self.get_state_encoder().num_states
+
+    def get_state_encoder(self) -> StateEncoder:
+        """
+        Returns: the integer encoder of the states of the domain, created on first use.
+
+        """
+        if self.state_encoder is None:
+            self.state_encoder = StateEncoder(self)
+        return self.state_encoder
+
+    def encode(self, state: list = None, engine_status: list = None, collided: list = None) -> int:
+        """
+        Encodes a full state of the domain as a single integer (see state.StateEncoder).
+        Args:
+            state: state of the domain, the current state if None
+            engine_status: engine status of each taxi, the current one if None
+            collided: collided flag of each taxi, the current one if None
+
+        Returns: the integer of the state
+
+        """
+        return self.get_state_encoder().encode(self.state if state is None else state,
+                                               self.engine_status_list if engine_status is None else engine_status,
+                                               self.collided if collided is None else collided)
+
+    def decode(self, s: int) -> (list, list, list):
+        """
+        Decodes an integer encoded by encode.
+        Args:
+            s: the integer of the state
+
+        Returns: the state (in the state list format), the engine status and the collided flag of each taxi
+
+        """
+        return self.get_state_encoder().decode(s)
+
+    @property
+    def s(self) -> int:
+        """
+        Returns: the integer encoding of the current state, assigning it sets the environment to the decoded state.
+
+        """
+        return self.encode()
+
+    @s.setter
+    def s(self, s: int):
+        state, engine_status, collided = self.decode(s)
+        if self.compact_state:
+            self.array_state.assign(state)
+            state = self.array_state
+        self.state = state
+        self.engine_status_list = [float(status) for status in engine_status]
+        self.collided[...] = collided
+        self.last_action = None
+        self.rebuild_indexes()
+
+    def rebuild_indexes(self):
+        """
+        Recomputes the taxis occupancy grid, the passengers index and the termination counters from the current state.
+        It should be called after modifying the state directly.
+        """
+        self.rebuild_occupancy()
+        self.rebuild_passengers_index()
+        self.rebuild_done_counters()
+
+    def rebuild_done_counters(self):
+        """
+        Recomputes the number of delivered passengers, collided taxis and taxis out of fuel from the current state and
+        the collided flags, and the done cause they imply.
+        """
+        _, fuels, _, _, passengers_status = self.state
+        self.num_delivered = sum(status == -1 for status in passengers_status)
+        self.num_collided = int(np.count_nonzero(self.collided == 1))
+        self.num_out_of_fuel = sum(fuel == 0 for fuel in fuels)
+        self.done_cause = self.get_done_cause()
+
+    def get_done_cause(self) -> str:
+        """
+        Checks the termination counters: the episode is done when all the passengers are delivered (except in demand
+        mode), all the taxis collided or all the taxis are out of fuel.
+
+        Returns: the done cause (DONE_DELIVERED, DONE_COLLIDED or DONE_OUT_OF_FUEL), None if the episode goes on
+
+        """
+        if self.num_delivered == self.num_passengers and self.arrival_process is None:
+            return DONE_DELIVERED
+        if self.num_collided == self.num_taxis:
+            return DONE_COLLIDED
+        if self.num_out_of_fuel == self.num_taxis:
+            return DONE_OUT_OF_FUEL
+        return None
+
+    def get_taxis_dones(self) -> list:
+        """
+        Returns: list of whether each taxi is done - the episode is done, or the taxi can't act anymore (it collided,
+                 or it is out of fuel outside a suitable fuel station)
+
+        """
+        if self.done_cause is not None:
+            return [True] * self.num_taxis
+        if self.num_collided == 0 and self.num_out_of_fuel == 0:
+            return [False] * self.num_taxis
+        taxis_locations, fuels = self.state[0], self.state[1]
+        if self.compact_state:
+            taxis_locations, fuels = taxis_locations.tolist(), fuels.tolist()
+        collided = self.collided.tolist()
+        return [collided[taxi] == 1 or (fuel == 0 and not self.at_valid_fuel_station(taxi, taxis_locations))
+                for taxi, fuel in enumerate(fuels)]
+
+    def rebuild_passengers_index(self):
+        """
+        Recomputes the waiting passengers of each cell and the passengers on board of each taxi from the current state.
+        """
+        _, _, passengers_start_locations, _, passengers_status = self.state
+        self.waiting_passengers = {}
+        self.taxis_passengers = [[] for _ in range(self.num_taxis)]
+        for passenger, status in enumerate(passengers_status):
+            if status == 0:
+                row, col = passengers_start_locations[passenger]
+                self.waiting_passengers.setdefault((row, col), []).append(passenger)
+            elif status > 0:
+                self.taxis_passengers[status - 1].append(passenger)
+        if self.passenger_pool is not None:
+            self.passenger_pool.rebuild(passengers_status)
+
+    def rebuild_occupancy(self):
+        """
+        Recomputes the occupancy grid and the taxis of each cell from the taxis locations of the current state.
+        It should be called after modifying the taxis locations of the state directly.
+        """
+        self.occupancy[...] = 0
+        self.taxis_of_cells = {}
+        self.joint_arrays = None
+        for taxi, (row, col) in enumerate(self.state[0]):
+            self.occupancy[row, col] += 1
+            self.taxis_of_cells.setdefault((row, col), set()).add(taxi)
+
+    def move_taxi(self, taxi: int, location: list, new_location: list):
+        """
+        Moves a taxi on the occupancy grid.
+        Args:
+            taxi: index of the taxi
+            location: current [row, col] of the taxi
+            new_location: new [row, col] of the taxi
+
+        """
+        row, col = location
+        self.occupancy[row, col] -= 1
+        taxis = self.cell_taxis[(row, col)]
+        taxis.discard(taxi)
+        if not taxis:
+            del self.cell_taxis[(row, col)]
+        row, col = new_location
+        self.occupancy[row, col] += 1
+        self.cell_taxis.setdefault((row, col), set()).add(taxi)
+
+    def pickup_passengers(self, taxi: int, row: int, col: int) -> int:
+        """
+        Takes the waiting passengers of the taxi's cell, by passenger index, while there is room in the taxi.
+        Args:
+            taxi: index of the taxi
+            row: row of the taxi
+            col: column of the taxi
+
+        Returns: number of passengers picked up
+
+        """
+        passengers_status = self.state[4]
+        waiting = self.waiting_passengers.get((row, col), [])
+        on_board = self.taxis_passengers[taxi]
+        picked = waiting[:max(0, self.taxis_capacity[taxi] - len(on_board))]
+        for i in picked:
+            passengers_status[i] = taxi + 1
+            insort(on_board, i)
+        if picked:
+            del waiting[:len(picked)]
+            if not waiting:
+                del self.waiting_passengers[(row, col)]
+        return len(picked)
+
+    def dropoff_passengers(self, taxi: int, row: int, col: int) -> int:
+        """
+        Drops off all the passengers of the taxi: passengers at their destination are delivered, the others wait at
+        the taxi's cell.
+        Args:
+            taxi: index of the taxi
+            row: row of the taxi
+            col: column of the taxi
+
+        Returns: the reward event of the dropoff - EVENT_BAD_DROPOFF if the taxi was empty, otherwise the event of the
+                 last passenger (by index) that left the taxi
+
+        """
+        _, _, passengers_start_locations, destinations, passengers_status = self.state
+        on_board = self.taxis_passengers[taxi]
+        event = EVENT_BAD_DROPOFF  # not carrying a passenger
+        for i in on_board:
+            # Check if we are at the passenger's destination
+            if [row, col] == destinations[i]:
+                passengers_status[i] = -1
+                self.num_delivered += 1
+                event = EVENT_FINAL_DROPOFF
+                if self.passenger_pool is not None:
+                    self.passenger_pool.release(i)
+            else:  # drops off passenger not at destination
+                passengers_status[i] = 0
+                event = EVENT_INTERMEDIATE_DROPOFF
+                passengers_start_locations[i] = [row, col]
+                insort(self.waiting_passengers.setdefault((row, col), []), i)
+        on_board.clear()
+        return event
+
     def set_available_actions_dictionary(self) -> (list, dict, dict):
         """
 
@@ -244,7 +780,7 @@ class TaxiEnv(gym.Env):
         for index, action in enumerate(action_names):
             base_dictionary[index] = action
 
-        available_action_list = base_available_actions  # From config.py
+        available_action_list = list(base_available_actions)  # From config.py
 
         if self.option_to_standby:
             available_action_list += ['turn_engine_on', 'turn_engine_off', 'standby']
@@ -260,6 +796,58 @@ class TaxiEnv(gym.Env):
 
         return list(set(available_actions_indexes)), index_action_dictionary, action_index_dictionary
 
+    def compile_movement_table(self) -> (np.array, np.array):
+        """
+        Compiles the map into a transition table of the movement actions.
+        Cells are indexed by rows, i.e. cell = row * num_columns + col, and directions are indexed in the order
+        (south, north, east, west) - see self.movement_directions for the action -> direction mapping.
+        Taxis can only move east/west through a ':' separator, and south/north inside the map boundaries.
+
+        Returns: next_cell[cell, direction] - the cell reached when moving from 'cell' in 'direction', and
+        hit_wall[cell, direction] - whether this move is blocked (in which case next_cell[cell, direction] == cell).
+
+        """
+        num_cells = self.num_rows * self.num_columns
+        cells = np.arange(num_cells, dtype=np.int32)
+        # The map's borders are walls, so ':' separators only appear between two cells
+        can_move_east = (self.desc[1:-1, 2::2].view(np.uint8) == ord(':')).ravel()
+        can_move_west = (self.desc[1:-1, 0:-1:2].view(np.uint8) == ord(':')).ravel()
+
+        # Built direction by direction, with contiguous rows, and exposed as [cell, direction]
+        next_cell = np.empty((4, num_cells), dtype=np.int32)
+        next_cell[:] = cells
+        next_cell[0, :num_cells - self.num_columns] += self.num_columns
+        next_cell[1, self.num_columns:] -= self.num_columns
+        next_cell[2] += can_move_east
+        next_cell[3] -= can_move_west
+        next_cell = next_cell.T
+        hit_wall = next_cell == cells[:, None]
+
+        return next_cell, hit_wall
+
+    def compile_rewards_table(self, taxis_rewards: list = None) -> list:
+        """
+        Compiles the rewards of config.py into a table indexed by taxi and reward event (see REWARD_EVENTS).
+        Args:
+            taxis_rewards: list of rewards dictionaries of each taxi, events missing from a taxi's dictionary
+                           (or all of them if the list isn't given) get the reward of config.py
+
+        Returns: rewards_table[taxi][event]
+
+        """
+        if taxis_rewards is None:
+            taxis_rewards = [{}] * self.num_taxis
+        elif len(taxis_rewards) != self.num_taxis:
+            raise ValueError('Expected the rewards of {} taxis, got {}'.format(self.num_taxis, len(taxis_rewards)))
+
+        rewards_table = []
+        for taxi_rewards in taxis_rewards:
+            unknown_events = set(taxi_rewards) - set(REWARD_EVENTS)
+            if unknown_events:
+                raise ValueError('Unknown reward events: {}'.format(sorted(unknown_events)))
+            rewards_table.append([taxi_rewards.get(event, taxi_env_rewards[event]) for event in REWARD_EVENTS])
+        return rewards_table
+
     def get_available_actions_dictionary(self) -> (list, dict):
         """
         Returns: list of available actions and index->action dictionary for all actions.
@@ -289,9 +877,7 @@ class TaxiEnv(gym.Env):
         Returns: character on specific location on the map
 
         """
-        domain_map = self.desc.copy().tolist()
-        row, col = location[0], location[1]
-        return domain_map[row + 1][2 * col + 1].decode(encoding='UTF-8')
+        return str(self.cell_types[location[0], location[1]])
 
     def at_valid_fuel_station(self, taxi: int, taxis_locations: list) -> bool:
         """
@@ -302,187 +888,491 @@ class TaxiEnv(gym.Env):
         Returns: whether the taxi is at a suitable fuel station (true) or not (false)
 
         """
-        return (taxis_locations[taxi] in self.fuel_stations and
-                self.map_at_location(taxis_locations[taxi]) == self.fuel_type_list[taxi])
+        row, col = taxis_locations[taxi]
+        return bool(self.taxis_fuel_stations[taxi][row, col])
 
-    def step(self, actions: list) -> (list, list, bool):
+    @contextmanager
+    def profile(self, profiler: StepProfiler = None):
+        """
+        Context manager profiling the steps executed inside it, e.g.:
+            with env.profile() as profiler:
+                ...
+            print(profiler.report())
+        Args:
+            profiler: the profiler to accumulate into, a new one if None
+
+        Returns: the profiler, which is detached from the environment (the previous one is restored) at the exit
+
+        """
+        previous_profiler = self.profiler
+        self.profiler = StepProfiler() if profiler is None else profiler
+        try:
+            yield self.profiler
+        finally:
+            self.profiler = previous_profiler
+
+    def step(self, actions: list) -> (list, list, bool, dict):
         """
-        TODO - add an option to choose whether to execute in joint/serialized manner.
-        Executing a list of actions (action for each taxi) at the domain current state.
+        Executing a list of actions (action for each taxi) at the domain current state, in a serialized manner: taxi i
+        acts on the state left by taxis 0..i-1. Environments created with joint_execution execute joint_step instead.
         Supports not-joined actions, just pass 1 element instead of list.
 
         actions[i] is the action of taxi i.
         Args:
             actions: list[int] - list of actions to take.
 
-        Returns: list of next_state, reward_collected, is_done
+        Returns: list of next_state, reward_collected, is_done and an info dictionary holding whether each taxi is done
+        ('taxis_dones', see get_taxis_dones), the cause of the end of the episode ('done_cause', None if not done) and
+        the taxis that acted ('acting_taxis', the taxis of the rewards, as taxis that can't act get no reward)
         """
-        # Boundaries to check if "hit a wall" occurred and calculate movement
-        max_row = self.num_rows - 1
-        max_col = self.num_columns - 1
+        if self.joint_execution:
+            return self.joint_step(actions)
+        self.joint_arrays = None
 
         rewards = []
+        acting_taxis = []
+        profiler = self.profiler
+        if profiler is not None:
+            step_start = lap = perf_counter()
+            counts = profiler.counts
+
+        # A compact state is read from plain lists of the taxis locations and fuels (reading the record element by
+        # element would create a list or a scalar per access), and the changes are written to both
+        if self.compact_state:
+            locations_array, fuels_array = self.array_state.fields[0].array, self.array_state.fields[1].array
+            taxis_locations, fuels = locations_array.tolist(), fuels_array.tolist()
+        else:
+            locations_array = fuels_array = None
+            taxis_locations, fuels = self.state[0], self.state[1]
 
         # Main of the function, for each taxi-i act on action[i]
         for taxi, action in enumerate(actions):
-            reward = taxi_env_rewards['step']  # Default reward
+            taxi_rewards = self.rewards_table[taxi]
+            reward = taxi_rewards[EVENT_STEP]  # Default reward
             moved = False  # Indicator variable for later use
             # If the taxi collided, it can't perform a step
             if self.collided[taxi] == 1:
+                if profiler is not None:
+                    counts[COUNT_SKIPPED] += 1
+                    lap = profiler.lap(PHASE_MOVEMENT, lap)
                 continue
 
-            taxis_locations, fuels, passengers_start_locations, destinations, passengers_status = self.state
-
             # If the taxi is out of fuel, it can't perform a step
             if fuels[taxi] == 0 and not self.at_valid_fuel_station(taxi, taxis_locations):
+                if profiler is not None:
+                    counts[COUNT_SKIPPED] += 1
+                    lap = profiler.lap(PHASE_MOVEMENT, lap)
                 continue
+            if profiler is not None:
+                counts[COUNT_ACTIONS] += 1
 
             taxi_location = taxis_locations[taxi]
             row, col = taxi_location
             fuel = fuels[taxi]
             is_taxi_engine_on = self.engine_status_list[taxi]
-            _, index_action_dictionary = self.get_available_actions_dictionary()
+            direction = self.movement_directions.get(action)  # None for non-movement actions
 
             if not is_taxi_engine_on:  # Engine is off
-                if index_action_dictionary[action] == 'standby':  # standby while engine is off
-                    reward = taxi_env_rewards['standby_engine_off']
-                elif index_action_dictionary[action] == 'turn_engine_on':  # turn engine on
-                    reward = taxi_env_rewards['turn_engine_on']
+                if action == STANDBY:  # standby while engine is off
+                    reward = taxi_rewards[EVENT_STANDBY_ENGINE_OFF]
+                elif action == TURN_ENGINE_ON:  # turn engine on
+                    reward = taxi_rewards[EVENT_TURN_ENGINE_ON]
                     self.engine_status_list[taxi] = 1
 
             elif is_taxi_engine_on:  # Engine is on
                 # Movement
-                if index_action_dictionary[action] == 'south':  # south
-                    if row != max_row:
-                        moved = True
-                    row = min(row + 1, max_row)
-                elif index_action_dictionary[action] == 'north':  # north
-                    if row != 0:
-                        moved = True
-                    row = max(row - 1, 0)
-                if index_action_dictionary[action] == 'east' and self.desc[1 + row, 2 * col + 2] == b":":  # east
-                    if col != max_col:
-                        moved = True
-                    col = min(col + 1, max_col)
-                elif index_action_dictionary[action] == 'west' and self.desc[1 + row, 2 * col] == b":":  # west
-                    if col != 0:
+                if direction is not None:
+                    cell = row * self.num_columns + col
+                    if not self.hit_wall[cell, direction]:
                         moved = True
-                    col = max(col - 1, 0)
+                        row, col = divmod(int(self.next_cell[cell, direction]), self.num_columns)
+                if profiler is not None:
+                    lap = profiler.lap(PHASE_MOVEMENT, lap)
 
                 # Check for collisions
                 if self.collision_sensitive_domain and moved:
                     if self.collided[taxi] == 0:
-                        # Check if the number of taxis on the destination location is greater than 1
-                        if len([i for i in range(self.num_taxis) if taxis_locations[i] == [row, col]]) > 0:
+                        # Check if there already is a taxi on the destination location
+                        if self.occupancy[row, col] > 0:
                             if self.option_to_standby:
                                 moved = False
-                                action = self.action_index_dictionary['standby']
+                                action, direction = STANDBY, None
+                                if profiler is not None:
+                                    counts[COUNT_FORCED_STANDBYS] += 1
                             else:
-                                self.collided[[i for i in range(len(taxis_locations)) if taxis_locations[i] ==
-                                               [row, col]]] = 1
-                                self.collided[taxi] = 1
-                                reward = taxi_env_rewards['collision']
+                                colliding = list(self.cell_taxis[(row, col)]) + [taxi]
+                                self.num_collided += int(np.count_nonzero(self.collided[colliding] == 0))
+                                self.collided[colliding] = 1
+                                reward = taxi_rewards[EVENT_COLLISION]
+                                if profiler is not None:
+                                    counts[COUNT_COLLISIONS] += 1
+                    if profiler is not None:
+                        lap = profiler.lap(PHASE_COLLISION, lap)
                 if self.collision_sensitive_domain and self.collided[taxi] == 1:  # Taxi is already collided
                     pass
 
                 # Pickup
-                elif index_action_dictionary[action] == 'pickup':
-                    successful_pickup = False
-                    for i, location in enumerate(passengers_status):
-                        # Check if we can take this passenger
-                        if location == 0 and taxi_location == passengers_start_locations[i] and self.is_place_on_taxi(
-                                passengers_status, taxi):
-                            passengers_status[i] = taxi + 1
-                            successful_pickup = True
-                            reward = taxi_env_rewards['pickup']
-                    if not successful_pickup:  # passenger not at location
-                        reward = taxi_env_rewards['bad_pickup']
+                elif action == PICKUP:
+                    picked = self.pickup_passengers(taxi, row, col)
+                    reward = taxi_rewards[EVENT_PICKUP if picked else EVENT_BAD_PICKUP]
+                    if profiler is not None:
+                        counts[COUNT_PICKUPS] += picked
+                        counts[COUNT_BAD_PICKUPS] += not picked
 
                 # Dropoff
-                elif index_action_dictionary[action] == 'dropoff':
-                    successful_dropoff = False
-                    for i, location in enumerate(passengers_status):  # at destination
-                        # Check if we have the passenger and we are at his destination
-                        if location == taxi + 1 and taxi_location == destinations[i]:
-                            passengers_status[i] = -1
-                            reward = taxi_env_rewards['final_dropoff']
-                            successful_dropoff = True
-                        elif location == taxi + 1:  # drops off passenger not at destination
-                            passengers_status[i] = 0
-                            successful_dropoff = True
-                            reward = taxi_env_rewards['intermediate_dropoff']
-                            passengers_start_locations[i] = taxi_location
-                    if not successful_dropoff:  # not carrying a passenger
-                        reward = taxi_env_rewards['bad_dropoff']
+                elif action == DROPOFF:
+                    if profiler is not None:
+                        counts[COUNT_DROPOFFS] += len(self.taxis_passengers[taxi])
+                        counts[COUNT_BAD_DROPOFFS] += not self.taxis_passengers[taxi]
+                    reward = taxi_rewards[self.dropoff_passengers(taxi, row, col)]
 
                 # Turning engine off
-                elif index_action_dictionary[action] == 'turn_engine_off':
-                    reward = taxi_env_rewards['turn_engine_off']
+                elif action == TURN_ENGINE_OFF:
+                    reward = taxi_rewards[EVENT_TURN_ENGINE_OFF]
                     self.engine_status_list[taxi] = 0
 
                 # Standby with engine on
-                elif index_action_dictionary[action] == 'standby':
-                    reward = taxi_env_rewards['standby_engine_on']
+                elif action == STANDBY:
+                    reward = taxi_rewards[EVENT_STANDBY_ENGINE_ON]
 
             # Here we have finished checking for action for taxi-i
+            if profiler is not None:
+                lap = profiler.lap(PHASE_PASSENGERS if action in (PICKUP, DROPOFF) else PHASE_MOVEMENT, lap)
+
             # Fuel consumption
             if moved:
+                if profiler is not None:
+                    counts[COUNT_NO_FUEL if fuel == 0 else COUNT_MOVES] += 1
                 if fuel == 0:
-                    reward = taxi_env_rewards['no_fuel']
+                    reward = taxi_rewards[EVENT_NO_FUEL]
                 else:
                     fuel = max(0, fuel - 1)
+                    self.num_out_of_fuel += fuel == 0
+                    self.move_taxi(taxi, taxi_location, [row, col])
                     taxis_locations[taxi] = [row, col]
                     fuels[taxi] = fuel
+                    if locations_array is not None:
+                        locations_array[taxi, 0], locations_array[taxi, 1] = row, col
+                        fuels_array[taxi] = fuel
 
-            if (not moved) and action in [self.action_index_dictionary[direction] for
-                                          direction in ['north', 'south', 'west', 'east']]:
-                reward = taxi_env_rewards['hit_wall']
+            if (not moved) and direction is not None:
+                reward = taxi_rewards[EVENT_HIT_WALL]
+                if profiler is not None:
+                    counts[COUNT_WALL_HITS] += 1
 
             # taxi refuel
-            if index_action_dictionary[action] == 'refuel':
+            if action == REFUEL:
                 if self.at_valid_fuel_station(taxi, taxis_locations):
+                    self.num_out_of_fuel += (self.max_fuel[taxi] == 0) - (fuels[taxi] == 0)
                     fuels[taxi] = self.max_fuel[taxi]
+                    if fuels_array is not None:
+                        fuels_array[taxi] = fuels[taxi]
+                    if profiler is not None:
+                        counts[COUNT_REFUELS] += 1
                 else:
-                    reward = taxi_env_rewards['bad_refuel']
+                    reward = taxi_rewards[EVENT_BAD_REFUEL]
+                    if profiler is not None:
+                        counts[COUNT_BAD_REFUELS] += 1
+            if profiler is not None:
+                lap = profiler.lap(PHASE_FUEL, lap)
+
+            # The episode is done for good once all the passengers are delivered, all taxis collided or all taxis are
+            # out of fuel (even if a taxi refuels later)
+            if self.done_cause is None:
+                self.done_cause = self.get_done_cause()
+            if profiler is not None:
+                lap = profiler.lap(PHASE_DONE, lap)
+
+            # The state components were updated in place
+            rewards.append(reward)
+            acting_taxis.append(taxi)
+            self.last_action = actions
 
-            # TODO - add feature to describe the 'done' cause
-            # check if all the passengers are at their destinations
-            done = all(loc == -1 for loc in passengers_status)
-            self.dones.append(done)
+        if self.arrival_process is not None and self.done_cause is None:
+            self.spawn_passengers()
+        info = {'taxis_dones': self.get_taxis_dones(), 'done_cause': self.done_cause, 'acting_taxis': acting_taxis}
+        if profiler is not None:
+            now = perf_counter()
+            profiler.timings[PHASE_DONE] += now - lap
+            profiler.total_time += now - step_start
+            profiler.calls += 1
+        return self.state, rewards, self.done_cause is not None, info
+
+    def compile_joint_tables(self) -> dict:
+        """
+        Compiles the array tables of joint_step.
 
-            # check if all taxis collided
-            done = all(self.collided == 1)
-            self.dones.append(done)
+        Returns: dictionary of the tables - the movement table with a trailing "no movement" direction, the direction
+                 of each action, the fuel stations maps by fuel type with the fuel type of each taxi, the rewards
+                 table as an array, and the max fuel of the taxis with the taxis whose fuel is an int
 
-            # check if all taxis are out of fuel
-            done = all(np.array(fuels) == 0)
-            self.dones.append(done)
+        """
+        num_cells = self.num_rows * self.num_columns
+        action_directions = np.full(len(all_action_names), len(self.movement_directions))
+        for action, direction in self.movement_directions.items():
+            action_directions[action] = direction
+        fuel_types = ['F', 'G']
+        fuel_stations = np.stack([self.fuel_stations_maps[fuel_type].ravel() for fuel_type in fuel_types] +
+                                 [np.zeros(num_cells, dtype=bool)])
+        taxis_fuel_types = np.array([fuel_types.index(fuel_type) if fuel_type in fuel_types else len(fuel_types)
+                                     for fuel_type in self.fuel_type_list[:self.num_taxis]])
+        return {'next_cell': np.concatenate([self.next_cell, np.arange(num_cells)[:, None]], axis=1),
+                'action_directions': action_directions, 'fuel_stations': fuel_stations,
+                'taxis_fuel_types': taxis_fuel_types, 'rewards': np.asarray(self.rewards_table),
+                'max_fuel': np.asarray(self.max_fuel[:self.num_taxis]),
+                'int_fuels': np.array([isinstance(fuel, (int, np.integer)) for fuel in self.max_fuel[:self.num_taxis]],
+                                      dtype=bool)}
+
+    def joint_step(self, actions: list) -> (list, list, bool, dict):
+        """
+        Executing the actions of all the taxis at once, with array operations over the taxis. All the taxis act on the
+        state at the start of the step, and the conflicts between them are resolved in bulk:
+            - a move conflicts if its target cell is occupied at the start of the step, or if a taxi with a lower index
+              moves to the same cell.
+            - with option_to_stand_by, conflicting taxis stand by. Otherwise (in collision sensitive domains) they
+              move and collide, with the other taxis moving to their target cell and the taxis on it.
+            - pickups are executed by taxi index, then dropoffs (a passenger dropped off can't be picked up by another
+              taxi in the same step).
+        Taxis that don't interact behave as in the serialized step, which is the reference semantics. Taxis collided
+        during the step still execute their action.
+        Args:
+            actions: list[int] - list of actions to take.
 
-            rewards.append(reward)
-            self.state = [taxis_locations, fuels, passengers_start_locations, destinations, passengers_status]
-            self.last_action = actions
+        Returns: list of next_state, reward_collected, is_done and an info dictionary, as step
 
-        return self.state, rewards, any(self.dones)
+        """
+        if self.joint_tables is None:
+            self.joint_tables = self.compile_joint_tables()
+        tables = self.joint_tables
+        profiler = self.profiler
+        if profiler is not None:
+            step_start = lap = perf_counter()
+
+        joint_actions = actions
+        actions = np.array(actions, dtype=np.int64).reshape(-1)
+        num_acting = len(actions)
+        if self.compact_state:
+            record = self.array_state.record
+            taxis_locations, fuels = record['taxis_locations'], record['fuels']
+            all_cells = taxis_locations[:, 0].astype(np.int64) * self.num_columns + taxis_locations[:, 1]
+        else:
+            if self.joint_arrays is None:
+                taxis_locations = np.array(self.state[0], dtype=np.int64).reshape(-1, 2)
+                self.joint_arrays = (taxis_locations[:, 0] * self.num_columns + taxis_locations[:, 1],
+                                     np.array(self.state[1]))
+            all_cells, fuels = self.joint_arrays
+        cells = all_cells[:num_acting].copy()
+        fuel = fuels[:num_acting].copy()
+
+        # Collided taxis and taxis out of fuel (unless at a suitable fuel station) can't perform a step
+        at_fuel_station = tables['fuel_stations'][tables['taxis_fuel_types'][:num_acting], cells]
+        active = (self.collided[:num_acting] != 1) & ~((fuel == 0) & ~at_fuel_station)
+        engine_on = np.array(self.engine_status_list[:num_acting], dtype=bool)
+        taxi_rewards = tables['rewards'][:num_acting]
+        reward = taxi_rewards[:, EVENT_STEP].copy()
+
+        # Engine is off
+        engine_off = active & ~engine_on
+        standby = engine_off & (actions == STANDBY)
+        reward[standby] = taxi_rewards[standby, EVENT_STANDBY_ENGINE_OFF]
+        turned_on = engine_off & (actions == TURN_ENGINE_ON)
+        reward[turned_on] = taxi_rewards[turned_on, EVENT_TURN_ENGINE_ON]
+
+        # Movement
+        engine_on &= active
+        directions = tables['action_directions'][actions]
+        is_move = directions < len(self.movement_directions)
+        new_cells = np.where(engine_on, tables['next_cell'][cells, directions], cells)
+        moved = new_cells != cells
+        if profiler is not None:
+            lap = profiler.lap(PHASE_MOVEMENT, lap)
+
+        # Conflicts of the moves
+        if self.collision_sensitive_domain and moved.any():
+            movers = np.flatnonzero(moved)
+            targets = new_cells[movers]
+            order = np.argsort(targets, kind='stable')
+            shared = np.zeros(len(movers), dtype=bool)
+            shared[order[1:]] = targets[order[1:]] == targets[order[:-1]]
+            conflicts = (self.occupancy.ravel()[targets] > 0) | shared
+            if self.option_to_standby:
+                moved[movers[conflicts]] = False
+                new_cells[movers[conflicts]] = cells[movers[conflicts]]
+                actions[movers[conflicts]] = STANDBY
+                is_move[movers[conflicts]] = False
+            else:
+                collision_cells = targets[conflicts]
+                self.collided[np.isin(all_cells, collision_cells)] = 1
+                self.collided[movers[np.isin(targets, collision_cells)]] = 1
+                reward[movers[conflicts]] = taxi_rewards[movers[conflicts], EVENT_COLLISION]
+            if profiler is not None:
+                profiler.counts[COUNT_FORCED_STANDBYS if self.option_to_standby else COUNT_COLLISIONS] += \
+                    int(conflicts.sum())
+                lap = profiler.lap(PHASE_COLLISION, lap)
+
+        # Pickups by taxi index, then dropoffs
+        picking = np.flatnonzero(engine_on & (actions == PICKUP))
+        dropping = np.flatnonzero(engine_on & (actions == DROPOFF))
+        for taxi in picking.tolist():
+            picked = self.pickup_passengers(taxi, *divmod(int(cells[taxi]), self.num_columns))
+            reward[taxi] = taxi_rewards[taxi, EVENT_PICKUP if picked else EVENT_BAD_PICKUP]
+            if profiler is not None:
+                profiler.counts[COUNT_PICKUPS] += picked
+                profiler.counts[COUNT_BAD_PICKUPS] += not picked
+        for taxi in dropping.tolist():
+            if profiler is not None:
+                profiler.counts[COUNT_DROPOFFS] += len(self.taxis_passengers[taxi])
+                profiler.counts[COUNT_BAD_DROPOFFS] += not self.taxis_passengers[taxi]
+            event = self.dropoff_passengers(taxi, *divmod(int(cells[taxi]), self.num_columns))
+            reward[taxi] = taxi_rewards[taxi, event]
+        if profiler is not None:
+            lap = profiler.lap(PHASE_PASSENGERS, lap)
+
+        # Turning engine off / standby with engine on
+        turned_off = engine_on & (actions == TURN_ENGINE_OFF)
+        reward[turned_off] = taxi_rewards[turned_off, EVENT_TURN_ENGINE_OFF]
+        standby = engine_on & (actions == STANDBY)
+        reward[standby] = taxi_rewards[standby, EVENT_STANDBY_ENGINE_ON]
+        for taxi in np.flatnonzero(turned_on).tolist():
+            self.engine_status_list[taxi] = 1
+        for taxi in np.flatnonzero(turned_off).tolist():
+            self.engine_status_list[taxi] = 0
+
+        # Fuel consumption
+        no_fuel = moved & (fuel == 0)
+        reward[no_fuel] = taxi_rewards[no_fuel, EVENT_NO_FUEL]
+        driving = np.flatnonzero(moved & ~no_fuel)
+        fuel[driving] -= 1
+
+        # A move action that left the taxi in place hit a wall
+        hit_wall = active & ~moved & is_move
+        reward[hit_wall] = taxi_rewards[hit_wall, EVENT_HIT_WALL]
+
+        # Taxi refuel - refueling taxis don't move, so they refuel at their cell
+        refueling = active & (actions == REFUEL)
+        refueled = refueling & at_fuel_station
+        fuel[refueled] = tables['max_fuel'][:num_acting][refueled]
+        bad_refuel = refueling & ~at_fuel_station
+        reward[bad_refuel] = taxi_rewards[bad_refuel, EVENT_BAD_REFUEL]
+
+        # Moving the taxis - the taxis of the cells are rebuilt on demand (see cell_taxis)
+        if len(driving):
+            old_cells, driving_cells = cells[driving], new_cells[driving]
+            all_cells[driving] = driving_cells
+            occupancy = self.occupancy.ravel()
+            np.subtract.at(occupancy, old_cells, 1)
+            np.add.at(occupancy, driving_cells, 1)
+            self.taxis_of_cells = None
+            if self.compact_state:
+                taxis_locations[driving, 0], taxis_locations[driving, 1] = np.divmod(driving_cells, self.num_columns)
+            else:
+                self.state[0][:] = np.stack(np.divmod(all_cells, self.num_columns), axis=1).tolist()
+        fuels[:num_acting] = fuel
+        if not self.compact_state and (len(driving) or refueled.any()):
+            # The fuels are written as the serialized step leaves them: ints for the taxis with an int max fuel, even
+            # when the fuel array is a float array (some taxi has infinite fuel)
+            fuel_values = fuels.astype(object)
+            int_fuels = tables['int_fuels']
+            fuel_values[int_fuels] = fuels[int_fuels].astype(np.int64)
+            self.state[1][:] = fuel_values.tolist()
+        if profiler is not None:
+            counts = profiler.counts
+            counts[COUNT_ACTIONS] += int(active.sum())
+            counts[COUNT_SKIPPED] += num_acting - int(active.sum())
+            counts[COUNT_MOVES] += len(driving)
+            counts[COUNT_NO_FUEL] += int(no_fuel.sum())
+            counts[COUNT_WALL_HITS] += int(hit_wall.sum())
+            counts[COUNT_REFUELS] += int(refueled.sum())
+            counts[COUNT_BAD_REFUELS] += int(bad_refuel.sum())
+            lap = profiler.lap(PHASE_FUEL, lap)
+
+        # The episode is done for good once all the passengers are delivered, all taxis collided or all taxis are out
+        # of fuel
+        collided = self.collided == 1
+        self.num_collided = int(np.count_nonzero(collided))
+        self.num_out_of_fuel = int(np.count_nonzero(fuels == 0))
+        if active.any():
+            if self.done_cause is None:
+                self.done_cause = self.get_done_cause()
+            self.last_action = joint_actions
+
+        if self.arrival_process is not None and self.done_cause is None:
+            self.spawn_passengers()
+
+        # Taxis are done as in get_taxis_dones
+        if self.done_cause is None:
+            taxis_dones = (collided | ((fuels == 0) &
+                                       ~tables['fuel_stations'][tables['taxis_fuel_types'], all_cells])).tolist()
+        else:
+            taxis_dones = [True] * self.num_taxis
+        rewards = reward[active].tolist()
+        info = {'taxis_dones': taxis_dones, 'done_cause': self.done_cause,
+                'acting_taxis': np.flatnonzero(active).tolist()}
+        if profiler is not None:
+            now = perf_counter()
+            profiler.timings[PHASE_DONE] += now - lap
+            profiler.total_time += now - step_start
+            profiler.calls += 1
+        return self.state, rewards, self.done_cause is not None, info
 
     def render(self, mode: str = 'human') -> str:
         """
         Renders the domain map at the current state
         Args:
-            mode: Demand mode (file or human watching).
+            mode: Demand mode (file or human watching). The 'human_diff' and 'ansi_diff' modes only redraw what changed
+                  since the previous frame, see rendering.IncrementalRenderer. The 'rgb_array' mode draws an image of
+                  the map, see rendering.RgbRenderer.
 
-        Returns: Value string of writing the output
+        Returns: Value string of writing the output (an image array of shape [height, width, 3] for 'rgb_array')
 
         """
+        if mode == 'rgb_array':
+            if self.rgb_renderer is None:
+                self.rgb_renderer = RgbRenderer(self, tile_size=self.render_tile_size)
+            return self.rgb_renderer.render()
+        if mode in ['human_diff', 'ansi_diff']:
+            if self.incremental_renderer is None:
+                self.incremental_renderer = IncrementalRenderer(self, max_fps=self.render_max_fps,
+                                                                frame_skip=self.render_frame_skip)
+            return self.incremental_renderer.render(sys.stdout if mode == 'human_diff' else None)
+
         outfile = StringIO() if mode == 'ansi' else sys.stdout
 
         # Copy map to work on
-        out = self.desc.copy().tolist()
-        out = [[c.decode('utf-8') for c in line] for line in out]
+        out = [list(line) for line in self.get_map_lines()]
+        for (row, col), cell in self.render_overlays().items():
+            out[1 + row][2 * col + 1] = cell
+        outfile.write("\n".join(["".join(row) for row in out]) + "\n")
+        outfile.write("".join(line + "\n" for line in self.render_status()))
+
+        # No need to return anything for human
+        if mode != 'human':
+            with closing(outfile):
+                return outfile.getvalue()
+
+    def get_map_lines(self) -> list:
+        """
+        Returns: the lines of the (static) map as lists of characters, decoded once and cached.
+
+        """
+        if self.map_lines is None:
+            self.map_lines = [list(line.tobytes().decode('utf-8')) for line in self.desc]
+        return self.map_lines
 
+    def render_overlays(self) -> dict:
+        """
+        Renders the dynamic cells of the map at the current state: passengers, taxis and destinations, colored
+        in this order (a cell covered by several of them gets nested colors).
+
+        Returns: dictionary (row, col) -> colored string of the cell, for the cells covered by any of them
+
+        """
         taxis, fuels, passengers_start_coordinates, destinations, passengers_locations = self.state
+        colors = [TAXIS_COLORS[taxi % len(TAXIS_COLORS)] for taxi in range(len(taxis))]  # Cycling for large fleets
+        cells = {}
 
-        colors = ['yellow', 'red', 'white', 'green', 'cyan', 'crimson', 'gray', 'magenta'] * 5
-        colored = [False] * self.num_taxis
+        def cell(row, col):
+            return cells.get((row, col)) or str(self.cell_types[row, col])
 
         def ul(x):
             """returns underline instead of spaces when called"""
@@ -493,51 +1383,65 @@ class TaxiEnv(gym.Env):
                 taxi_row, taxi_col = taxis[location - 1]
 
                 # Coloring taxi's coordinate on the map
-                out[1 + taxi_row][2 * taxi_col + 1] = utils.colorize(
-                    out[1 + taxi_row][2 * taxi_col + 1], colors[location - 1], highlight=True, bold=True)
-                colored[location - 1] = True
+                cells[(taxi_row, taxi_col)] = utils.colorize(cell(taxi_row, taxi_col), colors[location - 1],
+                                                             highlight=True, bold=True)
             else:  # Passenger isn't in a taxi
                 # Coloring passenger's coordinates on the map
                 pi, pj = passengers_start_coordinates[i]
-                out[1 + pi][2 * pj + 1] = utils.colorize(out[1 + pi][2 * pj + 1], 'blue', bold=True)
+                cells[(pi, pj)] = utils.colorize(cell(pi, pj), 'blue', bold=True)
 
         for i, taxi in enumerate(taxis):
+            taxi_row, taxi_col = taxi
             if self.collided[i] == 0:  # Taxi isn't collided
-                taxi_row, taxi_col = taxi
-                out[1 + taxi_row][2 * taxi_col + 1] = utils.colorize(
-                    ul(out[1 + taxi_row][2 * taxi_col + 1]), colors[i], highlight=True)
+                cells[(taxi_row, taxi_col)] = utils.colorize(ul(cell(taxi_row, taxi_col)), colors[i], highlight=True)
             else:  # Collided!
-                taxi_row, taxi_col = taxi
-                out[1 + taxi_row][2 * taxi_col + 1] = utils.colorize(
-                    ul(out[1 + taxi_row][2 * taxi_col + 1]), 'gray', highlight=True)
+                cells[(taxi_row, taxi_col)] = utils.colorize(ul(cell(taxi_row, taxi_col)), 'gray', highlight=True)
 
         for dest in destinations:
             di, dj = dest
-            out[1 + di][2 * dj + 1] = utils.colorize(out[1 + di][2 * dj + 1], 'magenta')
-        outfile.write("\n".join(["".join(row) for row in out]) + "\n")
+            cells[(di, dj)] = utils.colorize(cell(di, dj), 'magenta')
+        return cells
 
+    def render_status(self) -> list:
+        """
+        Renders the text lines below the map: the last actions, and the status of every taxi and passenger.
+
+        Returns: list of lines (without line breaks)
+
+        """
+        taxis, fuels, passengers_start_coordinates, destinations, passengers_locations = self.state
+        colors = [TAXIS_COLORS[taxi % len(TAXIS_COLORS)] for taxi in range(len(taxis))]  # Cycling for large fleets
+        lines = []
         if self.last_action is not None:
             moves = all_action_names
             output = [moves[i] for i in self.last_action]
-            outfile.write("  ({})\n".format(' ,'.join(output)))
+            lines.append("  ({})".format(' ,'.join(output)))
         for i, taxi in enumerate(taxis):
-            outfile.write("Taxi{}-{}: Fuel: {}, Location: ({},{}), Collided: {}\n".format(i + 1, colors[i].upper(),
-                                                                                          fuels[i], taxi[0], taxi[1],
-                                                                                          self.collided[i] == 1))
+            lines.append("Taxi{}-{}: Fuel: {}, Location: ({},{}), Collided: {}".format(i + 1, colors[i].upper(),
+                                                                                      fuels[i], taxi[0], taxi[1],
+                                                                                      self.collided[i] == 1))
         for i, location in enumerate(passengers_locations):
             start = tuple(passengers_start_coordinates[i])
             end = tuple(destinations[i])
             if location < 0:
-                outfile.write("Passenger{}: Location: Arrived!, Destination: {}\n".format(i + 1, end))
+                lines.append("Passenger{}: Location: Arrived!, Destination: {}".format(i + 1, end))
             if location == 0:
-                outfile.write("Passenger{}: Location: {}, Destination: {}\n".format(i + 1, start, end))
+                lines.append("Passenger{}: Location: {}, Destination: {}".format(i + 1, start, end))
             else:
-                outfile.write("Passenger{}: Location: Taxi{}, Destination: {}\n".format(i + 1, location, end))
+                lines.append("Passenger{}: Location: Taxi{}, Destination: {}".format(i + 1, location, end))
+        return lines
 
-        # No need to return anything for human
-        if mode != 'human':
-            with closing(outfile):
-                return outfile.getvalue()
+    def get_observations(self, state: list = None) -> np.array:
+        """
+        Encodes the observations of all the taxis into a single array (see observation.ObservationEncoder), refilled in
+        place on every call.
+        Args:
+            state: state of the domain, the current state if None
+
+        Returns: array of shape observation_space.shape, row i being the observation of taxi i
+
+        """
+        return self.observation_encoder.encode(state)
 
     @staticmethod
     def partial_observations(state: list) -> list:
@@ -550,6 +1454,10 @@ class TaxiEnv(gym.Env):
 
         """
 
+        if isinstance(state, ArrayState):
+            passengers_information = state.passengers_information()
+            return [state.observation(i, passengers_information) for i in range(len(state[0]))]
+
         def flatten(x):
             return [item for sub in x for item in sub]
 
@@ -574,6 +1482,9 @@ class TaxiEnv(gym.Env):
         Returns: observation of the specified agent (state wise)
 
         """
+        if isinstance(state, ArrayState):
+            return state.observation(agent_index)
+
         def flatten(x):
             return [item for sub in x for item in sub]
 
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from multitaxienv.batched_taxi_environment import BatchedTaxiEnv
+from multitaxienv.config import all_action_names
+from multitaxienv.taxi_environment import TaxiEnv, REWARD_EVENTS
+
+# Every reward event gets its own non-zero reward, so the rewards tell which event happened, and the taxis that didn't
+# act (0 in BatchedTaxiEnv, left out by TaxiEnv) are told apart
+EVENTS_REWARDS = {event: float(index + 1) for index, event in enumerate(REWARD_EVENTS)}
+
+# Small map where random taxis with infinite fuel deliver passengers
+SMALL_MAP = [
+    "+---+",
+    "|X:X|",
+    "|X:X|",
+    "+---+",
+]
+
+CONFIGS = [
+    dict(num_taxis=2, num_passengers=3, max_fuel=[5, 4], taxis_capacity=[2, 1], fuel_type_list=['F', 'G']),
+    dict(num_taxis=3, num_passengers=3, max_fuel=[6, 3, 4], taxis_capacity=[1, 2, 1], fuel_type_list=['F', 'G', 'F'],
+         collision_sensitive_domain=True),
+    dict(num_taxis=3, num_passengers=4, max_fuel=[4, 4, 3], taxis_capacity=[2, 3, 1], fuel_type_list=['G', 'F', 'F'],
+         collision_sensitive_domain=True, option_to_stand_by=False),
+    dict(num_taxis=2, num_passengers=2, max_fuel=[np.inf, np.inf], taxis_capacity=[1, 2], fuel_type_list=['F', 'F'],
+         domain_map=SMALL_MAP),
+]
+
+
+def sync(env: TaxiEnv, batched: BatchedTaxiEnv, index: int):
+    """
+    Sets the TaxiEnv to the state of an environment of the BatchedTaxiEnv.
+    """
+    env.state = batched.get_state(index)
+    env.collided[...] = batched.collided[index]
+    env.engine_status_list = batched.engine_status[index].astype(float).tolist()
+    env.last_action = None
+    env.rebuild_indexes()
+
+
+def can_act(env: TaxiEnv) -> np.array:
+    taxis_locations, fuels = env.state[0], env.state[1]
+    return np.array([env.collided[taxi] != 1 and (fuel > 0 or env.at_valid_fuel_station(taxi, taxis_locations))
+                     for taxi, fuel in enumerate(fuels)])
+
+
+def run(config: dict, num_envs: int = 32, num_steps: int = 150, seed: int = 0) -> set:
+    taxis_rewards = [EVENTS_REWARDS] * config['num_taxis']
+    batched = BatchedTaxiEnv(num_envs, auto_reset=False, taxis_rewards=taxis_rewards, **config)
+    batched.seed(seed)
+    batched.reset()
+    envs = [TaxiEnv(taxis_rewards=taxis_rewards, **config) for _ in range(num_envs)]
+    for index, env in enumerate(envs):
+        sync(env, batched, index)
+
+    rng = np.random.default_rng(seed)
+    events = set()
+    for _ in range(num_steps):
+        actions = rng.integers(len(all_action_names), size=(num_envs, config['num_taxis']))
+        acting = [can_act(env) for env in envs]
+        _, rewards, dones, _ = batched.step(actions)
+        for index, env in enumerate(envs):
+            state, env_rewards, done, _ = env.step(actions[index].tolist())
+            assert batched.get_state(index) == [list(map(list, state[0])), list(map(float, state[1])),
+                                                list(map(list, state[2])), list(map(list, state[3])),
+                                                list(state[4])]
+            assert rewards[index][rewards[index] != 0].tolist() == env_rewards
+            assert not rewards[index][~acting[index]].any()
+            assert bool(dones[index]) == done
+            assert batched.collided[index].tolist() == [collided == 1 for collided in env.collided]
+            assert batched.engine_status[index].tolist() == [bool(status) for status in env.engine_status_list]
+            events.update(env_rewards)
+
+        # Finished episodes start over from the same reset in both environments
+        if dones.any():
+            batched.reset_envs(dones)
+            for index in np.flatnonzero(dones):
+                sync(envs[index], batched, index)
+    return events
+
+
+@pytest.mark.parametrize('config', CONFIGS)
+def test_batched_step_matches_taxi_env_step(config):
+    run(config)
+
+
+def test_all_reward_events_are_covered():
+    events = set()
+    for config in CONFIGS:
+        events |= run(config)
+    assert events == set(EVENTS_REWARDS.values())
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from multitaxienv.config import all_action_names
+from multitaxienv.taxi_environment import TaxiEnv
+
+CONFIGS = [
+    dict(num_taxis=2, num_passengers=3, max_fuel=[5, 4], taxis_capacity=[2, 1], fuel_type_list=['F', 'G']),
+    dict(num_taxis=3, num_passengers=3, max_fuel=[6, np.inf, 4], taxis_capacity=[1, 2, 1],
+         fuel_type_list=['F', 'G', 'F'], collision_sensitive_domain=True),
+    dict(num_taxis=3, num_passengers=4, max_fuel=[4, 4, 3], taxis_capacity=[2, 3, 1], fuel_type_list=['G', 'F', 'F'],
+         collision_sensitive_domain=True, option_to_stand_by=False),
+]
+
+
+@pytest.mark.parametrize('joint_execution', [False, True])
+@pytest.mark.parametrize('config', CONFIGS)
+def test_compact_state_matches_list_state(config, joint_execution):
+    envs = [TaxiEnv(compact_state=compact, joint_execution=joint_execution, **config) for compact in (False, True)]
+    for env in envs:
+        env.seed(0)
+        env.reset()
+
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        actions = rng.integers(len(all_action_names), size=config['num_taxis']).tolist()
+        (list_state, *list_result), (compact_state, *compact_result) = [env.step(actions) for env in envs]
+        assert compact_state.tolist() == list_state
+        assert compact_result == list_result
+        assert envs[1].engine_status_list == envs[0].engine_status_list
+        assert (envs[1].collided == envs[0].collided).all()
+        if list_result[1]:
+            for env in envs:
+                env.reset()
@@ -0,0 +1,36 @@
+import numpy as np
+
+from multitaxienv.demand import PoissonArrivals
+from multitaxienv.taxi_environment import TaxiEnv
+
+
+def pool_counters(env: TaxiEnv) -> tuple:
+    pool = env.passenger_pool
+    return pool.num_arrivals, pool.num_dropped, pool.num_deliveries
+
+
+def test_restore_restores_the_pool_counters():
+    env = TaxiEnv(num_taxis=2, num_passengers=3, max_fuel=[np.inf] * 2, taxis_capacity=[2, 2],
+                  arrival_process=PoissonArrivals(0.5, initial_passengers=2))
+    env.seed(0)
+    env.reset()
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        env.step(rng.integers(6, size=2).tolist())
+
+    snapshot = env.snapshot()
+    assert snapshot.pool_counters == pool_counters(env)
+    for _ in range(200):
+        env.step(rng.integers(6, size=2).tolist())
+    assert pool_counters(env) != snapshot.pool_counters
+
+    env.restore(snapshot)
+    assert pool_counters(env) == snapshot.pool_counters
+    assert env.snapshot() == snapshot
+
+
+def test_snapshot_without_demand_has_no_pool_counters():
+    env = TaxiEnv()
+    env.seed(0)
+    env.reset()
+    assert env.snapshot().pool_counters is None
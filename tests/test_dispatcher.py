@@ -0,0 +1,93 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from multitaxienv.map_generator import generate_map
+from multitaxienv.taxi_environment import TaxiEnv
+from TaxiWrapper.dispatcher import Dispatcher, hungarian, INFEASIBLE
+
+
+def brute_force_cost(cost: np.array) -> float:
+    if cost.shape[0] > cost.shape[1]:
+        cost = cost.T
+    rows = range(cost.shape[0])
+    return min(cost[rows, list(cols)].sum() for cols in itertools.permutations(range(cost.shape[1]), cost.shape[0]))
+
+
+@pytest.mark.parametrize('shape', [(1, 1), (1, 4), (4, 4), (3, 6), (6, 3), (5, 5)])
+def test_hungarian_finds_a_minimum_cost_assignment(shape):
+    rng = np.random.default_rng(sum(shape))
+    for _ in range(20):
+        # Few distinct values, so there are ties
+        cost = rng.integers(0, 5, size=shape).astype(float)
+        rows, cols = hungarian(cost)
+        assert len(rows) == min(shape)
+        assert len(set(rows.tolist())) == len(rows) and len(set(cols.tolist())) == len(cols)
+        assert (np.diff(rows) > 0).all()
+        assert cost[rows, cols].sum() == brute_force_cost(cost)
+
+
+def make_env() -> TaxiEnv:
+    env = TaxiEnv(num_taxis=4, num_passengers=6, max_fuel=[30, 20, np.inf, 25], taxis_capacity=[2, 1, 3, 1],
+                  fuel_type_list=['F', 'G', 'F', 'G'], domain_map=generate_map(8, 8, num_pickups=8, seed=0))
+    env.seed(0)
+    env.reset()
+    return env
+
+
+def reference_cost(dispatcher: Dispatcher, taxi: int, passenger: int) -> float:
+    """
+    Cost of a pair computed with one shortest path query per leg.
+    """
+    env, graph = dispatcher.taxi_env, dispatcher.env_graph
+    taxis_locations, fuels, starts, destinations, _ = env.state
+    location, start, destination = taxis_locations[taxi], starts[passenger], destinations[passenger]
+    trip = graph.get_distance(start, destination)
+    costs = []
+    if graph.get_distance(location, start) + trip <= fuels[taxi]:
+        costs.append(graph.get_distance(location, start))
+    for station in np.argwhere(env.fuel_stations_maps[env.fuel_type_list[taxi]]).tolist():
+        if graph.get_distance(location, station) <= fuels[taxi] and \
+                graph.get_distance(station, start) + trip <= env.max_fuel[taxi]:
+            costs.append(graph.get_distance(location, station) + dispatcher.refuel_cost +
+                         graph.get_distance(station, start))
+    return min(costs, default=INFEASIBLE)
+
+
+def test_cost_matrix_accounts_for_fuel():
+    env = make_env()
+    dispatcher = Dispatcher(env)
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        env.reset()
+        env.state[1] = [int(rng.integers(fuel + 1)) if np.isfinite(fuel) else fuel for fuel in env.max_fuel[:4]]
+        cost = dispatcher.cost_matrix(list(range(4)), list(range(6)))
+        expected = [[reference_cost(dispatcher, taxi, passenger) for passenger in range(6)] for taxi in range(4)]
+        assert cost.tolist() == expected
+
+
+def test_dispatch_respects_the_seats():
+    env = make_env()
+    env.state[1][0] = 0  # Taxi 0 can't reach any passenger unless it is on a fuel station
+    env.collided[3] = 1
+    dispatcher = Dispatcher(env)
+    assignments = dispatcher.dispatch()
+    cost = dispatcher.cost_matrix(list(range(4)), list(range(6)))
+
+    assert 3 not in assignments.values()
+    for taxi, passengers in dispatcher.taxis_passengers().items():
+        assert len(passengers) <= env.taxis_capacity[taxi]
+        assert all(cost[taxi, passenger] < INFEASIBLE for passenger in passengers)
+    # No free seat is left to a waiting passenger that could take it
+    waiting = [passenger for passenger in range(6) if passenger not in assignments]
+    assert waiting and assignments
+    assert all(cost[taxi, passenger] == INFEASIBLE for taxi in dispatcher.free_seats() for passenger in waiting)
+
+    # Dispatching again keeps the assignments, picking up a passenger releases its assignment
+    assert dispatcher.dispatch() == assignments
+    passenger, taxi = next(iter(assignments.items()))
+    env.state[4][passenger] = taxi + 1
+    assert passenger not in dispatcher.dispatch()
+    assert dispatcher.free_seats().get(taxi, 0) == env.taxis_capacity[taxi] - \
+        sum(status == taxi + 1 for status in env.state[4]) - len(dispatcher.taxis_passengers().get(taxi, []))
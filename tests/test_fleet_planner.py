@@ -0,0 +1,78 @@
+import numpy as np
+
+from multitaxienv.map_generator import generate_map
+from multitaxienv.profiling import COUNTERS
+from multitaxienv.taxi_environment import TaxiEnv
+from TaxiWrapper.fleet_planner import FleetPlanner
+
+
+def make_env(num_taxis: int) -> TaxiEnv:
+    env = TaxiEnv(num_taxis=num_taxis, num_passengers=1, max_fuel=[np.inf] * num_taxis,
+                  taxis_capacity=[1] * num_taxis, fuel_type_list=['F'] * num_taxis,
+                  domain_map=generate_map(8, 8, wall_density=0.3, seed=0), collision_sensitive_domain=True,
+                  option_to_stand_by=True)
+    env.seed(0)
+    env.reset()
+    return env
+
+
+def conflicts(paths: dict) -> list:
+    """
+    Returns the (taxi, taxi, time) conflicts of planned paths under the serialized execution of the step: two taxis at
+    the same node at the same time, or a taxi entering the node that a taxi with a higher index is still at.
+    """
+    horizon = max(len(path) for path in paths.values())
+    at = {taxi: [path[min(time, len(path) - 1)] for time in range(horizon)] for taxi, path in paths.items()}
+    found = []
+    for taxi in at:
+        for other in at:
+            if other == taxi:
+                continue
+            for time in range(horizon):
+                if other > taxi and at[taxi][time] == at[other][time]:
+                    found.append((taxi, other, time))
+                if time and at[taxi][time] != at[taxi][time - 1] and other > taxi and \
+                        at[taxi][time] == at[other][time - 1]:
+                    found.append((taxi, other, time))
+    return found
+
+
+def test_plans_are_conflict_free():
+    env = make_env(10)
+    planner = FleetPlanner(env, window=12)
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        goals = {taxi: rng.integers(8, size=2).tolist() for taxi in range(env.num_taxis) if rng.random() < 0.8}
+        plans = planner.plan(goals)
+        assert set(plans) <= set(goals)
+        paths = {taxi: planner.paths.get(taxi, [planner.env_graph.cors_to_node(*location)])
+                 for taxi, location in enumerate(env.state[0])}
+        assert conflicts(paths) == []
+        for taxi, actions in plans.items():
+            assert len(actions) == len(paths[taxi]) - 1 <= planner.window
+
+        # Following the plans for a few steps keeps the taxis on their paths
+        for time in range(1, 4):
+            env.step([plans[taxi][time - 1] if taxi in plans and time <= len(plans[taxi]) else planner.wait_action
+                      for taxi in range(env.num_taxis)])
+            for taxi, path in paths.items():
+                assert planner.env_graph.cors_to_node(*env.state[0][taxi]) == path[min(time, len(path) - 1)]
+
+
+def test_next_actions_drive_without_collisions():
+    env = make_env(8)
+    planner = FleetPlanner(env, window=8)
+    rng = np.random.default_rng(1)
+    goals = {taxi: rng.integers(8, size=2).tolist() for taxi in range(env.num_taxis)}
+    reached = 0
+    with env.profile() as profiler:
+        for _ in range(300):
+            env.step(planner.next_actions(goals))
+            for taxi, location in enumerate(env.state[0]):
+                if location == goals[taxi]:
+                    reached += 1
+                    goals[taxi] = rng.integers(8, size=2).tolist()
+    counters = dict(zip(COUNTERS, profiler.counts))
+    assert counters['collisions'] == 0 and counters['forced_standbys'] == 0
+    assert not env.collided.any()
+    assert reached > 2 * env.num_taxis
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(statement: str) -> set:
+    """
+    Returns: the top level modules loaded by a fresh interpreter running the import statement.
+
+    """
+    script = 'import sys\n{}\nprint(" ".join(sorted({{name.split(".")[0] for name in sys.modules}})))'.format(statement)
+    output = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True, cwd=ROOT).stdout
+    return set(output.split())
+
+
+def test_gym_and_networkx_are_imported_lazily():
+    modules = imported_modules('import multitaxienv.observation, multitaxienv.state, multitaxienv.map_generator\n'
+                               'import TaxiWrapper.taxi_wrapper, TaxiWrapper.dispatcher, TaxiWrapper.fleet_planner')
+    assert 'numpy' in modules
+    assert not modules & {'gym', 'networkx', 'scipy'}
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from multitaxienv.config import all_action_names
+from multitaxienv.taxi_environment import TaxiEnv, PICKUP, DROPOFF, STANDBY
+
+CONFIGS = [
+    dict(num_taxis=3, num_passengers=3, max_fuel=[5, 4, 6], taxis_capacity=[2, 1, 1], fuel_type_list=['F', 'G', 'F']),
+    dict(num_taxis=3, num_passengers=3, max_fuel=[6, np.inf, 4], taxis_capacity=[1, 2, 1],
+         fuel_type_list=['F', 'G', 'F'], collision_sensitive_domain=True),
+    dict(num_taxis=4, num_passengers=4, max_fuel=[np.inf] * 4, taxis_capacity=[2, 3, 1, 1],
+         collision_sensitive_domain=True),
+]
+
+
+def without_interactions(env: TaxiEnv, actions: list) -> list:
+    """
+    Replaces the actions through which taxis would interact in a joint step by stand-bys: the moves to a cell occupied
+    at the start of the step or targeted by another taxi (in collision sensitive domains), and the pickups at the cell
+    of a taxi dropping off.
+    """
+    tables = env.compile_joint_tables()
+    cells = [row * env.num_columns + col for row, col in env.state[0]]
+    targets = [int(tables['next_cell'][cell, tables['action_directions'][action]])
+               for cell, action in zip(cells, actions)]
+    dropping_cells = {cell for cell, action in zip(cells, actions) if action == DROPOFF}
+
+    actions = list(actions)
+    for taxi, (cell, target) in enumerate(zip(cells, targets)):
+        moving = target != cell
+        if moving and env.collision_sensitive_domain and (target in cells or targets.count(target) > 1):
+            actions[taxi] = STANDBY
+        if actions[taxi] == PICKUP and cell in dropping_cells:
+            actions[taxi] = STANDBY
+    return actions
+
+
+def check_indexes(env: TaxiEnv):
+    """
+    Checks that the indexes kept up to date by the step (and the arrays joint_step keeps between its calls) match the
+    ones rebuilt from the state.
+    """
+    if env.joint_arrays is not None:
+        cells, fuels = env.joint_arrays
+        assert cells.tolist() == [row * env.num_columns + col for row, col in env.state[0]]
+        assert fuels.tolist() == list(env.state[1])
+    indexes = (env.occupancy.copy(), dict(env.cell_taxis), dict(env.waiting_passengers),
+               [list(passengers) for passengers in env.taxis_passengers],
+               env.num_delivered, env.num_collided, env.num_out_of_fuel)
+    env.rebuild_indexes()
+    rebuilt = (env.occupancy, env.cell_taxis, env.waiting_passengers, env.taxis_passengers,
+               env.num_delivered, env.num_collided, env.num_out_of_fuel)
+    assert (indexes[0] == rebuilt[0]).all()
+    assert indexes[1:] == rebuilt[1:]
+
+
+@pytest.mark.parametrize('compact_state', [False, True])
+@pytest.mark.parametrize('config', CONFIGS)
+def test_joint_step_matches_serial_step_without_interactions(config, compact_state):
+    envs = [TaxiEnv(joint_execution=joint, compact_state=compact_state, **config) for joint in (False, True)]
+    for env in envs:
+        env.seed(0)
+        env.reset()
+
+    rng = np.random.default_rng(0)
+    for step in range(2000):
+        actions = without_interactions(envs[0], rng.integers(len(all_action_names), size=config['num_taxis']))
+        (serial_state, *serial_result), (joint_state, *joint_result) = [env.step(actions) for env in envs]
+        if compact_state:
+            serial_state, joint_state = serial_state.tolist(), joint_state.tolist()
+        assert joint_state == serial_state
+        assert [type(fuel) for fuel in joint_state[1]] == [type(fuel) for fuel in serial_state[1]]
+        assert joint_result == serial_result
+        assert envs[1].engine_status_list == envs[0].engine_status_list
+        assert (envs[1].collided == envs[0].collided).all()
+        if step % 50 == 0:  # Rebuilding the indexes drops the arrays kept by joint_step
+            check_indexes(envs[1])
+        if serial_result[1]:
+            for env in envs:
+                env.reset()
+
+
+def test_joint_step_conflicting_moves_stand_by():
+    env = TaxiEnv(num_taxis=2, num_passengers=2, collision_sensitive_domain=True, joint_execution=True)
+    env.seed(0)
+    env.reset()
+    env.state[0] = [[0, 0], [1, 0]]
+    env.rebuild_indexes()
+
+    # Taxi 1 moves to the cell of taxi 0, which leaves it: serialized taxi 1 would follow, jointly it stands by
+    state = env.step([all_action_names.index('east'), all_action_names.index('north')])[0]
+    assert state[0] == [[0, 1], [1, 0]]
+    assert env.collided.tolist() == [0, 0]
+    check_indexes(env)
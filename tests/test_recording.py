@@ -0,0 +1,56 @@
+import copy
+
+import numpy as np
+import pytest
+
+from multitaxienv.config import all_action_names
+from multitaxienv.recording import TrajectoryRecorder, TrajectoryReader
+from multitaxienv.taxi_environment import TaxiEnv
+
+# Little fuel and collisions, so that taxis stop acting during the episodes
+CONFIG = dict(num_taxis=3, num_passengers=3, max_fuel=[4, 6, 5], taxis_capacity=[2, 1, 1],
+              fuel_type_list=['F', 'G', 'F'], collision_sensitive_domain=True, option_to_stand_by=False)
+
+
+def state_values(env: TaxiEnv) -> list:
+    return env.state.tolist() if env.compact_state else copy.deepcopy(env.state)
+
+
+@pytest.mark.parametrize('compress', [True, False])
+@pytest.mark.parametrize('compact_state', [False, True])
+def test_reader_restores_the_recorded_transitions(tmp_path, compact_state, compress):
+    env = TaxiEnv(compact_state=compact_state, **CONFIG)
+    env.seed(0)
+    rng = np.random.default_rng(0)
+    transitions = []
+    with TrajectoryRecorder(env, str(tmp_path), chunk_size=64, compress=compress) as recorder:
+        for _ in range(10):
+            recorder.reset()
+            transitions.append((state_values(env), env.collided.tolist(), list(env.engine_status_list),
+                                None, None))
+            for _ in range(30):
+                actions = rng.integers(len(all_action_names), size=CONFIG['num_taxis']).tolist()
+                _, rewards, done, info = recorder.step(actions)
+                transitions.append((state_values(env), env.collided.tolist(),
+                                    list(env.engine_status_list), rewards, info['acting_taxis']))
+                if done:
+                    break
+
+    reader = TrajectoryReader(str(tmp_path))
+    assert len(reader) == len(transitions)
+    assert len(reader.meta['chunks']) > 1
+    assert sum(len(acting_taxis) < CONFIG['num_taxis'] for *_, acting_taxis in transitions if acting_taxis) > 0
+
+    restored = TaxiEnv(compact_state=compact_state, **CONFIG)
+    for index, (state, collided, engine_status, rewards, acting_taxis) in enumerate(transitions):
+        reader.restore(restored, index)
+        assert state_values(restored) == state
+        assert restored.collided.tolist() == collided
+        assert restored.engine_status_list == engine_status
+        taxis_rewards = reader[index]['rewards']
+        if rewards is None:
+            assert np.isnan(taxis_rewards).all()
+        else:
+            assert reader.rewards(index) == rewards
+            assert reader.acting_taxis(index) == acting_taxis
+            assert taxis_rewards[acting_taxis].tolist() == rewards
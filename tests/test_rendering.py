@@ -0,0 +1,116 @@
+import re
+
+import numpy as np
+import pytest
+from gym.utils.colorize import color2num
+
+from multitaxienv.config import all_action_names
+from multitaxienv.map_generator import generate_map
+from multitaxienv.rendering import RGB_COLORS, TAXIS_COLORS, COLLIDED_TAXI_COLOR, WALL_COLOR, LANE_COLOR
+from multitaxienv.taxi_environment import TaxiEnv
+
+HIGHLIGHT_COLORS = {str(number + 10): color for color, number in color2num.items()}
+ESCAPE = re.compile(r'\x1b\[([\d;]*)m')
+
+
+def ansi_map(env: TaxiEnv) -> list:
+    """
+    Parses the map of the 'ansi' render into rows of (character, escape sequences around it as tuples of codes).
+    """
+    rows = []
+    for line in env.render('ansi').split('\n')[:env.num_rows + 2]:
+        row, codes, position = [], [], 0
+        for match in ESCAPE.finditer(line + '\x1b[0m'):
+            row += [(char, tuple(codes)) for char in line[position:match.start()]]
+            codes = [] if match.group(1) == '0' else codes + [tuple(match.group(1).split(';'))]
+            position = match.end()
+        rows.append(row)
+    return rows
+
+
+def probe(renderer, inside: list, outside: list) -> tuple:
+    """
+    Returns: (y, x) of a pixel of a cell covered by the masks of the inside tiles and none of the outside tiles.
+
+    """
+    mask = np.logical_and.reduce([renderer.masks[tile] for tile in inside])
+    for tile in outside:
+        mask &= ~renderer.masks[tile]
+    return tuple(np.argwhere(mask)[0])
+
+
+def pixel(renderer, frame: np.array, row: int, col: int, offset: tuple) -> tuple:
+    size, separator = renderer.tile_size, renderer.separator_size
+    return tuple(frame[separator + row * size + offset[0], separator + col * (size + separator) + offset[1]])
+
+
+@pytest.mark.parametrize('tile_size', [16, 9])
+def test_rgb_frame_matches_ansi_layout(tile_size):
+    env = TaxiEnv(num_taxis=4, num_passengers=4, max_fuel=[np.inf] * 4, taxis_capacity=[2] * 4,
+                  fuel_type_list=['F'] * 4, collision_sensitive_domain=True, option_to_stand_by=False,
+                  render_tile_size=tile_size)
+    env.seed(0)
+    env.reset()
+    renderer = None
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        frame = env.render('rgb_array')
+        if renderer is None:
+            renderer = env.rgb_renderer
+            taxi, passenger = renderer.collided_taxi_tile, renderer.passenger_tile
+            on_board, destination = renderer.on_board_tile, renderer.destination_tile
+            taxi_probe = probe(renderer, [taxi], [passenger, on_board, destination])
+            center_probe = probe(renderer, [taxi, passenger, on_board], [destination])
+            frame_probe = probe(renderer, [destination], [taxi, passenger, on_board])
+
+        for row, line in enumerate(ansi_map(env)[1:-1]):
+            for col in range(env.num_columns):
+                char, codes = line[2 * col + 1]
+                taxis_colors = [HIGHLIGHT_COLORS[code[0]] for code in codes if code[0] in HIGHLIGHT_COLORS]
+                carrying = any(code[0] in HIGHLIGHT_COLORS and '1' in code for code in codes)
+                waiting = (str(color2num['blue']), '1') in codes
+                if taxis_colors:
+                    # The outer escape sequence is the taxi drawn last, gray for collided taxis
+                    colors = {RGB_COLORS[taxis_colors[0]]}
+                    if taxis_colors[0] == 'gray':
+                        colors.add(COLLIDED_TAXI_COLOR)
+                    assert pixel(renderer, frame, row, col, taxi_probe) in colors
+                    center = {RGB_COLORS['blue']} if carrying else colors
+                    assert pixel(renderer, frame, row, col, center_probe) in center
+                else:
+                    assert pixel(renderer, frame, row, col, taxi_probe) == tuple(renderer.background[
+                        renderer.separator_size + row * tile_size + taxi_probe[0],
+                        renderer.separator_size + col * (tile_size + renderer.separator_size) + taxi_probe[1]])
+                    assert (pixel(renderer, frame, row, col, center_probe) == RGB_COLORS['blue']) == waiting
+                assert (pixel(renderer, frame, row, col, frame_probe) == RGB_COLORS['magenta']) == \
+                    ((str(color2num['magenta']),) in codes)
+
+                # Walls and lanes between the columns
+                if col < env.num_columns - 1:
+                    x = renderer.separator_size + col * (tile_size + renderer.separator_size) + tile_size
+                    y = renderer.separator_size + row * tile_size + tile_size // 2
+                    expected = {'|': WALL_COLOR, ':': LANE_COLOR}[line[2 * col + 2][0]]
+                    assert tuple(frame[y, x]) == expected
+
+        _, _, done, _ = env.step(rng.integers(len(all_action_names), size=4).tolist())
+        if done:
+            env.reset()
+
+
+def test_rgb_renders_large_fleets():
+    num_taxis = 2 * len(TAXIS_COLORS) + 5
+    env = TaxiEnv(num_taxis=num_taxis, num_passengers=2, max_fuel=[np.inf] * num_taxis,
+                  taxis_capacity=[1] * num_taxis, fuel_type_list=['F'] * num_taxis,
+                  domain_map=generate_map(20, 20, wall_density=0, seed=0), collision_sensitive_domain=True)
+    env.seed(0)
+    env.reset()
+    env.collided[3] = 1
+
+    frame = env.render('rgb_array')
+    renderer = env.rgb_renderer
+    taxi_probe = probe(renderer, [renderer.collided_taxi_tile],
+                       [renderer.passenger_tile, renderer.on_board_tile, renderer.destination_tile])
+    for taxi, (row, col) in enumerate(env.state[0]):
+        expected = COLLIDED_TAXI_COLOR if taxi == 3 else RGB_COLORS[TAXIS_COLORS[taxi % len(TAXIS_COLORS)]]
+        assert pixel(renderer, frame, row, col, taxi_probe) == expected
+    assert len(env.render('ansi').split('\n')) > num_taxis
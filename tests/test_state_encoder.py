@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from multitaxienv.taxi_environment import TaxiEnv
+
+CONFIGS = [
+    dict(num_taxis=2, num_passengers=2, max_fuel=[6, np.inf], taxis_capacity=[1, 2], fuel_type_list=['F', 'G'],
+         collision_sensitive_domain=True),
+    dict(num_taxis=3, num_passengers=2, max_fuel=[5, 4, 7], taxis_capacity=[1, 1, 2],
+         fuel_type_list=['F', 'F', 'G'], collision_sensitive_domain=False),
+]
+
+
+def make_env(config: dict, option_to_stand_by: bool, compact_state: bool = False) -> TaxiEnv:
+    env = TaxiEnv(option_to_stand_by=option_to_stand_by, compact_state=compact_state, **config)
+    env.seed(0)
+    env.reset()
+    return env
+
+
+def state_values(env: TaxiEnv) -> tuple:
+    state = env.state.tolist() if env.compact_state else env.state
+    return ([[int(value) if np.isfinite(value) else value for value in component] if index == 1 else
+             np.asarray(component).tolist() for index, component in enumerate(state)],
+            [bool(status) for status in env.engine_status_list], [bool(flag) for flag in env.collided])
+
+
+@pytest.mark.parametrize('compact_state', [False, True])
+@pytest.mark.parametrize('option_to_stand_by', [False, True])
+@pytest.mark.parametrize('config', CONFIGS)
+def test_encode_decode_round_trip(config, option_to_stand_by, compact_state):
+    env = make_env(config, option_to_stand_by, compact_state)
+    rng = np.random.default_rng(0)
+    codes = set()  # Random available actions only reach states of the encoded domain
+    for step in range(1000):
+        s = env.encode()
+        assert 0 <= s < env.num_states
+        state, engine_status, collided = env.decode(s)
+        assert (state, [bool(status) for status in engine_status], collided) == state_values(env)
+        assert env.encode(state, engine_status, collided) == s
+        codes.add(s)
+
+        _, _, done, _ = env.step(rng.choice(env.available_actions_indexes, size=env.num_taxis).tolist())
+        if done or step % 50 == 49:  # Taxis that turned their engine off may stay for long
+            env.reset()
+    assert len(codes) > 100
+
+
+@pytest.mark.parametrize('option_to_stand_by', [False, True])
+@pytest.mark.parametrize('config', CONFIGS)
+def test_reset_state_encodes_to_zero(config, option_to_stand_by):
+    env = make_env(config, option_to_stand_by)
+    encoder = env.get_state_encoder()
+    for _ in range(10):
+        env.reset()
+        # Only the locations digits (taxis, passengers starts and destinations) of a reset are nonzero
+        taxis_cells = [row * env.num_columns + col for row, col in env.state[0]]
+        starts_cells = [row * env.num_columns + col for row, col in env.state[2]]
+        destinations = [encoder.pickup_locations.tolist().index(destination) for destination in env.state[3]]
+        num_taxis, num_passengers = env.num_taxis, env.num_passengers
+        locations_digits = np.concatenate([encoder.weights[:num_taxis],
+                                           encoder.weights[2 * num_taxis:2 * num_taxis + 2 * num_passengers]])
+        assert env.encode() == int(np.dot(taxis_cells + starts_cells + destinations, locations_digits))
+
+        # And with every taxi and passenger on the first cell, with the first pickup spot as destination
+        state = [[[0, 0]] * num_taxis, list(env.state[1]), [[0, 0]] * num_passengers,
+                 [encoder.pickup_locations[0].tolist()] * num_passengers, list(env.state[4])]
+        assert env.encode(state) == 0
+        assert env.decode(0) == (state, list(env.engine_status_list), [False] * num_taxis)